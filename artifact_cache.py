@@ -0,0 +1,242 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+
+from agents import Agent
+from my_secrets import Secrets
+from disk_cache import CACHE_DIR, text_key
+from document_store import Document, tokenize
+from guardrail_cache import instructions_version
+
+# Finished artifacts (summaries, flashcards, quizzes, definitions) kept on
+# local disk, so asking for the same thing on the same document again is
+# served without another generation. Keys cover the document text, the
+# agent and its instructions, the normalized request and the model.
+
+logger = logging.getLogger(__name__)
+
+secrets = Secrets()
+
+DB_PATH = os.getenv("STUDYBUDDY_ARTIFACT_CACHE_DB", str(CACHE_DIR / "artifacts.db"))
+MAX_BYTES = int(float(os.getenv("STUDYBUDDY_ARTIFACT_CACHE_MB", "256")) * 1024 * 1024)
+# cached artifacts are replayed through the stream in pieces of this size
+REPLAY_CHARS = 256
+
+CACHEABLE_AGENTS = frozenset({
+    "Text_Summarizer",
+    "Summary_Merger",  # the map-reduce summarization pipeline
+    "FlashCard_Generator_Agent",
+    "Quiz_Generator",
+    "Lookup_Definition_Agent",
+})
+
+# "/regenerate ..." or "regenerate: ..." asks for a fresh answer
+REGENERATE_RE = re.compile(r"^\s*(?:/regenerate\b|regenerate\s*:)\s*", re.IGNORECASE)
+# requests that only make sense relative to an earlier answer are never cached
+FOLLOW_UP_RE = re.compile(r"\b(more|another|again|different|new|other|else|instead)\b", re.IGNORECASE)
+
+DIFFICULTY_WORDS = {
+    "easy": "easy", "simple": "easy", "basic": "easy", "beginner": "easy",
+    "medium": "medium", "moderate": "medium", "intermediate": "medium",
+    "hard": "hard", "difficult": "hard", "challenging": "hard", "advanced": "hard",
+}
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "fifteen": 15, "twenty": 20, "thirty": 30, "fifty": 50,
+}
+COUNT_RE = re.compile(
+    r"\b(\d{1,3}|" + "|".join(NUMBER_WORDS) + r")\s+(?:[\w-]+\s+){0,2}"
+    r"(questions?|mcqs?|flash ?cards?|cards?|terms?|definitions?|items?|points?|bullets?|words?|sentences?|lines?)\b",
+    re.IGNORECASE,
+)
+QUESTION_TYPES = {
+    "mcq": re.compile(r"\b(mcqs?|multiple[- ]choice)\b", re.IGNORECASE),
+    "true_false": re.compile(r"\btrue[ /-]?(or[ /-]?)?false\b", re.IGNORECASE),
+    "short_answer": re.compile(r"\bshort[- ]answers?\b", re.IGNORECASE),
+}
+# words that pick the agent or pad the request; they do not change the artifact
+FILLER_WORDS = frozenset(
+    """me please can could would you i want need give make create generate write prepare produce some
+    quiz quizzes question questions mcq mcqs flashcard flashcards flash card cards summary summarize summarise
+    define definition definitions meaning lookup look up document file pdf upload uploaded about based
+    my our us do does on using""".split()
+)
+
+
+def split_regenerate(message: str) -> tuple[bool, str]:
+    "Whether the message asks to regenerate, and the request without the keyword"
+    match = REGENERATE_RE.match(message)
+    return (True, message[match.end():]) if match else (False, message)
+
+
+def request_params(request: str) -> dict:
+    "The parts of a request that decide what artifact it gets, in a canonical form"
+    words = [w for w in tokenize(request) if w not in FILLER_WORDS]
+    params: dict = {}
+    difficulty = {DIFFICULTY_WORDS[w] for w in words if w in DIFFICULTY_WORDS}
+    if len(difficulty) == 1:
+        params["difficulty"] = difficulty.pop()
+    count = COUNT_RE.search(request)
+    if count:
+        value = count.group(1).lower()
+        params["count"] = NUMBER_WORDS.get(value) or int(value)
+    types = sorted(name for name, pattern in QUESTION_TYPES.items() if pattern.search(request))
+    if types:
+        params["types"] = types
+    skip = set(DIFFICULTY_WORDS) | set(NUMBER_WORDS) | {"choice", "multiple", "true", "false", "short", "answer", "answers"}
+    if count:
+        skip.add(count.group(1).lower())
+    params["topic"] = sorted({w for w in words if w not in skip})
+    return params
+
+
+def artifact_key(
+    agent: Agent, documents: list[Document], request: str, session_documents: list[Document] | None = None
+) -> str | None:
+    "Cache key for the agent's answer to the request and documents (else the session's), None if not cacheable"
+    if agent.name not in CACHEABLE_AGENTS or FOLLOW_UP_RE.search(request):
+        return None
+    params = request_params(request)
+    if not params["topic"] and not documents:
+        # "define it" or "what does that mean" point into the conversation, which the key does not cover
+        return None
+    digests = ",".join(d.digest for d in documents or session_documents or [])
+    return text_key(agent.name, instructions_version(agent), secrets.gemini_api_model, digests, json.dumps(params, sort_keys=True))
+
+
+@dataclass
+class Artifact:
+    agent: str
+    content: str
+    tokens: int
+
+
+class ArtifactStats:
+    "Hit ratio and the tokens that hits did not spend on generation"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.tokens_saved = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self.bypassed += 1
+
+    def record(self, artifact: Artifact | None) -> None:
+        with self._lock:
+            if artifact is None:
+                self.misses += 1
+                return
+            self.hits += 1
+            self.tokens_saved += artifact.tokens
+        logger.info(
+            "Served %s answer from the artifact cache, saved ~%d tokens (hit ratio %.0f%%, %d tokens saved in total)",
+            artifact.agent, artifact.tokens, self.hit_ratio * 100, self.tokens_saved,
+        )
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_ratio": round(self.hit_ratio, 3),
+                "tokens_saved": self.tokens_saved,
+            }
+
+
+class ArtifactCache:
+    "Size-bounded LRU on a SQLite file; least recently served artifacts are evicted first"
+
+    def __init__(self, path: str = DB_PATH, max_bytes: int = MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.stats = ArtifactStats()
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS artifacts (
+                key TEXT PRIMARY KEY,
+                agent TEXT NOT NULL,
+                content TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS artifacts_used ON artifacts (used);
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _get(self, key: str) -> Artifact | None:
+        conn = self._conn()
+        row = conn.execute("SELECT agent, content, tokens FROM artifacts WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE artifacts SET used = ? WHERE key = ?", (time.time(), key))
+        return Artifact(*row)
+
+    def _put(self, key: str, artifact: Artifact) -> None:
+        conn = self._conn()
+        size = len(artifact.content.encode("utf-8"))
+        conn.execute(
+            "INSERT OR REPLACE INTO artifacts (key, agent, content, tokens, size, used) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, artifact.agent, artifact.content, artifact.tokens, size, time.time()),
+        )
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evict = []
+        for old_key, old_size in conn.execute("SELECT key, size FROM artifacts ORDER BY used"):
+            if total <= self.max_bytes:
+                break
+            evict.append((old_key,))
+            total -= old_size
+        conn.executemany("DELETE FROM artifacts WHERE key = ?", evict)
+
+    async def get(self, key: str) -> Artifact | None:
+        artifact = await asyncio.to_thread(self._get, key)
+        self.stats.record(artifact)
+        return artifact
+
+    async def put(self, key: str, agent: str, content: str, tokens: int) -> None:
+        if content.strip():
+            await asyncio.to_thread(self._put, key, Artifact(agent, content, tokens))
+
+
+async def replay(artifact: Artifact) -> AsyncIterator[str]:
+    "Streams a cached artifact as deltas, so it goes through the same path as a generated answer"
+    for start in range(0, len(artifact.content), REPLAY_CHARS):
+        yield artifact.content[start:start + REPLAY_CHARS]
+
+
+_cache: ArtifactCache | None = None
+
+
+def get_artifact_cache() -> ArtifactCache:
+    global _cache
+    if _cache is None:
+        _cache = ArtifactCache()
+    return _cache
@@ -0,0 +1,152 @@
+"""The LLM scheduler against a rate-limited stub: failures, retries and waits by lane.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_llm_scheduler [--turns 40] [--stub-rpm 100] [--stub-error-rate 0.05] [--rpm 0]
+
+Starts benchmarks/stub_llm.py with a requests-per-minute limit and random
+429s and fires simulated turns at it all at once. A turn is one streamed
+answer in the interactive lane and two structured guardrail calls in the
+guardrail lane. The same load runs once through the scheduler (as the app
+sends it) and once through a plain client with the SDK's own two retries.
+Per lane the number of failed calls and the p50/p95 latency are printed,
+together with the 429s the stub sent and the scheduler's queue waits.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_load import free_port, percentile  # noqa: E402
+
+GUARDRAIL_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "verdict",
+        "strict": True,
+        "schema": {"type": "object", "properties": {"flagged": {"type": "boolean"}}, "required": ["flagged"]},
+    },
+}
+
+
+def start_stub(port: int, args):
+    import subprocess
+
+    stub = subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.stub_llm", "--port", str(port),
+            "--latency-ms", str(args.latency_ms), "--tokens-per-second", "400", "--output-tokens", "40",
+            "--rpm", str(args.stub_rpm), "--error-rate", str(args.stub_error_rate),
+        ],
+        cwd=ROOT,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/stats", timeout=1)
+            return stub
+        except httpx.TransportError:
+            time.sleep(0.1)
+    stub.kill()
+    raise RuntimeError("the LLM stub did not start")
+
+
+async def run(args, base_url: str, scheduled: bool) -> dict:
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+    from llm_scheduler import LLMScheduler, llm_lane, scheduled_transport
+    from telemetry import metrics
+
+    if scheduled:
+        scheduler = LLMScheduler(concurrency=args.concurrency, requests_per_minute=args.rpm)
+        client = AsyncOpenAI(
+            api_key="bench", base_url=base_url, max_retries=0,
+            http_client=DefaultAsyncHttpxClient(transport=scheduled_transport(100, 20, scheduler)),
+        )
+    else:
+        client = AsyncOpenAI(api_key="bench", base_url=base_url)
+
+    latencies: dict[str, list[float]] = {"interactive": [], "guardrail": []}
+    failures = dict.fromkeys(latencies, 0)
+
+    async def answer():
+        started = time.perf_counter()
+        try:
+            stream = await client.chat.completions.create(
+                model="stub", stream=True, messages=[{"role": "user", "content": "Explain osmosis"}]
+            )
+            async for _ in stream:
+                pass
+            latencies["interactive"].append(time.perf_counter() - started)
+        except Exception:
+            failures["interactive"] += 1
+
+    async def guardrail():
+        started = time.perf_counter()
+        try:
+            with llm_lane("guardrail"):
+                await client.chat.completions.create(
+                    model="stub", response_format=GUARDRAIL_FORMAT, messages=[{"role": "user", "content": "Check this"}]
+                )
+            latencies["guardrail"].append(time.perf_counter() - started)
+        except Exception:
+            failures["guardrail"] += 1
+
+    async with httpx.AsyncClient() as http:
+        before = (await http.get(f"{base_url[:-3]}/stats")).json()
+        started = time.perf_counter()
+        await asyncio.gather(*(call() for _ in range(args.turns) for call in (answer, guardrail, guardrail)))
+        elapsed = time.perf_counter() - started
+        after = (await http.get(f"{base_url[:-3]}/stats")).json()
+    await client.close()
+
+    snapshot = metrics.snapshot()
+    return {
+        "seconds": elapsed,
+        "failures": failures,
+        "latencies": latencies,
+        "rate_limited": after.get("rate_limited", 0) - before.get("rate_limited", 0),
+        "waits": {h["labels"]["lane"]: h for h in snapshot["histograms"] if h["name"] == "studybuddy_llm_wait_ms"},
+    }
+
+
+def report(name: str, result: dict) -> None:
+    print(f"{name}: {result['seconds']:.1f}s, {result['rate_limited']} answers were 429")
+    for lane, values in result["latencies"].items():
+        print(
+            f"  {lane:<12} failed {result['failures'][lane]:>4}  "
+            f"p50 {percentile(values, 0.5) * 1000:8.0f} ms  p95 {percentile(values, 0.95) * 1000:8.0f} ms"
+        )
+    for lane, wait in result["waits"].items():
+        print(f"  queue wait {lane:<12} n {wait['count']:>4}  p50 <= {wait['p50']} ms  p95 <= {wait['p95']} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--stub-rpm", type=int, default=100, help="requests per minute the stub accepts")
+    parser.add_argument("--stub-error-rate", type=float, default=0.05, help="share of requests the stub answers 429 at random")
+    parser.add_argument("--rpm", type=float, default=0, help="the scheduler's own request budget, 0 for none")
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    # the stub's minute window is reset between the two runs by starting it again
+    for name, scheduled in (("plain client", False), ("scheduler", True)):
+        port = free_port()
+        stub = start_stub(port, args)
+        try:
+            report(name, asyncio.run(run(args, f"http://127.0.0.1:{port}/v1", scheduled)))
+        finally:
+            stub.terminate()
+            stub.wait()
+
+
+if __name__ == "__main__":
+    main()
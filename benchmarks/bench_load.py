@@ -0,0 +1,223 @@
+"""End-to-end load test of the on_message flow against a local LLM stub.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_load [--sessions 20] [--turns 4] [--latency-ms 300] [--tokens-per-second 80] [--out load.json]
+                                    [--stub-rpm 0] [--stub-error-rate 0]
+
+benchmarks/stub_llm.py is started as a subprocess and the app is pointed at
+it, so nothing leaves the machine. Every simulated session gets its own
+Chainlit HTTP context, runs on_chat_start and then sends its turns one
+after another: the first turn uploads a text document, later turns build
+on the history. Sessions run concurrently. Throughput, end-to-end latency,
+time to first token and LLM calls per turn are printed, and written as
+JSON with --out, together with the per-stage histograms from telemetry,
+so runs can be compared. --stub-rpm and --stub-error-rate make the stub
+answer 429s, to see the LLM scheduler's retries and waits under pressure.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TURNS = [
+    "Summarize the key points of these notes",
+    "Make 5 easy quiz questions on these notes",
+    "Explain how osmosis differs from diffusion",
+    "Define active transport",
+    "Create flashcards for the main terms",
+    "Which part should I study first?",
+]
+
+NOTES = (
+    "Chapter {n}: Cell transport. The cell membrane is a phospholipid bilayer with embedded proteins. "
+    "Diffusion moves particles from high to low concentration without energy. Osmosis is the diffusion "
+    "of water across a partially permeable membrane. Active transport uses ATP from respiration to move "
+    "substances against a concentration gradient, for example root hair cells taking up mineral ions. "
+)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered) + 0.5) - 1))]
+
+
+def summary(values: list[float]) -> dict:
+    return {f"p{int(q * 100)}": round(percentile(values, q) * 1000, 1) for q in (0.5, 0.95, 0.99)}
+
+
+def start_stub(port: int, args) -> subprocess.Popen:
+    stub = subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.stub_llm", "--port", str(port),
+            "--latency-ms", str(args.latency_ms),
+            "--tokens-per-second", str(args.tokens_per_second),
+            "--output-tokens", str(args.output_tokens),
+            "--rpm", str(args.stub_rpm),
+            "--error-rate", str(args.stub_error_rate),
+        ],
+        cwd=ROOT,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/stats", timeout=1)
+            return stub
+        except httpx.TransportError:
+            time.sleep(0.1)
+    stub.kill()
+    raise RuntimeError("the LLM stub did not start")
+
+
+async def run(args, port: int, workdir: str) -> dict:
+    # imported here, after the environment points the app at the stub and the temp dir
+    import chainlit as cl
+    from chainlit.context import init_http_context
+    from chainlit.emitter import BaseChainlitEmitter
+
+    import main as app
+    import telemetry
+    from session_store import get_session_store
+
+    class RecordingEmitter(BaseChainlitEmitter):
+        "Records when the answer starts streaming and whether an error was shown"
+
+        def __init__(self, session):
+            super().__init__(session)
+            self.first_token: float | None = None
+            self.errors = 0
+
+        async def stream_start(self, step_dict):
+            if self.first_token is None:
+                self.first_token = time.perf_counter()
+
+        async def send_step(self, step_dict):
+            if str(step_dict.get("output", "")).startswith("❌"):
+                self.errors += 1
+
+    documents = []
+    for n in range(args.documents):
+        path = os.path.join(workdir, f"notes-{n}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(NOTES.format(n=n + 1) * args.document_repeats)
+        documents.append(path)
+
+    latencies: list[float] = []
+    ttfts: list[float] = []
+    errors = 0
+
+    async def session(index: int) -> None:
+        nonlocal errors
+        context = init_http_context(thread_id=f"bench-{index}")
+        emitter = context.emitter = RecordingEmitter(context.session)
+        await app.start()
+        for turn in range(args.turns):
+            elements = []
+            if turn == 0:
+                path = documents[index % len(documents)]
+                elements = [cl.File(name=os.path.basename(path), path=path, mime="text/plain")]
+            message = cl.Message(content=TURNS[turn % len(TURNS)], author="User", type="user_message", elements=elements)
+            emitter.first_token = None
+            errors_before = emitter.errors
+            started = time.perf_counter()
+            await app.main(message)
+            latencies.append(time.perf_counter() - started)
+            if emitter.first_token is not None:
+                ttfts.append(emitter.first_token - started)
+            errors += emitter.errors - errors_before
+
+    stats_url = f"http://127.0.0.1:{port}/stats"
+    async with httpx.AsyncClient() as client:
+        calls_before = (await client.get(stats_url)).json()
+        started = time.perf_counter()
+        await asyncio.gather(*(session(i) for i in range(args.sessions)))
+        elapsed = time.perf_counter() - started
+        calls_after = (await client.get(stats_url)).json()
+    await get_session_store().flush()
+
+    turns = len(latencies)
+    calls = {kind: calls_after.get(kind, 0) - calls_before.get(kind, 0) for kind in calls_after}
+    return {
+        "config": vars(args),
+        "turns": turns,
+        "errors": errors,
+        "seconds": round(elapsed, 2),
+        "turns_per_second": round(turns / elapsed, 2),
+        "latency_ms": summary(latencies),
+        "ttft_ms": summary(ttfts),
+        "llm_calls_per_turn": round(sum(v for k, v in calls.items() if k != "rate_limited") / turns, 2) if turns else 0.0,
+        "llm_calls": calls,
+        "stages": telemetry.metrics.snapshot()["histograms"],
+        "llm_retries": {
+            c["labels"]["reason"]: c["value"] for c in telemetry.metrics.snapshot()["counters"] if c["name"] == "studybuddy_llm_retries_total"
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--tokens-per-second", type=float, default=80)
+    parser.add_argument("--output-tokens", type=int, default=200)
+    parser.add_argument("--documents", type=int, default=5, help="distinct uploads shared round-robin by the sessions")
+    parser.add_argument("--document-repeats", type=int, default=20, help="size of each upload in paragraphs")
+    parser.add_argument("--stub-rpm", type=int, default=0, help="requests per minute the stub accepts before answering 429")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0, help="share of requests the stub answers 429 at random")
+    parser.add_argument("--out", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    port = free_port()
+    stub = start_stub(port, args)
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            # fresh caches and stores for every run, so runs are comparable
+            os.environ.update({
+                "GEMINI_BASE_URL": f"http://127.0.0.1:{port}/v1",
+                "GEMINI_API_KEY": "bench",
+                "GEMINI_API_MODEL": "stub",
+                "STUDYBUDDY_CACHE_DIR": os.path.join(workdir, "cache"),
+                "STUDYBUDDY_STATE_DB": os.path.join(workdir, "session_state.db"),
+                "STUDYBUDDY_SESSION_DB": os.path.join(workdir, "sessions.db"),
+            })
+            results = asyncio.run(run(args, port, workdir))
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    print(
+        f"{args.sessions} sessions x {args.turns} turns: {results['turns']} turns in {results['seconds']}s "
+        f"-> {results['turns_per_second']} turns/s, {results['errors']} errors"
+    )
+    latency, ttft = results["latency_ms"], results["ttft_ms"]
+    print(f"latency ms  p50 {latency['p50']:8.1f}  p95 {latency['p95']:8.1f}  p99 {latency['p99']:8.1f}")
+    print(f"TTFT ms     p50 {ttft['p50']:8.1f}  p95 {ttft['p95']:8.1f}  p99 {ttft['p99']:8.1f}")
+    print(f"LLM calls per turn {results['llm_calls_per_turn']} {results['llm_calls']}")
+    if results["llm_retries"]:
+        print(f"LLM retries {results['llm_retries']}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
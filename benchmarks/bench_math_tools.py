@@ -0,0 +1,162 @@
+"""Tokens, latency and correctness of Math_Problem_Solver with and without the local math tools.
+
+Run from the repository root, against the configured model:
+
+    python -m benchmarks.bench_math_tools [--repeat 3] [--only tools|plain] [--out math.json]
+
+Every problem is sent straight to the Math_Problem_Solver agent, once as
+registered (with calculate, tabulate_function, describe_data and
+solve_symbolic) and once as a copy without those tools and without the
+instruction to use them. Per problem the median latency, the summed
+input/output tokens of all LLM requests of the run and whether every
+expected number appears in the answer are printed. The local engine is
+timed on its own as well; that part needs no model.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+NUMBER_RE = re.compile(r"-?\d[\d,]*(?:\.\d+)?(?:[eE][-+]?\d+)?")
+
+# prompt, numbers the answer has to contain, and the local computation that yields them
+PROBLEMS = [
+    ("What is 48271 * 3917 - 127^3 + 65536 / 256?", [48271 * 3917 - 127 ** 3 + 256], ["48271 * 3917 - 127^3 + 65536 / 256"]),
+    ("How many ways can a committee of 5 be chosen from 17 people?", [6188], ["comb(17, 5)"]),
+    ("I invest 2500 at 4.5% interest compounded annually. How much do I have after 12 years?", [4239.70], ["2500 * 1.045^12"]),
+    (
+        "Find the mean and the sample standard deviation of 12, 15, 17, 22, 9, 31, 14.",
+        [17.14, 7.34],
+        ["mean = (12 + 15 + 17 + 22 + 9 + 31 + 14) / 7"],
+    ),
+    ("Solve x^2 - 5x + 6 = 0.", [2, 3], ["(5 - sqrt(25 - 24)) / 2", "(5 + sqrt(25 - 24)) / 2"]),
+    ("Compute the definite integral of x^2 * sin(x) from 0 to pi.", [5.8696], ["pi^2 - 4"]),
+    (
+        "A train travels 342 km in 3 h 48 min, then 129 km in 1 h 27 min. What is its average speed in km/h?",
+        [89.71],
+        ["(342 + 129) / (3 + 48/60 + 1 + 27/60)"],
+    ),
+]
+
+
+def mentions(answer: str, expected: float) -> bool:
+    "Whether the answer states the number, to the precision it was given with"
+    decimals = len(str(expected).split(".")[1]) if isinstance(expected, float) else 0
+    for match in NUMBER_RE.findall(answer):
+        try:
+            value = float(match.replace(",", ""))
+        except ValueError:
+            continue
+        if abs(value - expected) <= 0.5 * 10 ** -decimals + 1e-9 * abs(expected):
+            return True
+    return False
+
+
+def bench_engine(repeat: int) -> dict:
+    from math_tools import calculate_lines, describe, tabulate
+
+    timings = {}
+    for prompt, _, expressions in PROBLEMS:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            calculate_lines(expressions)
+        timings[prompt[:40]] = round((time.perf_counter() - started) / repeat * 1e6, 1)
+    started = time.perf_counter()
+    describe([12, 15, 17, 22, 9, 31, 14])
+    timings["describe_data (7 values)"] = round((time.perf_counter() - started) * 1e6, 1)
+    tabulate("x", "x", 0, 1, 2)  # numpy is imported on first use
+    started = time.perf_counter()
+    tabulate("x^2 * sin(x)", "x", 0, 3.141592653589793, 100_000)
+    timings["tabulate_function (100k points)"] = round((time.perf_counter() - started) * 1e6, 1)
+    return timings
+
+
+async def run_problem(agent, prompt: str, expected: list[float]) -> dict:
+    from agents import Runner
+
+    started = time.perf_counter()
+    result = await Runner.run(agent, prompt, max_turns=12)
+    elapsed = time.perf_counter() - started
+    usage = result.context_wrapper.usage
+    answer = str(result.final_output)
+    return {
+        "ms": elapsed * 1000,
+        "requests": usage.requests,
+        "input_tokens": usage.input_tokens,
+        "output_tokens": usage.output_tokens,
+        "correct": all(mentions(answer, value) for value in expected),
+    }
+
+
+async def run(args) -> dict:
+    from registry import get_specialist
+
+    with_tools = get_specialist("Math_Problem_Solver")
+    tool_names = {"calculate", "tabulate_function", "describe_data", "solve_symbolic"}
+    plain = with_tools.clone(
+        tools=[tool for tool in with_tools.tools if tool.name not in tool_names],
+        instructions="\n".join(line for line in with_tools.instructions.splitlines() if "calculate tool" not in line),
+    )
+    agents = {"tools": with_tools, "plain": plain}
+    if args.only:
+        agents = {args.only: agents[args.only]}
+
+    results = {}
+    for mode, agent in agents.items():
+        rows = []
+        for prompt, expected, _ in PROBLEMS:
+            runs = [await run_problem(agent, prompt, expected) for _ in range(args.repeat)]
+            rows.append({
+                "problem": prompt,
+                "ms": round(statistics.median(r["ms"] for r in runs), 1),
+                "requests": statistics.median(r["requests"] for r in runs),
+                "input_tokens": statistics.median(r["input_tokens"] for r in runs),
+                "output_tokens": statistics.median(r["output_tokens"] for r in runs),
+                "correct": sum(r["correct"] for r in runs) / len(runs),
+            })
+        results[mode] = rows
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", choices=["tools", "plain"])
+    parser.add_argument("--engine-only", action="store_true", help="only time the local engine, no model calls")
+    parser.add_argument("--out", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    output = {"engine_us": bench_engine(1000)}
+    print("local engine, microseconds per problem:")
+    for name, us in output["engine_us"].items():
+        print(f"  {name:<42} {us:>10.1f}")
+
+    if not args.engine_only:
+        output["agents"] = asyncio.run(run(args))
+        print(f"\n{'mode':<6} {'problem':<42} {'ms':>8} {'calls':>5} {'in tok':>7} {'out tok':>7} {'correct':>7}")
+        for mode, rows in output["agents"].items():
+            for row in rows:
+                print(
+                    f"{mode:<6} {row['problem'][:42]:<42} {row['ms']:>8.0f} {row['requests']:>5g} "
+                    f"{row['input_tokens']:>7g} {row['output_tokens']:>7g} {row['correct']:>7.0%}"
+                )
+            total = sum(r["input_tokens"] + r["output_tokens"] for r in rows)
+            print(
+                f"{mode:<6} {'per problem':<42} {statistics.mean(r['ms'] for r in rows):>8.0f} "
+                f"{'':>5} {total / len(rows):>15.0f} {statistics.mean(r['correct'] for r in rows):>7.0%}"
+            )
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Input tokens, LLM calls and latency of the output guardrails: one combined call vs one call per check.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_output_guardrails [--turns 60] [--concurrency 8] [--latency-ms 300]
+
+Without --live, benchmarks/stub_llm.py stands in for the endpoint; its
+token counts are the prompt size in characters / 4, which is what the
+comparison is about. With --live the configured endpoint is used.
+Each simulated turn runs the three output guardrails on one answer, as
+the triage agent does, with the verdict cache empty. A third of the
+answers contain contact details and a third mention AI models, so the
+local pre-screen escalates those checks to the LLM as well. The same
+answers go once through the separate guardrail agents and once through
+the combined one.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_load import NOTES, free_port, percentile, start_stub  # noqa: E402
+
+EXTRAS = [
+    "",
+    " For questions about the lab, write to the teaching assistant at jordan.lee{n}@university.edu.",
+    " Large language model tools can quiz you on this chapter, but check answers against the textbook.",
+]
+
+
+def answers(turns: int, mode: str) -> list[str]:
+    # unique per turn and mode, so no verdict comes from the cache
+    return [f"Answer {n} ({mode}). " + NOTES.format(n=n) + EXTRAS[n % len(EXTRAS)].format(n=n) for n in range(turns)]
+
+
+async def run(args, mode: str) -> dict:
+    from agents import Agent, RunContextWrapper
+
+    import output_guardrails
+    from registry import StudyContext, get_client
+    from telemetry import metrics
+
+    get_client()
+    output_guardrails.COMBINED_GUARDRAILS = mode == "combined"
+    agent = Agent(name="Bench")
+    limit = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def turn(text: str) -> None:
+        ctx = RunContextWrapper(context=StudyContext())
+        async with limit:
+            started = time.perf_counter()
+            await asyncio.gather(*(g.run(ctx, agent, text) for g in output_guardrails.OUTPUT_GUARDRAILS))
+            latencies.append(time.perf_counter() - started)
+
+    def counters() -> tuple[float, float]:
+        snapshot = metrics.snapshot()
+        tokens = sum(c["value"] for c in snapshot["counters"] if c["name"] == "studybuddy_tokens_total" and c["labels"]["kind"] == "input")
+        calls = sum(h["count"] for h in snapshot["histograms"] if h["name"] == "studybuddy_call_tokens")
+        return tokens, calls
+
+    tokens_before, calls_before = counters()
+    await asyncio.gather(*(turn(text) for text in answers(args.turns, mode)))
+    tokens_after, calls_after = counters()
+    return {
+        "calls": calls_after - calls_before,
+        "input_tokens": tokens_after - tokens_before,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "mean_ms": statistics.mean(latencies) * 1000,
+    }
+
+
+async def compare(args) -> dict:
+    return {mode: await run(args, mode) for mode in ("separate", "combined")}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--live", action="store_true", help="use the configured endpoint instead of the stub")
+    args = parser.parse_args()
+
+    stub = None
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ["STUDYBUDDY_CACHE_DIR"] = os.path.join(workdir, "cache")
+        if not args.live:
+            port = free_port()
+            stub = start_stub(port, argparse.Namespace(
+                latency_ms=args.latency_ms, tokens_per_second=80, output_tokens=50, stub_rpm=0, stub_error_rate=0.0,
+            ))
+            os.environ.update({"GEMINI_BASE_URL": f"http://127.0.0.1:{port}/v1", "GEMINI_API_KEY": "bench", "GEMINI_API_MODEL": "stub"})
+        try:
+            print(f"{args.turns} answers, {args.concurrency} at a time")
+            print(f"{'mode':<10} {'LLM calls':>9} {'input tokens':>12} {'per turn':>8} {'p50 ms':>8} {'p95 ms':>8}")
+            # one event loop for both, the client's pooled connections belong to it
+            results = asyncio.run(compare(args))
+            for mode, result in results.items():
+                print(
+                    f"{mode:<10} {result['calls']:>9g} {result['input_tokens']:>12,.0f} {result['input_tokens'] / args.turns:>8.0f} "
+                    f"{result['p50_ms']:>8.0f} {result['p95_ms']:>8.0f}"
+                )
+        finally:
+            if stub is not None:
+                stub.terminate()
+                stub.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Compares the old PyPDF2 extraction path with pdf_extractor on a large PDF.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_pdf_extraction [path/to/file.pdf] [--pages 300]
+
+Without a path a synthetic textbook-sized PDF is generated first.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pdf_extractor
+
+
+def make_pdf(path: str, pages: int) -> None:
+    import pymupdf
+
+    paragraph = (
+        "Photosynthesis converts light energy into chemical energy stored in glucose. "
+        "The light-dependent reactions take place in the thylakoid membranes. "
+    ) * 6
+    doc = pymupdf.open()
+    for number in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(pymupdf.Rect(50, 50, 550, 800), f"Chapter {number}\n\n{paragraph}\n\n{paragraph}", fontsize=9)
+    doc.save(path)
+
+
+def pypdf2_extract(path: str) -> str:
+    # the previous code path from main(), including the double extract_text() per page
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    return "\n".join([page.extract_text() for page in reader.pages if page.extract_text()])
+
+
+async def engine_extract(path: str) -> tuple[str, float]:
+    started = time.perf_counter()
+    first_page = None
+    pages = []
+    async for _, text in pdf_extractor.iter_pdf_pages(path):
+        if first_page is None:
+            first_page = time.perf_counter() - started
+        pages.append(text)
+    return "\n".join(p for p in pages if p.strip()), first_page or 0.0
+
+
+async def event_loop_stall(coro) -> tuple[object, float]:
+    "Runs coro while measuring the longest gap between 10 ms ticks of the event loop"
+    worst = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal worst
+        last = time.perf_counter()
+        while not done:
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            worst = max(worst, now - last - 0.01)
+            last = now
+
+    tick = asyncio.create_task(ticker())
+    result = await coro
+    done = True
+    await tick
+    return result, worst
+
+
+async def run(path: str) -> None:
+    # the old path runs inline on the event loop, so the loop is blocked for all of it
+    started = time.perf_counter()
+    text = pypdf2_extract(path)
+    elapsed = time.perf_counter() - started
+    print(f"{'PyPDF2 (inline):':22} {elapsed * 1000:8.1f} ms  chars={len(text):,}  loop blocked {elapsed * 1000:.1f} ms")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        pdf_extractor.CACHE_DIR = pdf_extractor.Path(cache_dir)
+        for label in ("PyMuPDF pool (cold):", "PyMuPDF (cached):"):
+            started = time.perf_counter()
+            (text, first_page), stall = await event_loop_stall(engine_extract(path))
+            elapsed = time.perf_counter() - started
+            print(
+                f"{label:22} {elapsed * 1000:8.1f} ms  chars={len(text):,}  "
+                f"first page {first_page * 1000:.1f} ms  loop blocked {stall * 1000:.1f} ms"
+            )
+    if pdf_extractor._pool is not None:
+        pdf_extractor._pool.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", nargs="?")
+    parser.add_argument("--pages", type=int, default=300)
+    args = parser.parse_args()
+
+    if args.path:
+        asyncio.run(run(args.path))
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "textbook.pdf")
+        make_pdf(path, args.pages)
+        print(f"Generated {args.pages}-page PDF ({os.path.getsize(path) / 1024:.0f} KiB)")
+        asyncio.run(run(path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Speed and correctness of the local study scheduler on semester-sized plans.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_scheduler [--repeat 20] [--weeks 16] [--subjects 8]
+
+Builds a plan with a weekly lecture timetable, a few blocked days and one
+deadline per subject, reports the median time of build_schedule and of
+formatting the result, and checks every session: inside the availability,
+outside busy blocks and rest days, no overlaps, at most the daily limit,
+before its subject's deadline. Subjects that do not fully fit (the plan
+asks for more hours than there are free slots) are listed, not failed.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from study_scheduler import StudySubject, TimeWindow, build_schedule, format_schedule  # noqa: E402
+
+START = date(2026, 2, 2)
+AVAILABILITY = [
+    TimeWindow(day="weekdays", start="08:00", end="21:00"),
+    TimeWindow(day="saturday", start="10:00", end="16:00"),
+]
+LECTURES = [
+    ("monday", "09:00", "11:00"), ("monday", "14:00", "16:00"), ("tuesday", "10:00", "12:30"),
+    ("tuesday", "15:00", "17:00"), ("wednesday", "08:00", "10:00"), ("wednesday", "13:00", "15:30"),
+    ("thursday", "09:00", "12:00"), ("thursday", "16:00", "18:00"), ("friday", "10:00", "12:00"),
+]
+
+
+def semester(weeks: int, subjects: int):
+    end = START + timedelta(weeks=weeks)
+    plan = [
+        # deadlines spread over the second half of the semester
+        StudySubject(name=f"Subject {n + 1}", hours=12 + 4 * (n % 4), deadline=(end - timedelta(days=3 * n)).isoformat())
+        for n in range(subjects)
+    ]
+    busy = [TimeWindow(day=day, start=start, end=end, label="Lecture") for day, start, end in LECTURES]
+    busy += [TimeWindow(day=(START + timedelta(weeks=w, days=4)).isoformat(), start="00:00", end="24:00") for w in range(0, weeks, 5)]
+    return plan, busy
+
+
+def check(schedule, plan, busy, max_per_day: int) -> tuple[list[str], list[str]]:
+    from study_scheduler import _free, _intervals
+
+    problems = []
+    availability, blocked = _intervals(AVAILABILITY), _intervals(busy)
+    by_day: dict[date, list] = {}
+    for session in schedule.sessions:
+        by_day.setdefault(session.day, []).append(session)
+        if session.day.weekday() == 6:
+            problems.append(f"{session} is on a rest day")
+        if not any(start <= session.start and session.end <= end for start, end in _free(session.day, availability, blocked)):
+            problems.append(f"{session} is outside the free time")
+        if session.day >= schedule.deadlines[session.subject]:
+            problems.append(f"{session} is after its deadline")
+    for day, sessions in by_day.items():
+        sessions.sort(key=lambda s: s.start)
+        if len(sessions) > max_per_day:
+            problems.append(f"{day} has {len(sessions)} sessions")
+        problems += [f"{a} overlaps {b}" for a, b in zip(sessions, sessions[1:]) if b.start < a.end]
+    short = []
+    for subject in plan:
+        count = sum(s.subject == subject.name for s in schedule.sessions)
+        if count != schedule.needed[subject.name]:
+            short.append(f"{subject.name} has {count} of {schedule.needed[subject.name]} sessions")
+    return problems, short
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--weeks", type=int, default=16)
+    parser.add_argument("--subjects", type=int, default=8)
+    parser.add_argument("--session-minutes", type=int, default=45)
+    parser.add_argument("--max-hours-per-day", type=float, default=4)
+    args = parser.parse_args()
+
+    plan, busy = semester(args.weeks, args.subjects)
+    build, render = [], []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        schedule = build_schedule(
+            plan, AVAILABILITY, busy, START.isoformat(),
+            session_minutes=args.session_minutes, max_hours_per_day=args.max_hours_per_day,
+        )
+        build.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        text = format_schedule(schedule)
+        render.append(time.perf_counter() - started)
+
+    problems, short = check(schedule, plan, busy, int(args.max_hours_per_day * 60 // args.session_minutes))
+    print(
+        f"{args.subjects} subjects over {args.weeks} weeks: {len(schedule.sessions)} sessions, "
+        f"{schedule.free_slots} free slots, {len(text):,} characters of output"
+    )
+    print(f"build_schedule  median {statistics.median(build) * 1000:7.2f} ms")
+    print(f"format_schedule median {statistics.median(render) * 1000:7.2f} ms")
+    for line in short:
+        print(f"does not fit: {line}")
+    print(f"{len(problems)} constraint violations")
+    for problem in problems[:10]:
+        print(f"  {problem}")
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
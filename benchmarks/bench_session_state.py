@@ -0,0 +1,87 @@
+"""Multi-process throughput of the session state backend.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_session_state [--workers 4] [--conversations 200] [--turns 10]
+
+Every worker process plays an app worker behind a load balancer: turns of
+the same conversation land on random workers, each turn loads the state,
+appends a user and an assistant item and saves it with the optimistic
+version check, retrying on conflicts. At the end every conversation must
+contain all of its turns, i.e. no update was lost between processes.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_state import SessionState, SQLiteStateBackend
+
+ANSWER = "Mitochondria are the powerhouse of the cell. " * 10
+
+
+async def play(path: str, jobs: list[tuple[str, int]]) -> tuple[int, int]:
+    backend = SQLiteStateBackend(path)
+    conflicts = 0
+    for conversation, turn in jobs:
+        while True:
+            state = await backend.load(conversation) or SessionState()
+            items = state.history.setdefault("items", [])
+            items.append({"role": "user", "content": f"turn {turn}"})
+            items.append({"role": "assistant", "content": ANSWER})
+            if await backend.save(conversation, state):
+                break
+            conflicts += 1
+    return len(jobs), conflicts
+
+
+def worker(path: str, jobs: list[tuple[str, int]], results) -> None:
+    results.put(asyncio.run(play(path, jobs)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=10)
+    args = parser.parse_args()
+
+    jobs = [(f"conversation-{c}", t) for t in range(args.turns) for c in range(args.conversations)]
+    shards: list[list[tuple[str, int]]] = [[] for _ in range(args.workers)]
+    for job in jobs:
+        # the load balancer is not sticky: any worker can get any turn
+        random.choice(shards).append(job)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "session_state.db")
+        SQLiteStateBackend(path)
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=worker, args=(path, shard, results)) for shard in shards]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        turns = sum(done for done, _ in outcomes)
+        conflicts = sum(c for _, c in outcomes)
+        print(f"{args.workers} processes, {turns:,} turns in {elapsed:.2f}s -> {turns / elapsed:,.0f} turns/s ({conflicts} conflicts retried)")
+
+        backend = SQLiteStateBackend(path)
+        lost = 0
+        for c in range(args.conversations):
+            state = asyncio.run(backend.load(f"conversation-{c}"))
+            lost += args.turns * 2 - len(state.history["items"])
+        print("all turns stored" if lost == 0 else f"{lost} items lost")
+
+
+if __name__ == "__main__":
+    main()
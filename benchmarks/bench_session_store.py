@@ -0,0 +1,90 @@
+"""Write throughput of session_store with hundreds of concurrent sessions.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_session_store [--sessions 500] [--turns 20]
+
+Each simulated session syncs its history after every turn and all sessions
+end at roughly the same time. For comparison the same load is written the
+way the old end() did it, one blocking json.dump per ending session.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_store import SessionStore
+
+ANSWER = "Photosynthesis converts light energy into chemical energy. " * 20
+
+
+async def simulate(store: SessionStore, session_id: str, turns: int) -> float:
+    "Returns the longest time one sync() call held the event loop"
+    history = []
+    worst = 0.0
+    for turn in range(turns):
+        history.append({"role": "user", "content": f"question {turn} from {session_id}"})
+        history.append({"role": "assistant", "content": ANSWER})
+        started = time.perf_counter()
+        store.sync(session_id, history)
+        worst = max(worst, time.perf_counter() - started)
+        await asyncio.sleep(random.random() * 0.001)
+    store.end(session_id, history)
+    return worst
+
+
+async def bench_store(path: str, sessions: int, turns: int) -> None:
+    store = SessionStore(path)
+    started = time.perf_counter()
+    stalls = await asyncio.gather(*(simulate(store, f"session-{i}", turns) for i in range(sessions)))
+    queued = time.perf_counter() - started
+    await store.flush()
+    elapsed = time.perf_counter() - started
+    items = sessions * turns * 2
+    print(f"SQLite WAL, batched writer: {items:,} items in {elapsed:.2f}s -> {items / elapsed:,.0f} items/s")
+    print(f"  time to queue: {queued:.2f}s, longest sync() on the event loop: {max(stalls) * 1000:.2f} ms")
+
+    started = time.perf_counter()
+    loaded = await store.load(f"session-{sessions // 2}")
+    print(f"  load one session ({len(loaded)} items): {(time.perf_counter() - started) * 1000:.2f} ms")
+
+
+def bench_json(directory: str, sessions: int, turns: int) -> None:
+    # the old end(): every session dumps its full history over one shared file
+    history = []
+    for turn in range(turns):
+        history.append({"role": "user", "content": f"question {turn}"})
+        history.append({"role": "assistant", "content": ANSWER})
+    path = os.path.join(directory, "history.json")
+    started = time.perf_counter()
+    worst = 0.0
+    for _ in range(sessions):
+        dump_started = time.perf_counter()
+        with open(path, "w") as f:
+            json.dump(history, f, indent=4)
+        worst = max(worst, time.perf_counter() - dump_started)
+    elapsed = time.perf_counter() - started
+    items = sessions * turns * 2
+    print(f"history.json dump per session: {items:,} items in {elapsed:.2f}s -> {items / elapsed:,.0f} items/s")
+    print(f"  each dump blocks the event loop for up to {worst * 1000:.2f} ms and only the last session survives")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(bench_store(os.path.join(tmp, "sessions.db"), args.sessions, args.turns))
+        bench_json(tmp, args.sessions, args.turns)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Cold-import time and memory of the app's entry modules.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_startup [--repeat 5] [--save startup.json] [--compare startup.json]
+
+Each module is imported in a fresh interpreter, like a Chainlit worker at
+boot, and the median import time and resident memory over the runs are
+reported next to the bare framework (chainlit and agents). The run fails
+when an app module loads a heavy document library the framework does not
+already load, or, with --compare, when time or memory grew beyond
+--tolerance of a saved baseline.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["main", "input_guardrails", "output_guardrails"]
+FRAMEWORK = "chainlit, agents"
+# only needed once a file of that type is uploaded
+HEAVY_MODULES = ["fitz", "pymupdf", "docx", "pandas", "numpy", "PyPDF2", "sympy"]
+
+PROBE = """
+import json, sys, time
+def rss_kb():
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+before = rss_kb()
+started = time.perf_counter()
+for name in {module!r}.split(", "):
+    if name:
+        __import__(name)
+elapsed = time.perf_counter() - started
+print(json.dumps({{"ms": elapsed * 1000, "rss_kb": rss_kb(), "import_rss_kb": rss_kb() - before,
+                  "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def probe(module: str) -> dict:
+    env = dict(os.environ)
+    # importing the app only needs the settings to exist, nothing is contacted
+    env.setdefault("GEMINI_API_KEY", "bench")
+    env.setdefault("GEMINI_API_MODEL", "bench")
+    env.setdefault("GEMINI_BASE_URL", "http://localhost:1/v1")
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def measure(module: str, repeat: int) -> dict:
+    probe(module)  # warm the bytecode and OS file caches so runs are comparable
+    runs = [probe(module) for _ in range(repeat)]
+    return {
+        "ms": round(statistics.median(r["ms"] for r in runs), 1),
+        "rss_mb": round(statistics.median(r["rss_kb"] for r in runs) / 1024, 1),
+        "import_rss_mb": round(statistics.median(r["import_rss_kb"] for r in runs) / 1024, 1),
+        "heavy": runs[-1]["heavy"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON written by an earlier --save")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed growth over the baseline")
+    args = parser.parse_args()
+
+    interpreter = measure("", args.repeat)
+    framework = measure(FRAMEWORK, args.repeat)
+    print(f"{'python':18} {'':>9}  RSS {interpreter['rss_mb']:6.1f} MB")
+    print(f"{FRAMEWORK:18} {framework['ms']:7.1f} ms  RSS {framework['rss_mb']:6.1f} MB")
+    results = {}
+    failed = False
+    for module in MODULES:
+        result = results[module] = measure(module, args.repeat)
+        print(
+            f"{module:18} {result['ms']:7.1f} ms  RSS {result['rss_mb']:6.1f} MB "
+            f"(+{result['import_rss_mb']:.1f} MB by the import)"
+        )
+        heavy = [m for m in result["heavy"] if m not in framework["heavy"]]
+        if heavy:
+            print(f"  loads document libraries at import: {', '.join(heavy)}")
+            failed = True
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        for module, result in results.items():
+            if module not in baseline:
+                continue
+            for metric in ("ms", "rss_mb"):
+                limit = baseline[module][metric] * (1 + args.tolerance)
+                if result[metric] > limit:
+                    print(f"  {module} {metric} regressed: {result[metric]} > {baseline[module][metric]} +{args.tolerance:.0%}")
+                    failed = True
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
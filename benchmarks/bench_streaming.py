@@ -0,0 +1,93 @@
+"""Websocket emits and CPU per response with and without delta coalescing.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_streaming [--sessions 200] [--tokens 400] [--flush-ms 30] [--flush-chars 256]
+
+Every simulated session streams one response of small deltas at a model-like
+rate. Each emit is serialized the way an emit to the websocket would be, so
+the CPU time reflects per-emit overhead on the app server.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streaming import StreamBuffer
+
+WORDS = "the cell membrane controls what enters and leaves the cell through diffusion osmosis and active transport".split()
+
+
+async def model_deltas(tokens: int, tokens_per_second: float):
+    for _ in range(tokens):
+        await asyncio.sleep(random.expovariate(tokens_per_second))
+        yield random.choice(WORDS) + " "
+
+
+emit_cpu = 0.0
+
+
+async def session(tokens: int, tps: float, flush_ms: float, flush_chars: int) -> tuple[int, float]:
+    content = ""
+    started = time.perf_counter()
+    first_token = None
+
+    async def emit(text: str) -> None:
+        global emit_cpu
+        nonlocal content, first_token
+        cpu = time.process_time()
+        if first_token is None:
+            first_token = time.perf_counter() - started
+        content += text
+        # what an emit costs: a socket.io event packet, serialized and encoded for the websocket
+        packet = "42" + json.dumps(["stream_token", {"id": "msg", "token": text, "isSequence": False, "isInput": False}])
+        packet.encode("utf-8")
+        emit_cpu += time.process_time() - cpu
+        await asyncio.sleep(0)
+
+    stream = StreamBuffer(emit, flush_ms, flush_chars)
+    async for delta in model_deltas(tokens, tps):
+        await stream.push(delta)
+    await stream.close()
+    return stream.emits, first_token or 0.0
+
+
+async def run(sessions: int, tokens: int, tps: float, flush_ms: float, flush_chars: int) -> None:
+    global emit_cpu
+    emit_cpu = 0.0
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    results = await asyncio.gather(*(session(tokens, tps, flush_ms, flush_chars) for _ in range(sessions)))
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+    emits = sum(e for e, _ in results)
+    ttft = sorted(t for _, t in results)[len(results) // 2]
+    label = "per delta" if flush_ms <= 0 else f"{flush_ms:.0f} ms / {flush_chars} chars"
+    print(
+        f"{label:18} emits/response {emits / sessions:7.1f}  total emits {emits:8,}  "
+        f"CPU {cpu:5.2f}s (emit path {emit_cpu:5.2f}s) over {wall:5.2f}s wall  median TTFT {ttft * 1000:5.1f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--tokens", type=int, default=400)
+    parser.add_argument("--tokens-per-second", type=float, default=80)
+    parser.add_argument("--flush-ms", type=float, default=30)
+    parser.add_argument("--flush-chars", type=int, default=256)
+    args = parser.parse_args()
+
+    random.seed(0)
+    asyncio.run(run(args.sessions, args.tokens, args.tokens_per_second, 0, 0))
+    random.seed(0)
+    asyncio.run(run(args.sessions, args.tokens, args.tokens_per_second, args.flush_ms, args.flush_chars))
+
+
+if __name__ == "__main__":
+    main()
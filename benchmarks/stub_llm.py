@@ -0,0 +1,234 @@
+"""Local stand-in for the chat-completions endpoint, for offline benchmarks.
+
+Run from the repository root:
+
+    python -m benchmarks.stub_llm [--port 8765] [--latency-ms 300] [--tokens-per-second 80] [--output-tokens 200]
+                                  [--rpm 0] [--error-rate 0]
+
+Point the app at it with GEMINI_BASE_URL=http://127.0.0.1:8765/v1. Requests
+with a json_schema response format (the guardrail agents) get a minimal
+valid object with every flag false, so no guardrail trips. The triage
+agent hands off when one of its transfer_to_* tools names a word of the
+user message. Every other request gets filler text, streamed or not.
+With --rpm, requests beyond that many in the last minute get a 429 with a
+Retry-After header, like a rate-limited endpoint; --error-rate answers
+that share of the remaining requests with a 429 at random. GET /stats
+returns the number of calls by kind, rejected ones as "rate_limited".
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import deque
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+WORDS = (
+    "the cell membrane controls what enters and leaves the cell through diffusion osmosis and active "
+    "transport while mitochondria release energy from glucose during respiration"
+).split()
+
+
+class StubSettings:
+    def __init__(
+        self,
+        latency_ms: float = 300,
+        tokens_per_second: float = 80,
+        output_tokens: int = 200,
+        seed: int = 0,
+        rpm: int = 0,
+        error_rate: float = 0.0,
+    ):
+        self.latency = latency_ms / 1000
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.random = random.Random(seed)
+        self.rpm = rpm
+        self.error_rate = error_rate
+        self.accepted: deque[float] = deque()
+        self.calls: dict[str, int] = {}
+
+    def count(self, kind: str) -> None:
+        self.calls[kind] = self.calls.get(kind, 0) + 1
+
+    def retry_after(self) -> float | None:
+        "Seconds the client should wait when this request is rate limited, None when it is accepted"
+        now = time.monotonic()
+        while self.accepted and self.accepted[0] <= now - 60:
+            self.accepted.popleft()
+        if self.rpm and len(self.accepted) >= self.rpm:
+            return self.accepted[0] + 60 - now
+        if self.error_rate and self.random.random() < self.error_rate:
+            return 0.2
+        self.accepted.append(now)
+        return None
+
+
+def schema_example(schema: dict, defs: dict | None = None):
+    "Smallest value matching a JSON schema, with booleans false"
+    defs = defs if defs is not None else schema.get("$defs", {})
+    if "$ref" in schema:
+        return schema_example(defs[schema["$ref"].split("/")[-1]], defs)
+    if "anyOf" in schema:
+        return schema_example(schema["anyOf"][0], defs)
+    kind = schema.get("type")
+    if isinstance(kind, list):
+        kind = kind[0]
+    if kind == "object":
+        return {name: schema_example(prop, defs) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        return []
+    if kind == "boolean":
+        return False
+    if kind in ("integer", "number"):
+        return 0
+    if kind == "null":
+        return None
+    if "enum" in schema:
+        return schema["enum"][0]
+    return "stub"
+
+
+def prompt_tokens(body: dict) -> int:
+    return max(1, len(json.dumps(body.get("messages", []))) // 4)
+
+
+def last_user_text(messages: list[dict]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            content = message.get("content")
+            if isinstance(content, list):
+                content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+            return str(content or "")
+    return ""
+
+
+def pick_handoff(body: dict) -> str | None:
+    "A transfer_to_* tool whose agent name shares a word with the user message, on the first step of a run"
+    messages = body.get("messages", [])
+    if any(m.get("role") == "tool" for m in messages[-2:]):
+        return None
+    words = {w.strip(".,!?").lower() for w in last_user_text(messages).split()}
+    for tool in body.get("tools") or []:
+        name = tool.get("function", {}).get("name", "")
+        if name.startswith("transfer_to_") and words & set(name[len("transfer_to_"):].lower().split("_")):
+            return name
+    return None
+
+
+def completion(body: dict, message: dict, finish_reason: str, completion_tokens: int) -> dict:
+    prompt = prompt_tokens(body)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": {"prompt_tokens": prompt, "completion_tokens": completion_tokens, "total_tokens": prompt + completion_tokens},
+    }
+
+
+def chunk(body: dict, id: str, delta: dict, finish_reason: str | None = None, usage: dict | None = None) -> str:
+    payload = {
+        "id": id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    if usage:
+        payload["usage"] = usage
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+def create_app(settings: StubSettings) -> Starlette:
+    async def chat_completions(request: Request):
+        body = await request.json()
+        retry_after = settings.retry_after()
+        if retry_after is not None:
+            settings.count("rate_limited")
+            return JSONResponse(
+                {"error": {"message": "Resource has been exhausted", "type": "rate_limit_error", "code": 429}},
+                status_code=429,
+                headers={"Retry-After": f"{retry_after:.2f}"},
+            )
+        await asyncio.sleep(settings.latency)
+
+        response_format = body.get("response_format") or {}
+        handoff = pick_handoff(body)
+        if response_format.get("type") == "json_schema":
+            settings.count("structured")
+            schema = response_format["json_schema"].get("schema", {})
+            content = json.dumps(schema_example(schema))
+            return JSONResponse(completion(body, {"role": "assistant", "content": content}, "stop", len(content) // 4))
+        if handoff:
+            settings.count("handoff")
+            call = {"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function", "function": {"name": handoff, "arguments": "{}"}}
+            if not body.get("stream"):
+                return JSONResponse(completion(body, {"role": "assistant", "content": None, "tool_calls": [call]}, "tool_calls", 10))
+            id = f"chatcmpl-{uuid.uuid4().hex}"
+
+            async def tool_events():
+                yield chunk(body, id, {"role": "assistant", "tool_calls": [{"index": 0, **call}]})
+                yield chunk(body, id, {}, "tool_calls")
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(tool_events(), media_type="text/event-stream")
+
+        tokens = [settings.random.choice(WORDS) + " " for _ in range(settings.output_tokens)]
+        if not body.get("stream"):
+            settings.count("text")
+            await asyncio.sleep(len(tokens) / settings.tokens_per_second)
+            return JSONResponse(completion(body, {"role": "assistant", "content": "".join(tokens)}, "stop", len(tokens)))
+
+        settings.count("stream")
+        id = f"chatcmpl-{uuid.uuid4().hex}"
+        include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+        async def events():
+            yield chunk(body, id, {"role": "assistant", "content": ""})
+            for token in tokens:
+                yield chunk(body, id, {"content": token})
+                await asyncio.sleep(1 / settings.tokens_per_second)
+            yield chunk(body, id, {}, "stop")
+            if include_usage:
+                prompt = prompt_tokens(body)
+                yield chunk(body, id, {}, usage={"prompt_tokens": prompt, "completion_tokens": len(tokens), "total_tokens": prompt + len(tokens)})
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def stats(request: Request):
+        return JSONResponse(settings.calls)
+
+    return Starlette(routes=[
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+        Route("/stats", stats, methods=["GET"]),
+    ])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--tokens-per-second", type=float, default=80)
+    parser.add_argument("--output-tokens", type=int, default=200)
+    parser.add_argument("--rpm", type=int, default=0, help="answer 429 beyond this many requests per minute")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered 429 at random")
+    args = parser.parse_args()
+
+    settings = StubSettings(
+        args.latency_ms, args.tokens_per_second, args.output_tokens, rpm=args.rpm, error_rate=args.error_rate
+    )
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import hashlib
+import os
+from pathlib import Path
+
+CACHE_DIR = Path(os.getenv("STUDYBUDDY_CACHE_DIR", ".cache/studybuddy"))
+
+
+def text_key(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+class TextCache:
+    "Text values on local disk under one namespace, one file per key"
+
+    def __init__(self, namespace: str, root: Path | None = None):
+        self.directory = (root or CACHE_DIR) / namespace
+
+    def get(self, key: str) -> str | None:
+        try:
+            with open(self.directory / f"{key}.txt", "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set(self, key: str, value: str) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self.directory / f"{key}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(value)
+        os.replace(tmp, self.directory / f"{key}.txt")
@@ -0,0 +1,199 @@
+import hashlib
+import heapq
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+
+from agents import RunContextWrapper, function_tool
+
+# Uploaded documents are stored once per session, split into chunks and
+# indexed with BM25 so each turn only carries the passages it needs.
+
+CHUNK_CHARS = int(os.getenv("STUDYBUDDY_CHUNK_CHARS", "1500"))
+CHUNK_OVERLAP_CHARS = int(os.getenv("STUDYBUDDY_CHUNK_OVERLAP_CHARS", "200"))
+TOP_K = int(os.getenv("STUDYBUDDY_RETRIEVAL_TOP_K", "4"))
+# documents up to this size are still sent whole on the turn they are uploaded
+INLINE_CHARS = int(os.getenv("STUDYBUDDY_INLINE_DOCUMENT_CHARS", "12000"))
+
+# "the pdf", "my notes", "this document": a request about a whole uploaded document
+DOCUMENT_REFERENCE_RE = re.compile(
+    r"\b(?:the|this|that|my|whole|entire|uploaded|attached)\s+(?:\w+\s+)?"
+    r"(?:documents?|docs?|pdfs?|files?|uploads?|attachments?|notes|papers?|articles?|slides|books?)\b",
+    re.IGNORECASE,
+)
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with what which who how".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def split_chunks(text: str, size: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP_CHARS) -> list[str]:
+    "Splits text into chunks of about `size` characters, preferring paragraph and line boundaries"
+    text = text.strip()
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            for sep in ("\n\n", "\n", ". ", " "):
+                cut = text.rfind(sep, start + size // 2, end)
+                if cut != -1:
+                    end = cut + len(sep)
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+def _mentions(lowered_request: str, name: str) -> bool:
+    "Whether the request names the file, with or without its extension"
+    stem = os.path.splitext(name)[0].lower()
+    return name.lower() in lowered_request or (len(stem) >= 3 and stem in lowered_request)
+
+
+@dataclass
+class Document:
+    digest: str
+    name: str
+    text: str
+    chunk_ids: list[int] = field(default_factory=list)
+
+
+@dataclass
+class Chunk:
+    digest: str
+    position: int
+    text: str
+    length: int
+
+
+@dataclass
+class SearchHit:
+    document: str
+    position: int
+    score: float
+    text: str
+
+
+class DocumentStore:
+    "Content-addressed documents of one session with an incremental BM25 index over their chunks"
+
+    def __init__(self):
+        self.documents: dict[str, Document] = {}
+        self.chunks: list[Chunk] = []
+        self._postings: dict[str, list[tuple[int, int]]] = defaultdict(list)
+        self._total_length = 0
+
+    @staticmethod
+    def digest(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def add(self, name: str, text: str) -> Document:
+        "Stores and indexes a document; re-uploading the same content is a no-op"
+        digest = self.digest(text)
+        if digest in self.documents:
+            return self.documents[digest]
+
+        document = Document(digest=digest, name=name, text=text)
+        for position, chunk_text in enumerate(split_chunks(text)):
+            terms = Counter(tokenize(chunk_text))
+            chunk_id = len(self.chunks)
+            length = sum(terms.values())
+            self.chunks.append(Chunk(digest=digest, position=position, text=chunk_text, length=length))
+            for term, freq in terms.items():
+                self._postings[term].append((chunk_id, freq))
+            self._total_length += length
+            document.chunk_ids.append(chunk_id)
+        self.documents[digest] = document
+        return document
+
+    def latest(self) -> Document | None:
+        return next(reversed(self.documents.values()), None)
+
+    def referenced(self, request: str, new_documents: list[Document] | None = None) -> list[Document]:
+        "Documents a request is about: new uploads, documents named in it, or the latest one for 'the pdf' and the like"
+        if new_documents:
+            return new_documents
+        lowered = request.lower()
+        named = [d for d in self.documents.values() if _mentions(lowered, d.name)]
+        if named:
+            return named
+        latest = self.latest()
+        return [latest] if latest is not None and DOCUMENT_REFERENCE_RE.search(request) else []
+
+    def search(self, query: str, k: int = TOP_K, digest: str | None = None) -> list[SearchHit]:
+        "Top-k chunks for the query, optionally restricted to one document"
+        if not self.chunks:
+            return []
+        n = len(self.chunks)
+        avg_length = self._total_length / n or 1
+        scores: dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, freq in postings:
+                chunk = self.chunks[chunk_id]
+                if digest is not None and chunk.digest != digest:
+                    continue
+                norm = freq + BM25_K1 * (1 - BM25_B + BM25_B * chunk.length / avg_length)
+                scores[chunk_id] += idf * freq * (BM25_K1 + 1) / norm
+
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [
+            SearchHit(
+                document=self.documents[self.chunks[chunk_id].digest].name,
+                position=self.chunks[chunk_id].position,
+                score=score,
+                text=self.chunks[chunk_id].text,
+            )
+            for chunk_id, score in best
+        ]
+
+    def context_for(self, query: str, new_documents: list[Document] | None = None, k: int = TOP_K) -> str | None:
+        "Document text to attach to this turn: small new uploads whole, otherwise the best matching chunks"
+        new_documents = new_documents or []
+        if new_documents and sum(len(d.text) for d in new_documents) <= INLINE_CHARS:
+            return "\n\n".join(f"[{d.name}]\n{d.text}" for d in new_documents)
+
+        hits = self.search(query, k)
+        if not hits and new_documents:
+            # nothing matched the question yet, so show the start of what was just uploaded
+            hits = [
+                SearchHit(document=d.name, position=0, score=0.0, text=self.chunks[d.chunk_ids[0]].text)
+                for d in new_documents if d.chunk_ids
+            ]
+        if not hits:
+            return None
+        return format_hits(hits)
+
+
+def format_hits(hits: list[SearchHit]) -> str:
+    return "\n\n".join(f"[{hit.document}, part {hit.position + 1}]\n{hit.text}" for hit in hits)
+
+
+@function_tool("search_documents")
+def search_documents(ctx: RunContextWrapper, query: str, k: int = TOP_K) -> str:
+    "Searches the documents the user uploaded in this session and returns the most relevant passages"
+    store: DocumentStore | None = getattr(ctx.context, "documents", None)
+    if store is None or not store.documents:
+        return "No documents have been uploaded in this session."
+    hits = store.search(query, max(1, min(k, 10)))
+    if not hits:
+        return "No passages in the uploaded documents match this query."
+    return format_hits(hits)
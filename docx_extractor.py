@@ -0,0 +1,15 @@
+import asyncio
+
+from docx import Document
+
+# Text of .docx uploads with python-docx. Only imported through the
+# extractor registry in ingestion.py, once a .docx file is uploaded.
+
+
+def _read_docx(path: str) -> str:
+    doc = Document(path)
+    return "\n".join([para.text for para in doc.paragraphs])
+
+
+async def extract_docx(path: str) -> str:
+    return await asyncio.to_thread(_read_docx, path)
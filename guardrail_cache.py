@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, TypeVar
+
+from pydantic import BaseModel
+from agents import Agent, RunContextWrapper, Runner, TResponseInputItem
+from telemetry import record_usage
+from llm_scheduler import llm_lane
+
+# Verdict cache shared by every session in the process. Keys are a hash of the
+# guardrail name, its instructions version and the normalized text it judged.
+
+MAX_ENTRIES = int(os.getenv("STUDYBUDDY_GUARDRAIL_CACHE_SIZE", "4096"))
+TTL_SECONDS = float(os.getenv("STUDYBUDDY_GUARDRAIL_CACHE_TTL", str(24 * 3600)))
+# set to a file path to keep verdicts across restarts
+DB_PATH = os.getenv("STUDYBUDDY_GUARDRAIL_CACHE_DB")
+
+T = TypeVar("T", bound=BaseModel)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize(value: Any) -> str:
+    "Canonical text form of a guardrail input, insensitive to case and whitespace"
+    if isinstance(value, BaseModel):
+        value = value.model_dump()
+    if isinstance(value, str):
+        return _WHITESPACE_RE.sub(" ", value).strip().casefold()
+    if isinstance(value, dict):
+        return json.dumps({k: normalize(v) for k, v in value.items()}, sort_keys=True, ensure_ascii=False)
+    if isinstance(value, (list, tuple)):
+        return json.dumps([normalize(v) for v in value], ensure_ascii=False)
+    return normalize(str(value))
+
+
+def instructions_version(agent: Agent) -> str:
+    "Short hash of what the guardrail agent is asked to do, so prompt edits invalidate old verdicts"
+    output_name = getattr(agent.output_type, "__name__", str(agent.output_type))
+    raw = f"{agent.instructions}|{output_name}|{agent.model}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def cache_key(guardrail: str, version: str, value: Any) -> str:
+    raw = f"{guardrail}\0{version}\0{normalize(value)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class VerdictCache:
+    "Bounded LRU with TTL, optionally backed by a SQLite file"
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl: float = TTL_SECONDS, db_path: str | None = DB_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS verdicts (key TEXT PRIMARY KEY, payload TEXT NOT NULL, created REAL NOT NULL)")
+            self._db.execute("DELETE FROM verdicts WHERE created < ?", (time.time() - ttl,))
+            self._db.commit()
+
+    def _get_local(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created, payload = entry
+            if time.time() - created > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def _put_local(self, key: str, payload: str, created: float) -> None:
+        with self._lock:
+            self._entries[key] = (created, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_db(self, key: str) -> tuple[float, str] | None:
+        with self._lock:
+            row = self._db.execute("SELECT created, payload FROM verdicts WHERE key = ?", (key,)).fetchone()
+        if row is None or time.time() - row[0] > self.ttl:
+            return None
+        return row
+
+    def _put_db(self, key: str, payload: str, created: float) -> None:
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO verdicts (key, payload, created) VALUES (?, ?, ?)", (key, payload, created))
+            self._db.commit()
+
+    async def get(self, key: str, output_type: type[T]) -> T | None:
+        payload = self._get_local(key)
+        if payload is None and self._db is not None:
+            row = await asyncio.to_thread(self._get_db, key)
+            if row is not None:
+                created, payload = row
+                self._put_local(key, payload, created)
+        if payload is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return output_type.model_validate_json(payload)
+
+    async def set(self, key: str, verdict: BaseModel) -> None:
+        payload = verdict.model_dump_json()
+        created = time.time()
+        self._put_local(key, payload, created)
+        if self._db is not None:
+            await asyncio.to_thread(self._put_db, key, payload, created)
+
+
+verdict_cache = VerdictCache()
+
+
+async def run_cached(
+    guardrail_agent: Agent, input: str | list[TResponseInputItem] | BaseModel, ctx: RunContextWrapper
+) -> BaseModel:
+    "Runs a guardrail agent, returning a cached verdict when the same text was already judged"
+    key = cache_key(guardrail_agent.name, instructions_version(guardrail_agent), input)
+    verdict = await verdict_cache.get(key, guardrail_agent.output_type)
+    if verdict is not None:
+        return verdict
+    with llm_lane("guardrail"):
+        result = await Runner.run(guardrail_agent, input, context=ctx.context)
+    record_usage(guardrail_agent.name, result.context_wrapper.usage)
+    verdict = result.final_output
+    await verdict_cache.set(key, verdict)
+    return verdict
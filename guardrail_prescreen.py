@@ -0,0 +1,141 @@
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from enum import Enum
+
+# Deterministic checks that run before the LLM output guardrails. Clear-cut
+# cases are decided locally; anything ambiguous is escalated to the LLM agent.
+
+class Verdict(str, Enum):
+    PASS = "pass"
+    FAIL = "fail"
+    ESCALATE = "escalate"
+
+
+@dataclass
+class PrescreenResult:
+    verdict: Verdict
+    reasoning: str
+
+
+EMAIL_RE = re.compile(r"\b[A-Za-z0-9._%+-]+@([A-Za-z0-9-]+\.)+[A-Za-z]{2,}\b")
+PHONE_RE = re.compile(r"(?<![\w.])(?:\+?\d{1,3}[\s.-]?)?(?:\(\d{2,4}\)[\s.-]?)?\d{3,4}[\s.-]\d{3,4}(?:[\s.-]\d{2,4})?(?![\w.])")
+CARD_RE = re.compile(r"(?<!\d)(?:\d[ -]?){12,18}\d(?!\d)")
+# 4-4-4-4 style grouping or a nearby card keyword makes a Luhn-valid number unambiguous
+GROUPED_CARD_RE = re.compile(r"^\d{4}([ -])\d{4}\1\d{4}\1\d{1,7}$")
+CARD_CONTEXT_RE = re.compile(r"\b(?:card|visa|mastercard|amex|cvv|expiry)\b", re.IGNORECASE)
+
+# addresses that are obviously placeholders or documentation examples
+PLACEHOLDER_EMAIL_RE = re.compile(r"@(example\.(com|org|net)|test\.com|domain\.com|email\.com|yourdomain\.\w+)$", re.IGNORECASE)
+
+# names are only personal details next to cues like these; "The French Revolution" is not
+PERSONAL_CONTEXT_RE = re.compile(
+    r"\b(?:my name is|(?:full |first |last )?name\s*:|i am called|call me|lives? (?:at|in|on)|living at|resides? at"
+    r"|born (?:on|in)|date of birth|home address|address\s*:|student (?:id|number)|passport|social security|ssn"
+    r"|(?:mr|mrs|ms|miss|dr)\.?[ \t]+[A-Z][a-z]+|dear[ \t]+[A-Z][a-z]+)(?!\w)",
+    re.IGNORECASE,
+)
+# a street address is a personal detail on its own
+ADDRESS_RE = re.compile(
+    r"\b\d{1,5}[ \t]+(?:[A-Za-z]+[ \t]+){1,3}(?:street|st|road|rd|avenue|ave|lane|ln|boulevard|blvd|drive|dr|way|court|ct)\b",
+    re.IGNORECASE,
+)
+
+# first-person statements about being an AI; only a trip when the answer says it, not when it quotes it
+SELF_REFERENCE_RE = re.compile(
+    r"\b(?:as an? (?:ai|artificial intelligence)(?: language)? model"
+    r"|as an? (?:large )?language model"
+    r"|as an ai(?: assistant)?,"
+    r"|i(?: am|'m) (?:just |only )?an? (?:ai|artificial intelligence|large language model|language model)\b"
+    r"|i(?: am|'m) not able to .{0,40} because i(?: am|'m) an ai)",
+    re.IGNORECASE,
+)
+QUOTE_CHARS = "\"“”«»"
+SENTENCE_START_RE = re.compile(r"(?:^|[.!?:\n])[\s*_>#-]*$")
+# mentions that may or may not be self-references, e.g. an explanation of LLMs
+AI_MENTION_RE = re.compile(
+    r"\b(?:language model|ai model|chatbot|gemini|openai|gpt-?\d|trained by|my training data|knowledge cutoff)\b",
+    re.IGNORECASE,
+)
+
+
+def _luhn_valid(number: str) -> bool:
+    digits = [int(d) for d in number if d.isdigit()]
+    checksum = 0
+    for i, digit in enumerate(reversed(digits)):
+        if i % 2:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        checksum += digit
+    return checksum % 10 == 0
+
+
+def screen_pii(text: str, allowed: set[str] | None = None) -> PrescreenResult:
+    "Local PII check: card numbers can fail, contact details and possible names or addresses escalate"
+    allowed = {a.lower() for a in allowed or ()}
+
+    for match in CARD_RE.finditer(text):
+        number = match.group()
+        if not _luhn_valid(number):
+            continue
+        if GROUPED_CARD_RE.match(number) or CARD_CONTEXT_RE.search(text):
+            return PrescreenResult(Verdict.FAIL, "prescreen: output contains a payment card number")
+        return PrescreenResult(Verdict.ESCALATE, "prescreen: output contains a long Luhn-valid number")
+
+    emails = [
+        m.group() for m in EMAIL_RE.finditer(text)
+        if m.group().lower() not in allowed and not PLACEHOLDER_EMAIL_RE.search(m.group())
+    ]
+    phones = [m.group() for m in PHONE_RE.finditer(text) if m.group() not in allowed]
+    if emails or phones:
+        return PrescreenResult(Verdict.ESCALATE, "prescreen: output contains contact details")
+    # names and addresses are only judged by the LLM, so text that points at a person is never passed here
+    if PERSONAL_CONTEXT_RE.search(text) or ADDRESS_RE.search(text):
+        return PrescreenResult(Verdict.ESCALATE, "prescreen: output may contain personal details")
+
+    return PrescreenResult(Verdict.PASS, "prescreen: no contact details, card numbers or personal details found")
+
+
+def screen_self_reference(text: str) -> PrescreenResult:
+    "Local check for 'As an AI model'-style statements; only ones opening a sentence outside quotes fail"
+    matches = list(SELF_REFERENCE_RE.finditer(text))
+    for match in matches:
+        before = text[:match.start()]
+        quoted = sum(before.count(c) for c in QUOTE_CHARS) % 2 == 1 or before.endswith(("'", "‘"))
+        if not quoted and SENTENCE_START_RE.search(before):
+            return PrescreenResult(Verdict.FAIL, "prescreen: output refers to itself as an AI model")
+    if matches:
+        # quoted or explained, e.g. what "as an AI language model" means
+        return PrescreenResult(Verdict.ESCALATE, "prescreen: output mentions an AI self-reference phrase")
+    if AI_MENTION_RE.search(text):
+        return PrescreenResult(Verdict.ESCALATE, "prescreen: output mentions AI models")
+    return PrescreenResult(Verdict.PASS, "prescreen: no self-reference found")
+
+
+class PrescreenStats:
+    "Counts which tier decided each guardrail check"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Counter[tuple[str, str]] = Counter()
+
+    def record(self, guardrail: str, tier: str) -> None:
+        with self._lock:
+            self._counts[(guardrail, tier)] += 1
+
+    def snapshot(self) -> dict[str, dict[str, int]]:
+        with self._lock:
+            result: dict[str, dict[str, int]] = {}
+            for (guardrail, tier), count in self._counts.items():
+                result.setdefault(guardrail, {})[tier] = count
+            return result
+
+    @property
+    def llm_calls_avoided(self) -> int:
+        with self._lock:
+            return sum(c for (_, tier), c in self._counts.items() if tier != "llm")
+
+
+stats = PrescreenStats()
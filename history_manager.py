@@ -0,0 +1,144 @@
+import hashlib
+import json
+import logging
+import math
+import os
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from agents import Agent, Runner, TResponseInputItem
+from my_secrets import Secrets
+from input_guardrails import FILE_CONTENT_MARKER
+from telemetry import record_usage
+
+logger = logging.getLogger(__name__)
+
+secrets = Secrets()
+
+# estimated prompt tokens allowed per turn before older turns are summarized
+PROMPT_TOKEN_BUDGET = int(os.getenv("STUDYBUDDY_PROMPT_TOKEN_BUDGET", "12000"))
+# the newest items are always sent verbatim
+KEEP_RECENT_ITEMS = int(os.getenv("STUDYBUDDY_KEEP_RECENT_ITEMS", "6"))
+CHARS_PER_TOKEN = 4
+
+compaction_agent = Agent(
+    name="History Compactor",
+    instructions="""
+You maintain a rolling summary of a study session between a student and StudyBuddy.
+You get the previous summary (may be empty) and the conversation turns that are being dropped.
+Return an updated summary in plain text that keeps:
+- the topics, questions and goals of the student
+- key facts, definitions, results and decisions from the answers
+- names of uploaded files and what they were about
+Keep it short and factual, do not add anything that is not in the input.
+""",
+    model=secrets.gemini_api_model,
+)
+
+# summaries for identical (previous summary, dropped turns) pairs are reused
+SUMMARY_CACHE_SIZE = 256
+_summary_cache: OrderedDict[str, str] = OrderedDict()
+
+
+def estimate_tokens(item: TResponseInputItem | str) -> int:
+    text = item if isinstance(item, str) else str(item.get("content", ""))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+@dataclass
+class TurnStats:
+    prompt_tokens: int
+    items_sent: int
+    items_summarized: int
+
+
+@dataclass
+class HistoryManager:
+    "Full transcript of a session plus the token-budgeted prompt built from it"
+    budget: int = PROMPT_TOKEN_BUDGET
+    keep_recent: int = KEEP_RECENT_ITEMS
+    items: list = field(default_factory=list)
+    summary: str = ""
+    # items before this index are represented by the summary
+    summarized_upto: int = 0
+    turn_stats: list[TurnStats] = field(default_factory=list)
+    _tokens: list[int] = field(default_factory=list, init=False, repr=False)
+
+    def to_dict(self) -> dict:
+        # a copy, so a saved state does not grow with the items appended after it
+        return {"items": list(self.items), "summary": self.summary, "summarized_upto": self.summarized_upto}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "HistoryManager":
+        history = cls(summary=data.get("summary", ""), summarized_upto=data.get("summarized_upto", 0))
+        for item in data.get("items", []):
+            history.append(item)
+        return history
+
+    def append(self, item: TResponseInputItem) -> None:
+        self.items.append(item)
+        self._tokens.append(estimate_tokens(item))
+
+    def pop(self) -> TResponseInputItem:
+        self._tokens.pop()
+        item = self.items.pop()
+        self.summarized_upto = min(self.summarized_upto, len(self.items))
+        return item
+
+    @property
+    def prompt_tokens(self) -> int:
+        return estimate_tokens(self.summary) + sum(self._tokens[self.summarized_upto:])
+
+    def prompt(self, attachment: str | None = None) -> list[TResponseInputItem]:
+        "Items to send to the model: the rolling summary, the recent turns and this turn's document context"
+        recent = list(self.items[self.summarized_upto:])
+        if attachment and recent:
+            # document passages are only sent with the turn that needs them, never stored
+            recent[-1] = {**recent[-1], "content": f"{recent[-1]['content']}{FILE_CONTENT_MARKER}\n{attachment}"}
+        if not self.summary:
+            return recent
+        return [{"role": "system", "content": f"Summary of the earlier conversation:\n{self.summary}"}, *recent]
+
+    async def compact(self, reserve: int = 0) -> None:
+        "Folds the oldest verbatim turns into the rolling summary until the prompt fits the budget"
+        end = self.summarized_upto
+        tokens = self.prompt_tokens + reserve
+        last_foldable = len(self.items) - self.keep_recent
+        while tokens > self.budget and end < last_foldable:
+            tokens -= self._tokens[end]
+            end += 1
+        if end == self.summarized_upto:
+            return
+
+        dropped = self.items[self.summarized_upto:end]
+        key = hashlib.sha256(json.dumps([self.summary, dropped], ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+        summary = _summary_cache.get(key)
+        if summary is None:
+            try:
+                result = await Runner.run(
+                    compaction_agent,
+                    f"Previous summary:\n{self.summary or '(none)'}\n\nTurns to fold in:\n{json.dumps(dropped, ensure_ascii=False, default=str)}",
+                )
+            except Exception as e:
+                # keep sending the turns verbatim rather than failing the user's message
+                logger.warning("History compaction failed: %s", e)
+                return
+            record_usage(compaction_agent.name, result.context_wrapper.usage)
+            summary = str(result.final_output)
+            _summary_cache[key] = summary
+            if len(_summary_cache) > SUMMARY_CACHE_SIZE:
+                _summary_cache.popitem(last=False)
+
+        self.summary = summary
+        self.summarized_upto = end
+
+    def record_turn(self, attachment: str | None = None) -> TurnStats:
+        "Stores the size of the prompt about to be sent"
+        stats = TurnStats(
+            prompt_tokens=self.prompt_tokens + estimate_tokens(attachment or ""),
+            items_sent=len(self.items) - self.summarized_upto + (1 if self.summary else 0),
+            items_summarized=self.summarized_upto,
+        )
+        self.turn_stats.append(stats)
+        logger.debug("Prompt size: %s", stats)
+        return stats
@@ -0,0 +1,107 @@
+import asyncio
+import importlib
+import os
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+# Reads every file attached to a message concurrently, with a bounded number
+# of files in flight, and returns the results in attachment order.
+
+MAX_CONCURRENT_FILES = int(os.getenv("STUDYBUDDY_MAX_CONCURRENT_FILES", "4"))
+TEXT_EXTENSIONS = (".txt", ".py", ".cpp", ".cc")
+
+Extractor = Callable[[str], Awaitable[str]]
+
+
+class UnsupportedFileType(Exception):
+    pass
+
+
+@dataclass
+class IngestResult:
+    name: str
+    path: str
+    content: str | None = None
+    error: str | None = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _read_text(path: str) -> str:
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return f.read()
+
+
+async def extract_text(path: str) -> str:
+    return await asyncio.to_thread(_read_text, path)
+
+
+# extension -> "module:function" of an async extractor. The module is imported
+# the first time a file of that type arrives, so document libraries such as
+# PyMuPDF or python-docx are never loaded by a worker that does not need them.
+EXTRACTORS: dict[str, str] = {
+    **{ext: "ingestion:extract_text" for ext in TEXT_EXTENSIONS},
+    ".docx": "docx_extractor:extract_docx",
+    ".pdf": "pdf_extractor:extract_pdf",
+    # tables are profiled instead of pasted; the rows stay on disk for the query_table tool
+    ".csv": "tabular:extract_csv",
+    ".tsv": "tabular:extract_tsv",
+    ".xlsx": "tabular:extract_excel",
+}
+_loaded: dict[str, Extractor] = {}
+
+
+def register_extractor(extensions: tuple[str, ...], target: str) -> None:
+    "Registers a 'module:function' extractor for the given extensions"
+    for ext in extensions:
+        EXTRACTORS[ext.lower()] = target
+        _loaded.pop(ext.lower(), None)
+
+
+def get_extractor(ext: str) -> Extractor:
+    extractor = _loaded.get(ext)
+    if extractor is None:
+        target = EXTRACTORS.get(ext)
+        if target is None:
+            raise UnsupportedFileType(f"Unsupported file type: {ext}")
+        module, function = target.split(":")
+        extractor = _loaded[ext] = getattr(importlib.import_module(module), function)
+    return extractor
+
+
+async def extract_file(path: str, name: str) -> str:
+    "Text of one uploaded file; blocking readers run off the event loop"
+    extractor = get_extractor(os.path.splitext(name)[1].lower())
+    return await extractor(path)
+
+
+async def ingest_files(files: list[tuple[str, str]], max_concurrent: int = MAX_CONCURRENT_FILES) -> list[IngestResult]:
+    "Extracts (name, path) pairs concurrently; a failing file is reported without aborting the rest"
+    semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def ingest(name: str, path: str) -> IngestResult:
+        async with semaphore:
+            started = time.perf_counter()
+            result = IngestResult(name=name, path=path)
+            try:
+                result.content = await extract_file(path, name)
+            except UnsupportedFileType as e:
+                result.error = str(e)
+            except Exception as e:
+                result.error = f"Could not read file: {str(e)}"
+            result.seconds = time.perf_counter() - started
+            return result
+
+    return await asyncio.gather(*(ingest(name, path) for name, path in files))
+
+
+def format_report(results: list[IngestResult]) -> str:
+    lines = [
+        f"✅ {r.name} ({r.seconds:.2f}s)" if r.ok else f"❌ {r.name}: {r.error}"
+        for r in results
+    ]
+    return "\n".join(lines)
@@ -3,15 +3,22 @@ from agents import (
     Agent,
     GuardrailFunctionOutput,
     RunContextWrapper,
-    Runner,
     TResponseInputItem,
     input_guardrail,
     RunConfig,
 )
+import os
 from my_secrets import Secrets
+from guardrail_cache import cache_key, run_cached
+from telemetry import timed
 
 secrets = Secrets()
 
+# only the newest user turn is judged, with this many earlier items as context
+CONTEXT_ITEMS = int(os.getenv("STUDYBUDDY_GUARDRAIL_CONTEXT_ITEMS", "2"))
+CONTEXT_CHARS = int(os.getenv("STUDYBUDDY_GUARDRAIL_CONTEXT_CHARS", "500"))
+FILE_CONTENT_MARKER = "\n\n[File Content]:"
+
 class MaliciousIntentOutput(BaseModel):
     has_malicious_intent: bool
     is_developer_context: bool
@@ -37,13 +44,43 @@ Respond with your judgment and clear reasoning.
     model=secrets.gemini_api_model,
 )
 
+def _item_text(item: TResponseInputItem) -> str:
+    content = item.get("content", "") if isinstance(item, dict) else ""
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content if isinstance(content, str) else str(content)
+
+def newest_turn(input: str | list[TResponseInputItem]) -> list[TResponseInputItem]:
+    "The latest user item plus a short, file-free window of the items before it"
+    if isinstance(input, str):
+        return [{"role": "user", "content": input}]
+
+    user_indexes = [i for i, item in enumerate(input) if isinstance(item, dict) and item.get("role") == "user"]
+    last_user = user_indexes[-1] if user_indexes else len(input) - 1
+    window = []
+    for item in input[max(last_user - CONTEXT_ITEMS, 0):last_user]:
+        text = _item_text(item).split(FILE_CONTENT_MARKER, 1)[0][:CONTEXT_CHARS]
+        window.append({"role": item.get("role", "user") if isinstance(item, dict) else "user", "content": text})
+    newest = list(input[last_user:last_user + 1])
+    if newest and isinstance(newest[0], dict):
+        # the user's own words are judged, not the document passages attached to them
+        newest[0] = {**newest[0], "content": _item_text(newest[0]).split(FILE_CONTENT_MARKER, 1)[0]}
+    return window + newest
+
 @input_guardrail
+@timed("input_guardrail")
 async def malicious_intent_guardrail(
     ctx: RunContextWrapper[None], agent: Agent, input: str | list[TResponseInputItem]
 ) -> GuardrailFunctionOutput:
-    result = await Runner.run(malicious_intent_agent, input, context=ctx.context)
-    
-    output = result.final_output
+    turn = newest_turn(input)
+    # verdicts for turns this session already judged are kept on the run context
+    turn_verdicts = getattr(ctx.context, "turn_verdicts", None)
+    key = cache_key(malicious_intent_agent.name, "turn", turn)
+    output = turn_verdicts.get(key) if turn_verdicts is not None else None
+    if output is None:
+        output = await run_cached(malicious_intent_agent, turn, ctx)
+        if turn_verdicts is not None:
+            turn_verdicts[key] = output
     should_block = output.has_malicious_intent and not output.is_developer_context
 
     return GuardrailFunctionOutput(
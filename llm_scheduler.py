@@ -0,0 +1,288 @@
+import asyncio
+import importlib
+import logging
+import os
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from openai import DefaultAsyncHttpxClient
+
+from telemetry import metrics
+
+logger = logging.getLogger(__name__)
+
+# One scheduler in front of every request the shared LLM client sends:
+# triage and answers, guardrails, summaries and compaction. Requests wait
+# in priority lanes for a concurrency slot and for room in token buckets
+# of requests and tokens per minute. 429 and 5xx answers are retried with
+# jittered exponential backoff, and a 429 pauses every lane until the
+# endpoint's Retry-After has passed instead of letting the next burst
+# hit it too. The scheduler sits in the httpx transport, so streamed and
+# plain calls go through it alike.
+
+# the httpx package the installed openai client is built on; transports and
+# streams have to come from the same one as its requests
+http = importlib.import_module(DefaultAsyncHttpxClient.__mro__[1].__module__.partition(".")[0])
+
+CONCURRENCY = int(os.getenv("STUDYBUDDY_LLM_CONCURRENCY", "32"))
+# 0 turns the bucket off
+REQUESTS_PER_MINUTE = float(os.getenv("STUDYBUDDY_LLM_RPM", "0"))
+TOKENS_PER_MINUTE = float(os.getenv("STUDYBUDDY_LLM_TPM", "0"))
+MAX_RETRIES = int(os.getenv("STUDYBUDDY_LLM_MAX_RETRIES", "5"))
+BASE_DELAY = float(os.getenv("STUDYBUDDY_LLM_RETRY_BASE_SECONDS", "0.5"))
+MAX_DELAY = float(os.getenv("STUDYBUDDY_LLM_RETRY_MAX_SECONDS", "20"))
+# a queued request moves up one lane for every this many seconds it waited
+AGING_SECONDS = 5.0
+# output tokens assumed for the bucket until the answer reports its usage
+EXPECTED_OUTPUT_TOKENS = 500
+
+# lower is served first: the answer the user waits for, then the checks on it
+LANES = {"interactive": 0, "guardrail": 1}
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRY_ERRORS = (http.ConnectError, http.ConnectTimeout, http.RemoteProtocolError)
+PROMPT_TOKENS_RE = re.compile(rb'"prompt_tokens"\s*:\s*(\d+)')
+COMPLETION_TOKENS_RE = re.compile(rb'"completion_tokens"\s*:\s*(\d+)')
+
+_lane: ContextVar[str] = ContextVar("studybuddy_llm_lane", default="interactive")
+
+
+@contextmanager
+def llm_lane(lane: str):
+    "Sends the LLM requests made inside the block, and in tasks started there, in this lane"
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+class TokenBucket:
+    "Refills `rate` units per second up to `capacity`; a rate of 0 never limits"
+
+    def __init__(self, per_minute: float, capacity: float | None = None):
+        self.rate = per_minute / 60
+        self.capacity = capacity if capacity is not None else per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        "Seconds until `amount` can be taken"
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        # a request larger than the bucket waits for a full bucket rather than forever
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float, now: float) -> None:
+        "Takes `amount`, or gives it back when negative; the level may go below zero"
+        if self.rate:
+            self._refill(now)
+            self.level = min(self.capacity, self.level - amount)
+
+
+@dataclass
+class _Waiter:
+    lane: str
+    tokens: int
+    queued: float
+    future: asyncio.Future
+
+
+class LLMScheduler:
+    "Priority lanes in front of a concurrency limit and request/token buckets"
+
+    def __init__(
+        self,
+        concurrency: int = CONCURRENCY,
+        requests_per_minute: float = REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = TOKENS_PER_MINUTE,
+    ):
+        self.concurrency = max(1, concurrency)
+        # a minute's worth of requests may go out in a burst, not more
+        self.requests = TokenBucket(requests_per_minute, max(1.0, requests_per_minute / 6) if requests_per_minute else None)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._waiting: list[_Waiter] = []
+        self._timer: asyncio.TimerHandle | None = None
+
+    def _publish(self) -> None:
+        for lane in LANES:
+            metrics.set("studybuddy_llm_queue_depth", sum(w.lane == lane for w in self._waiting), lane=lane)
+        metrics.set("studybuddy_llm_in_flight", self.in_flight)
+
+    def _rank(self, waiter: _Waiter, now: float) -> tuple[float, float]:
+        return LANES.get(waiter.lane, len(LANES)) - (now - waiter.queued) / AGING_SECONDS, waiter.queued
+
+    def _dispatch(self) -> None:
+        self._timer = None
+        self._waiting = [w for w in self._waiting if not w.future.done()]
+        while self._waiting and self.in_flight < self.concurrency:
+            now = time.monotonic()
+            waiter = min(self._waiting, key=lambda w: self._rank(w, now))
+            wait = max(self.paused_until - now, self.requests.delay(1, now), self.tokens.delay(waiter.tokens, now))
+            if wait > 0:
+                # the head of the queue waits; nothing behind it may overtake
+                loop = waiter.future.get_loop()
+                self._timer = loop.call_later(wait, self._dispatch)
+                break
+            self._waiting.remove(waiter)
+            self.requests.take(1, now)
+            self.tokens.take(waiter.tokens, now)
+            self.in_flight += 1
+            waiter.future.set_result(None)
+            metrics.observe("studybuddy_llm_wait_ms", (now - waiter.queued) * 1000, lane=waiter.lane)
+        self._publish()
+
+    async def acquire(self, lane: str, tokens: int) -> None:
+        waiter = _Waiter(lane, tokens, time.monotonic(), asyncio.get_running_loop().create_future())
+        self._waiting.append(waiter)
+        if self._timer is None:
+            self._dispatch()
+        else:
+            self._publish()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # the slot was handed over just as the caller gave up
+                self.release()
+            raise
+
+    def release(self, tokens_used: int = 0, tokens_reserved: int = 0) -> None:
+        "Frees the slot and settles the token bucket with what the request really used"
+        self.in_flight -= 1
+        if tokens_used:
+            self.tokens.take(tokens_used - tokens_reserved, time.monotonic())
+        if self._timer is None:
+            self._dispatch()
+        else:
+            self._publish()
+
+    def pause(self, seconds: float) -> None:
+        "Holds back every lane, after the endpoint said it is overloaded"
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def retry_delay(attempt: int, retry_after: str | None) -> float:
+    "Full-jitter exponential backoff, at least as long as the server's Retry-After"
+    delay = random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+    try:
+        return max(delay, min(MAX_DELAY, float(retry_after))) if retry_after else delay
+    except ValueError:
+        return delay
+
+
+def _usage(body: bytes) -> int:
+    "Total tokens from the usage object at the end of an answer, 0 if there is none"
+    prompt, completion = PROMPT_TOKENS_RE.findall(body), COMPLETION_TOKENS_RE.findall(body)
+    return int(prompt[-1]) + int(completion[-1]) if prompt and completion else 0
+
+
+class _ReleasingStream(http.AsyncByteStream):
+    "Passes a streamed answer through and frees the scheduler slot once it is closed"
+
+    def __init__(self, stream, scheduler: LLMScheduler, reserved: int):
+        self.stream = stream
+        self.scheduler = scheduler
+        self.reserved = reserved
+        self.tail = b""
+        self.released = False
+
+    async def __aiter__(self):
+        async for part in self.stream:
+            # the usage object comes in the last chunk
+            self.tail = (self.tail + part)[-2048:]
+            yield part
+
+    async def aclose(self) -> None:
+        try:
+            await self.stream.aclose()
+        finally:
+            if not self.released:
+                self.released = True
+                self.scheduler.release(_usage(self.tail), self.reserved)
+
+
+class ScheduledTransport(http.AsyncBaseTransport):
+    "httpx transport that sends chat completion requests through the scheduler"
+
+    def __init__(self, transport, scheduler: LLMScheduler):
+        self.transport = transport
+        self.scheduler = scheduler
+
+    async def handle_async_request(self, request):
+        if request.method != "POST":
+            return await self.transport.handle_async_request(request)
+        body = await request.aread()
+        lane = _lane.get()
+        # about four bytes of JSON per token
+        reserved = len(body) // 4 + EXPECTED_OUTPUT_TOKENS
+        attempt = 0
+        while True:
+            await self.scheduler.acquire(lane, reserved)
+            try:
+                response = await self.transport.handle_async_request(request)
+            except RETRY_ERRORS as e:
+                self.scheduler.release()
+                if attempt >= MAX_RETRIES:
+                    metrics.inc("studybuddy_llm_requests_total", lane=lane, status="error")
+                    raise
+                metrics.inc("studybuddy_llm_retries_total", reason=type(e).__name__)
+                await asyncio.sleep(retry_delay(attempt, None))
+                attempt += 1
+                continue
+            except BaseException:
+                self.scheduler.release()
+                raise
+
+            if response.status_code in RETRY_STATUSES and attempt < MAX_RETRIES:
+                retry_after = response.headers.get("retry-after")
+                await response.aclose()
+                self.scheduler.release()
+                delay = retry_delay(attempt, retry_after)
+                if response.status_code == 429:
+                    self.scheduler.pause(delay)
+                metrics.inc("studybuddy_llm_retries_total", reason=str(response.status_code))
+                logger.info("LLM request got %d, retry %d in %.2fs", response.status_code, attempt + 1, delay)
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+
+            metrics.inc("studybuddy_llm_requests_total", lane=lane, status=str(response.status_code))
+            stream = _ReleasingStream(response.stream, self.scheduler, reserved)
+            return http.Response(
+                status_code=response.status_code,
+                headers=response.headers,
+                stream=stream,
+                extensions=response.extensions,
+                request=request,
+            )
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+_scheduler: LLMScheduler | None = None
+
+
+def get_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler()
+    return _scheduler
+
+
+def scheduled_transport(max_connections: int, max_keepalive_connections: int, scheduler: LLMScheduler | None = None):
+    "Connection-pooling transport for the LLM client that sends every request through the scheduler"
+    limits = http.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+    return ScheduledTransport(http.AsyncHTTPTransport(limits=limits), scheduler or get_scheduler())
@@ -1,46 +1,38 @@
 import chainlit as cl
+from chainlit.server import app as server_app
 from agents import (
     Agent,
     Runner,
-    AsyncOpenAI,
-    OpenAIChatCompletionsModel,
-    set_default_openai_api,
-    set_default_openai_client,
-    set_tracing_disabled,
-    RunContextWrapper,
-    function_tool,
     RunConfig,
+    RunContextWrapper,
+    RunResultStreaming,
+    InputGuardrailTripwireTriggered,
+    OutputGuardrailTripwireTriggered,
 )
-from input_guardrails import malicious_intent_guardrail
-from output_guardrails import (
-                            pii_output_guardrail, 
-                            hallucination_output_guardrail,
-                            self_reference_output_guardrail)
-import json
+from registry import StudyContext, get_agent, get_specialist
+from router import STARTER_AGENTS, route, stats as router_stats
+from history_manager import HistoryManager, estimate_tokens
+from ingestion import format_report, ingest_files
+from summarization import PIPELINE_MIN_CHARS, merge_summarizer_agent, summarize_document, wants_summary
+from artifact_cache import artifact_key, get_artifact_cache, replay, split_regenerate
+from telemetry import SHOW_TIMINGS, finish_turn, mount_metrics, record_span, record_usage, span, start_turn
+from session_store import get_session_store
+from streaming import StreamBuffer
+from streaming_guardrails import PIPELINE_WINDOW_CHARS, guard_stream
+from output_guardrails import STREAMING_GUARDRAILS
+from session_state import DocumentRef, SessionState, get_state_backend, save_turn
+from translation import PIPELINE_MIN_CHARS as TRANSLATION_PIPELINE_MIN_CHARS, target_language, translate_document, translates_part
 from typing import cast
-from my_secrets import Secrets
-from dataclasses import dataclass
+from collections.abc import AsyncIterator
+import logging
+import time
 from openai.types.responses import ResponseTextDeltaEvent
 import random
-import fitz
-import docx
-import pandas as pd
-import os
-
-secrets = Secrets()
 
-@dataclass
-class Developer:
-    name:str
-    mail:str
-    github:str
-
-@function_tool("developer_info")
-@cl.step(type="Developer Info")
-def developer_info(developer: RunContextWrapper[Developer]) -> str:
-    "Returns the name, mail and github of the developer"
-    return f"Developer name: {developer.context.name}, Developer mail: {developer.context.mail}, Developer github: {developer.context.github}"
+logger = logging.getLogger(__name__)
 
+# 📈 stage timings and token counts on /metrics (Prometheus) and /metrics.json
+mount_metrics(server_app)
 
 @cl.set_chat_profiles
 def chat_profile():
@@ -52,308 +44,142 @@ def chat_profile():
         )
     ]
 
+STARTERS = [
+    cl.Starter(
+        label="Text Summarizer",
+        message="Meet your Summarizer – ready to condense content into clear summaries.",
+        icon="/public/summarization.svg",
+    ),
+    cl.Starter(
+        label="Concept Explainer",
+        message="Need help understanding a topic? Your Concept Explainer is here to assist.",
+        icon="/public/discussion.svg",
+    ),
+    cl.Starter(
+        label="Quiz Generator",
+        message="Ready to test your knowledge? Let the Quiz Generator create custom quizzes for you.",
+        icon="/public/quiz.svg",
+    ),
+    cl.Starter(
+        label="Text Translator",
+        message="Your Translator is here – easily convert text between languages.",
+        icon="/public/translating.svg"
+    ),
+    cl.Starter(
+        label="Definition Lookup",
+        message="Quick definitions at your fingertips – your Definition Assistant is here.",
+        icon="/public/definition.svg"
+    ),
+    cl.Starter(
+        label="Flashcard Generator",
+        message="Boost your memory with smart flashcards – generated just for you.",
+        icon="/public/flash-card.svg",
+    ),
+    cl.Starter(
+        label="Study Scheduler",
+        message="Plan smarter, not harder – your Study Scheduler is ready to help.",
+        icon="/public/time-management.svg",
+    ),
+    cl.Starter(
+        label="Code Explainer",
+        message="Confused by code? The Code Explainer is here to break it down for you.",
+        icon="/public/binary-code.svg",
+    ),
+    cl.Starter(
+        label="Math Solver",
+        message="Tackle math problems with confidence – your Math Solver is ready.",
+        icon="/public/calculating.svg"
+    ),
+    cl.Starter(
+        label="Research Assistant",
+        message="Meet your Research Assistant – here to support your research needs.",
+        icon="/public/search.svg",
+    ),
+]
+# a clicked starter sends its message text, which maps straight to its specialist
+STARTER_MESSAGES = {s.message: STARTER_AGENTS[s.label] for s in STARTERS}
+
 @cl.set_starters
 async def starter():
-    return [
-        cl.Starter(
-            label="Text Summarizer",
-            message="Meet your Summarizer – ready to condense content into clear summaries.",
-            icon="/public/summarization.svg",
-        ),
-        cl.Starter(
-            label="Concept Explainer",
-            message="Need help understanding a topic? Your Concept Explainer is here to assist.",
-            icon="/public/discussion.svg",
-        ),
-        cl.Starter(
-            label="Quiz Generator",
-            message="Ready to test your knowledge? Let the Quiz Generator create custom quizzes for you.",
-            icon="/public/quiz.svg",
-        ),
-        cl.Starter(
-            label="Text Translator",
-            message="Your Translator is here – easily convert text between languages.",
-            icon="/public/translating.svg"
-        ),
-        cl.Starter(
-            label="Definition Lookup",
-            message="Quick definitions at your fingertips – your Definition Assistant is here.",
-            icon="/public/definition.svg"
-        ),
-        cl.Starter(
-            label="Flashcard Generator",
-            message="Boost your memory with smart flashcards – generated just for you.",
-            icon="/public/flash-card.svg",
-        ),
-        cl.Starter(
-            label="Study Scheduler",
-            message="Plan smarter, not harder – your Study Scheduler is ready to help.",
-            icon="/public/time-management.svg",
-        ),
-        cl.Starter(
-            label="Code Explainer",
-            message="Confused by code? The Code Explainer is here to break it down for you.",
-            icon="/public/binary-code.svg",
-        ),
-        cl.Starter(
-            label="Math Solver",
-            message="Tackle math problems with confidence – your Math Solver is ready.",
-            icon="/public/calculating.svg"
-        ),
-        cl.Starter(
-            label="Research Assistant",
-            message="Meet your Research Assistant – here to support your research needs.",
-            icon="/public/search.svg",
-        ),
-    ]
+    return STARTERS
+
+def conversation_id() -> str:
+    # the thread id survives reconnects and is the same on every worker
+    return cl.context.session.thread_id
+
+async def load_session_state() -> tuple[HistoryManager, StudyContext]:
+    "This conversation's history and context, reloaded if another worker saved a newer version"
+    backend = get_state_backend()
+    state = cast(SessionState | None, cl.user_session.get("state"))
+    if state is not None and await backend.version(conversation_id()) == state.version:
+        return cl.user_session.get("history"), cl.user_session.get("context")
+
+    state = await backend.load(conversation_id()) or SessionState(settings={"chat_profile": cl.user_session.get("chat_profile")})
+    history = HistoryManager.from_dict(state.history)
+    context = StudyContext()
+    for ref in state.documents:
+        text = await backend.get_document(ref.digest)
+        if text is not None:
+            context.documents.add(ref.name, text)
+    cl.user_session.set("state", state)
+    cl.user_session.set("history", history)
+    cl.user_session.set("context", context)
+    return history, context
+
+async def save_session_state(history: HistoryManager, context: StudyContext):
+    backend = get_state_backend()
+    state = cast(SessionState, cl.user_session.get("state"))
+    # this turn's items, kept to re-append them if another worker saved in between
+    new_items = history.items[len(state.history.get("items", [])):]
+    saved = {ref.digest for ref in state.documents}
+    new_documents = []
+    for document in context.documents.documents.values():
+        if document.digest not in saved:
+            await backend.put_document(document.digest, document.text)
+            new_documents.append(DocumentRef(digest=document.digest, name=document.name))
+    state.documents += new_documents
+    state.history = history.to_dict()
+    stored = await save_turn(backend, conversation_id(), state, new_items, new_documents)
+    if stored is None:
+        logger.warning("Session state of %s kept changing concurrently, this turn was not saved", conversation_id())
+    if stored is not state:
+        # the stored state now has another worker's turns too; the next message reloads it
+        cl.user_session.set("state", None)
+
+async def check_input(agent: Agent, prompt: list, context: StudyContext):
+    "The triage agent's input guardrails, for turns answered without a Runner run that would apply them"
+    for guardrail in agent.input_guardrails:
+        result = await guardrail.run(agent, prompt, RunContextWrapper(context=context))
+        if result.output.tripwire_triggered:
+            raise InputGuardrailTripwireTriggered(result)
 
 @cl.on_chat_start
 async def start():
-    client = AsyncOpenAI(
-        api_key=secrets.gemini_api_key,
-        base_url=secrets.gemini_base_url,
-    )
-    set_default_openai_api("chat_completions")
-    set_default_openai_client(client)
-    set_tracing_disabled(True)
-    model = OpenAIChatCompletionsModel(
-        model=secrets.gemini_api_model,
-        openai_client=client,
-    )
-
-    summarizer_agent = Agent(
-        name="Text_Summarizer",
-        instructions="""
-                    Summarizes input text or the textual content of a supported file (PDF, DOCX, or TXT).
-
-                    - summarize the text in all formats like in bullets , points, neutral or plain
-                    - by default summarize the text in default format 
-                    - return the output in plain text
-                    - summarize the text in 3 to 5 lines if the text provided is of around 20 lines 
-                    - summarize to the precise and in one-fourth length of original text
-                    - if required length of summarized text can be increased or decreased
-                    - do not mix up the name of tool with other available tools
-                    - while summarizing the content always keep on the topic do not hallucinate anything from by yourself 
-                    """,
-        model=model,
-        handoff_description="Generates concise summaries from raw text or documents (PDF, DOCX, TXT) with customizable tone and length.",
-    )
-
-    explainer_agent = Agent(
-        name="Concept_Explainer",
-        instructions="""
-                    Explains a concept clearly and contextually, using either direct input or content extracted from a file.
-                    -if user uploads a file and ask for any concept from the file then explain it if file format is supported
-                    - if the file format is not supported then return a unsupported file error
-                    - explain concept in plain text and be on topic
-                    - always keep on the topic to explain concept which the user asked
-                    - do not hallucinate any other concept while explaining the one provided by user
-                    - do not mix the tool name with other and use the tool with the requirement of the user
-                    - use tool by the requirement of prompt provided by user
-                     """,
-        model=model,
-        handoff_description="Explains complex concepts from text or documents (PDF, DOCX, TXT) with adjustable depth and audience focus.",
-    )
-
-    quiz_generator_agent = Agent(
-        name="Quiz_Generator",
-        instructions="""
-                    Generates a customizable quiz on a given topic with flexible question count.
-                    - if user mention the difficulty then ok else take the difficulty as moderate by default
-                    - the default number of quiz generated is 10 at a time its a default value 
-                      if user requires the number of quiz more then this or less then user requirement takes precedence
-                    - the format of quiz should be like a statement with four available options and at the end of all the questions give 
-                      the right answers for every question with number of question
-                    - if user uploads a supported file and ask to generate quiz from it then generate quiz using uploaded file
-                    - if file format is unsupported then return a unsupported file error
-                    """,
-        model=model,
-        handoff_description="Generates quizzes on any topic with customizable difficulty, format, and flexible question count (default: 10)",
-    )
-
-    translator_agent = Agent(
-        name="Text_Translator",
-        instructions="""
-                    Translate the text from user input or from the supported files provided by the user.
-                    - never mixed the tool name with other tools
-                    - return the final translated result in plain text
-                    - if user uploads a supported format file to translate then translate into the user required file 
-                    - if file is unsupported then return an unsupported file format
-                    - Translation should be simple and in plain text do not include any source code in it
-                    """,
-        model=model,
-        handoff_description="Translates text or content from files (PDF, DOCX, TXT) into any target language with optional auto-detection.",
-    )
-
-    lookup_definition_agent = Agent(
-        name="Lookup_Definition_Agent",
-        instructions="""
-                    Retrieves clear, accurate definitions for terms or concepts, either from direct input or extracted from supported files.
-                    - Lookup for the definition of user specified words from supported files
-                    - Also can get definition directly from llm
-                    - if the definition of user specified word isn't in the file provided by user then ask the user to get it from llm 
-                    - if definition is got by llm give the most appropriate definition 
-                    - while getting definition from llm:
-                        return definition and also its source
-                    """,
-        model=model,
-        handoff_description="Finds accurate definitions from text or documents (PDF, DOCX, TXT) or directly get from llm, with optional context awareness and usage examples.",
-    )
-
-    flashcard_generator_agent = Agent(
-        name="FlashCard_Generator_Agent",
-        instructions="""
-                    Generates concise, effective flashcards for active recall and spaced repetition from user input or uploaded study materials.
-                    Functionality:
-                    - Accept text input or supported file types (PDF, DOCX, TXT) containing study material.
-                    - Automatically identify key concepts, definitions, formulas, or facts suitable for flashcards.
-                    - Generate flashcards in a "question → answer" format for maximum memory retention.
-                    - Ensure that each flashcard is focused, specific, and not overloaded with information.
-                    - Group flashcards by topic or section if possible for better organization.
-                    - Avoid duplicating content or generating cards from non-educational content.
-                    - If the file includes headings or sections, reflect that structure in the flashcards.
-                    - Ask the user if they prefer fill-in-the-blank, definition-based, or multiple-choice formats (optional).
-                    - Politely request clarification if the content is unclear or too vague for flashcard generation.
-                    Supported file types: `.pdf`, `.docx`, `.txt`
-                    """,
-        model=model,
-        handoff_description="Generates smart flashcards from topics or files (PDF, DOCX, TXT) in Q&A, cloze, or definition formats for effective studying.",
-    )
-
-    study_schedular_agent = Agent(
-        name="Study_Schedular_Agent",
-        instructions="""
-                Creates a personalized, goal-oriented study schedule based on user input or the content of an uploaded file.
-                Functionality:
-                - design the most effective and precise schedule tailored to the user's academic needs.
-                - collect relevant information from the user (e.g., subjects, goals, deadlines, availability) to generate an optimal schedule.
-                - By default, keep Sundays as rest/break days.
-                - If the user explicitly requests to include Sunday in the schedule, prioritize their preference.
-                - If the user uploads a lecture or class timetable, use that as the foundation and align the study schedule accordingly.
-                - Ensure the final schedule is practical, balanced, and achievable.
-                Supported file types: .pdf, .docx, .txt
-                """,
-        model=model,
-        handoff_description="Generates personalized study plans from goals or files, based on deadlines, availability, and custom preferences.",
-    )
-
-    code_explainer_agent = Agent(
-        name="Code_Explainer_Agent",
-        instructions="""
-                Provides clear, accurate explanations of code based on user input or uploaded files.
-                Functionality:
-                - Analyze and explain the purpose and logic of the code in simple, understandable terms.
-                - Support multiple programming languages such as Python, C++, JavaScript, and others.
-                - Accept direct code snippets or code files (e.g., `.py`, `.cpp`, `.js`, `.txt`) for analysis.
-                - automatically detect the language of the code if not specified by the user.
-                - break down complex logic, loops, conditions, and functions into step-by-step explanations.
-                - if the user provides a specific question about a section of the code, focus the explanation accordingly.
-                - Clearly differentiate between code comments, syntax, logic flow, and potential issues or optimizations.
-                - avoid guessing when the code is ambiguous — instead, ask the user for clarification.
-                - always debug the code or suggest the debugged code to user
-
-                Supported file types: `.py`, `.cpp`, `.js`, `.txt`, `.java`, `.c`
-                """,
-        model=model,
-        handoff_description="Explains and optionally debugs code from input or files (e.g., .py, .cpp, .js). Supports logic, structure, performance, or bug analysis.",
-    )
-
-    math_solver_agent = Agent(
-        name="Math_Problem_Solver",
-        instructions="""
-                    Solves math problems step-by-step, either from user input or extracted from uploaded files.
-
-                    Functionality:
-                    - Accept direct math questions (text) or files containing math problems (PDF, DOCX, TXT).
-                    - Accurately identify the type of math problem: algebra, calculus, trigonometry, arithmetic, statistics, geometry, etc.
-                    - Solve the problem with detailed, logical steps — not just the final answer.
-                    - Clearly explain formulas, substitutions, simplifications, and derivations used in solving.
-                    - Provide graph-based insights if needed (e.g., plotting functions or visualizing equations).
-                    - If the input contains multiple problems, handle them one at a time and provide clear separation.
-                    - If the file contains both theory and problems, focus only on solving the problems.
-                    - Politely ask for clarification if a problem is incomplete, ambiguous, or requires assumptions.
-
-                    Supported file types: `.pdf`, `.docx`, `.txt`
-                    """,
-        model=model,
-        handoff_description="Solves math problems with step-by-step reasoning, plotting, and support for algebra, calculus, linear algebra, and more.",
-    )
-
-    research_assistant_agent = Agent(
-        name = "Research_Assistant",
-        instructions="""
-                Helps users gather, organize, and summarize high-quality research materials on a given topic.
-
-                Functionality:
-                - Accepts research queries as direct input or extracts topics from uploaded files (PDF, DOCX, TXT).
-                - Searches for credible academic sources, journal articles, reports, and authoritative websites.
-                - Summarizes key findings, arguments, or data from retrieved sources in clear, concise language.
-                - Can highlight pros/cons, gaps in research, or areas for further investigation.
-                - Organizes results thematically or chronologically if needed.
-                - Supports generating brief literature reviews or annotated bibliographies.
-                - Can cite sources in standard formats (APA, MLA, Chicago) upon request.
-                - Handles interdisciplinary topics by identifying relevant cross-domain materials.
-                - If file input contains specific instructions (e.g., focus questions, constraints), integrates them into the research.
-                - Politely requests clarification if the topic is too broad, vague, or lacks context.
-                Supported file types: `.pdf`, `.docx`, `.txt`
-                """,
-                model=model,
-                handoff_description="Finds and summarizes credible sources to support deep research.",
-    )
-
-    agent = Agent(
-        name="StudyBuddyAI",
-        instructions="""You are a helpful and knowledgeable study assistant and uses available tools to give the most precise answers. 
-                    Your goal is to provide clear, precise, and well-informed answers to questions related to academic learning, technology, science, programming, and general knowledge.
-                    You are allowed to answer:
-                    - Developer info 
-                    - basic discussion 
-                    - Educational questions (e.g., "What is photosynthesis?", "What is AI?")
-                    - Technical or programming questions (e.g., "How do loops work in Python?")
-                    - Study-related topics from any academic field (e.g., math, history, biology)
-                    - Research-related or factual queries (e.g., "What is the capital of France?")
-                    - if the user asks anything about developer info then use the developer info tool and get the info using it
-                    You should politely decline to respond to:
-                    - Personal, social, or entertainment-focused topics
-                    - Inappropriate, harmful, or off-topic content
-                    - Requests unrelated to learning or educational growth
-                    Avoid mixing the name of tools and use the tools that user asks to use or by the requirement of the prompt provided
-                    by user.
-                    Stay helpful, focused, and safe.""",
-        model=model,
-        handoffs=[summarizer_agent,
-                  explainer_agent,
-                  quiz_generator_agent,
-                  translator_agent,
-                  lookup_definition_agent,
-                  code_explainer_agent,
-                  study_schedular_agent,
-                  math_solver_agent,
-                  flashcard_generator_agent,
-                  research_assistant_agent,],
-        tools=[developer_info],
-        input_guardrails=[malicious_intent_guardrail],
-        output_guardrails=[
-                           pii_output_guardrail,
-                           hallucination_output_guardrail,
-                           self_reference_output_guardrail,],
-    )
-
-    dev = Developer(
-        name="Muhammad Usman",
-        mail="muhammadusman5965etc@gmail.com",
-        github="https://github.com/MuhammadUsmanGM"
-    )
-
-    cl.user_session.set("dev", dev)
-    cl.user_session.set("agent",agent)
-    cl.user_session.set("history",[])
+    # the agent graph and client are shared; conversation state lives in the state backend
+    cl.user_session.set("agent", get_agent())
+    await load_session_state()
+
+async def text_deltas(result: RunResultStreaming, triage_agent: Agent | None = None) -> AsyncIterator[str]:
+    started = time.perf_counter()
+    async for chunk in result.stream_events():
+        if chunk.type == "raw_response_event" and isinstance(chunk.data, ResponseTextDeltaEvent):
+            yield chunk.data.delta
+        elif triage_agent is not None and chunk.type == "agent_updated_stream_event" and chunk.new_agent is not triage_agent:
+            # time spent before the triage agent handed off is what local routing saves
+            hop_ms = (time.perf_counter() - started) * 1000
+            router_stats.record_triage(hop_ms)
+            record_span("triage", hop_ms)
+            triage_agent = None
+    if triage_agent is not None:
+        router_stats.record_triage(None)
 
 @cl.on_message
 async def main(message: cl.Message):
+    trace = start_turn()
     agent = cast(Agent, cl.user_session.get("agent"))
-    history: list = cl.user_session.get("history") or []
-    dev = cl.user_session.get("dev")
+    history, context = await load_session_state()
+    # "/regenerate ..." skips the artifact cache for this request
+    regenerate, request = split_regenerate(message.content)
 
     def get_thinking_message():
         messages = [
@@ -380,66 +206,126 @@ async def main(message: cl.Message):
         ]
         return random.choice(messages)
 
-    file_content = None
+    uploads = []
     if message.elements:
-        uploaded_file = message.elements[0]
-        file_path = uploaded_file.path
-        file_name = uploaded_file.name
-        ext = os.path.splitext(file_name)[1].lower()
-
-        try:
-            if ext in [".txt", ".py", ".cpp", ".cc", ".csv"]:
-                with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                    file_content = f.read()
-
-            elif ext == ".docx":
-                from docx import Document
-                doc = Document(file_path)
-                file_content = "\n".join([para.text for para in doc.paragraphs])
-
-            elif ext == ".pdf":
-                from PyPDF2 import PdfReader
-                reader = PdfReader(file_path)
-                file_content = "\n".join(
-                    [page.extract_text() for page in reader.pages if page.extract_text()]
-                )
-
-            else:
-                await cl.Message(content=f"❌ Unsupported file type: {ext}").send()
-                return
-
-        except Exception as e:
-            await cl.Message(content=f"❌ Could not read file: {str(e)}").send()
+        # every attachment is read concurrently; results keep the attachment order
+        with span("extraction"):
+            uploads = await ingest_files([(element.name, element.path) for element in message.elements])
+        if len(uploads) > 1 or not all(upload.ok for upload in uploads):
+            await cl.Message(content=format_report(uploads)).send()
+        uploads = [upload for upload in uploads if upload.ok and upload.content]
+        if not uploads and not request.strip():
             return
 
     # 🧠 Thinking message to display while llm generating response
     thinking_msg = cl.Message(content=get_thinking_message())
     await thinking_msg.send()
 
+    # uploaded files are kept in the session's document store, not in history
+    new_documents = [context.documents.add(upload.name, upload.content) for upload in uploads]
+
     # added user input to history
     history.append({
         "role": "user",
-        "content": message.content + (f"\n\n[File Content]:\n{file_content}" if file_content else "")
+        "content": request + "".join(f"\n\n[Uploaded File]: {upload.name}" for upload in uploads)
     })
+    attachment = context.documents.context_for(request, new_documents)
+    response_msg = cl.Message(content="")
+    # deltas are batched so one websocket emit carries many tokens
+    stream = StreamBuffer(response_msg.stream_token)
+    result: RunResultStreaming | None = None
+    deltas: AsyncIterator[str] | None = None
 
     try:
-        # 🔁 Run agent with file-enhanced history
-        result = Runner.run_streamed(
-            starting_agent=agent,
-            input=history,
-            context=dev,
+        # older turns beyond the prompt budget are replaced by a rolling summary
+        await history.compact(reserve=estimate_tokens(attachment or ""))
+        history.record_turn(attachment)
+
+        # the pipelines only run on a new upload or a document the request points at
+        documents = context.documents.referenced(request, new_documents)
+        document_text = "\n\n".join(d.text for d in documents)
+        language = target_language(request)
+        summarize = len(document_text) > PIPELINE_MIN_CHARS and wants_summary(request)
+        translate = (
+            not summarize and language and len(document_text) > TRANSLATION_PIPELINE_MIN_CHARS and not translates_part(request)
         )
+        decision = route(request, STARTER_MESSAGES)
+        if summarize:
+            artifact_agent = merge_summarizer_agent
+        elif translate or not decision.agent_name:
+            artifact_agent = None
+        else:
+            artifact_agent = get_specialist(decision.agent_name)
+        session_documents = list(context.documents.documents.values())
+        key = artifact_key(artifact_agent, documents, request, session_documents) if artifact_agent else None
+        cached = None
+        if key and regenerate:
+            get_artifact_cache().stats.record_bypass()
+        elif key:
+            cached = await get_artifact_cache().get(key)
+
+        prompt = history.prompt(attachment)
+        if cached or summarize or translate:
+            # no Runner run applies the input guardrail to these, so it is checked before anything is served
+            await check_input(agent, prompt, context)
+
+        generation_started = time.perf_counter()
+        if cached:
+            # ♻️ the same artifact was already generated for this document
+            deltas = replay(cached)
+        elif summarize:
+            # 📄 documents larger than one prompt are summarized chunk by chunk
+            deltas = summarize_document(document_text, request)
+        elif translate:
+            # 🌐 long documents are translated in parallel segments, streamed in order
+            deltas = translate_document(document_text, language)
+        else:
+            # 🧭 clear requests skip the triage hop and go straight to the specialist
+            if decision.agent_name:
+                router_stats.record_direct(decision)
+                starting_agent = get_specialist(decision.agent_name)
+                # the triage agent's input guardrail still applies to the routed run
+                run_config = RunConfig(input_guardrails=agent.input_guardrails)
+            else:
+                starting_agent, run_config = agent, None
+
+            # 🔁 Run agent with file-enhanced history
+            result = Runner.run_streamed(
+                starting_agent=starting_agent,
+                input=prompt,
+                context=context,
+                run_config=run_config,
+            )
+            deltas = text_deltas(result, None if decision.agent_name else agent)
+
+        if result is None and not cached:
+            # 🛡️ pipeline output has no agent run whose output guardrails would check it afterwards;
+            # it is checked in larger windows, a whole summary usually in one
+            deltas = guard_stream(deltas, context, agent, window_chars=PIPELINE_WINDOW_CHARS)
+        elif STREAMING_GUARDRAILS and not cached:
+            # 🛡️ output guardrails check the response in windows while it streams
+            deltas = guard_stream(deltas, context, agent)
 
-        response_msg = cl.Message(content="")
         first_response = True
 
-        async for chunk in result.stream_events():
-            if chunk.type == "raw_response_event" and isinstance(chunk.data, ResponseTextDeltaEvent):
-                if first_response:
-                    await thinking_msg.remove()
-                    await response_msg.send()
-                    first_response = False
-                await response_msg.stream_token(chunk.data.delta)
+        async for delta in deltas:
+            if first_response:
+                record_span("ttft", (time.perf_counter() - generation_started) * 1000, source="cache" if cached else "model")
+                await thinking_msg.remove()
+                await response_msg.send()
+                first_response = False
+            await stream.push(delta)
+        await stream.close()
+        if result:
+            record_usage(result.last_agent.name, result.context_wrapper.usage)
+        if cached:
+            regenerate_action = cl.Action(name="regenerate", payload={"request": request}, label="🔄 Regenerate", icon="refresh-cw")
+            response_msg.actions = [regenerate_action]
+            await regenerate_action.send(for_id=response_msg.id)
+        elif key:
+            # pipeline runs read the whole document, so its size is a fair estimate of what they spent
+            tokens = result.context_wrapper.usage.total_tokens if result else estimate_tokens(document_text + response_msg.content)
+            await get_artifact_cache().put(key, artifact_agent.name, response_msg.content, tokens)
         #added llm response to history
         history.append({
             "role": "assistant",
@@ -448,15 +334,59 @@ async def main(message: cl.Message):
 
         cl.user_session.set("history", history)
         await response_msg.update()
+        await save_session_state(history, context)
+        # written by a background thread, so this never blocks the event loop
+        get_session_store().sync(conversation_id(), history.items)
+        finish_turn(trace, "cached" if cached else "ok")
+        if SHOW_TIMINGS:
+            await cl.Message(content=trace.breakdown(), author="Timings").send()
+
+    except InputGuardrailTripwireTriggered as e:
+        # drop the blocked turn so it is not replayed with later messages
+        history.pop()
+        cl.user_session.set("history", history)
+        await thinking_msg.remove()
+        await cl.Message(content=f"❌ An Error Occurred: {str(e)}").send()
+        finish_turn(trace, "input_blocked")
+
+    except OutputGuardrailTripwireTriggered as e:
+        # the response was cut off mid-stream; stop generating, withdraw what was shown and drop the turn
+        if result is not None:
+            result.cancel()
+        history.pop()
+        cl.user_session.set("history", history)
+        stream.discard()
+        notice = f"❌ Response stopped by the {e.guardrail_result.guardrail.get_name()} check."
+        if response_msg.content:
+            response_msg.content = notice
+            await response_msg.update()
+        else:
+            await thinking_msg.remove()
+            await cl.Message(content=notice).send()
+        finish_turn(trace, "output_blocked")
 
     except Exception as e:
         await thinking_msg.remove()
         await cl.Message(content=f"❌ An Error Occurred: {str(e)}").send()
-        print(f"Error: {e}")
+        logger.exception("Turn failed")
+        finish_turn(trace, "error")
+
+    finally:
+        if deltas is not None:
+            # a pipeline left suspended mid-stream would keep its LLM calls running
+            await deltas.aclose()
+        if result is not None and not result.is_complete:
+            # a turn given up on must not keep generating in the background and hold its scheduler slot
+            result.cancel()
+
+@cl.action_callback("regenerate")
+async def regenerate(action: cl.Action):
+    # ask again for an artifact that was served from the cache
+    await action.remove()
+    await main(cl.Message(content="/regenerate " + action.payload["request"]))
 
 @cl.on_chat_end
 async def end():
-    #saved chat history in a json file in root directory
-    history = cl.user_session.get("history") or []
-    with open("history.json","w") as f:
-        json.dump(history,f ,indent=4)
\ No newline at end of file
+    # queue any unsaved turns and mark the session as ended in the session store
+    history = cl.user_session.get("history")
+    get_session_store().end(conversation_id(), history.items if history else [])
\ No newline at end of file
@@ -0,0 +1,418 @@
+import ast
+import asyncio
+import math
+import operator
+import os
+import statistics
+from fractions import Fraction
+from typing import Literal
+
+from pydantic import BaseModel
+from agents import function_tool
+
+# Local, exact computation for Math_Problem_Solver. Expressions are parsed
+# with ast and only numbers, known names, arithmetic and whitelisted
+# functions are evaluated, so nothing the model writes can reach Python
+# itself. numpy is used for evaluating over a range and sympy, when it is
+# installed, for symbolic algebra and calculus.
+
+MAX_EXPRESSION_CHARS = 2000
+# about 3900 digits, below the int to str conversion limit
+MAX_INT_BITS = 13_000
+MAX_EXPONENT = 10_000
+MAX_FACTORIAL = 1000
+# round(x, n) builds 10^n, so n is capped like an exponent
+MAX_ROUND_DIGITS = 100
+# exact fractions with longer denominators are shown as decimals
+MAX_SHOWN_DENOMINATOR = 10**12
+MAX_GRID_POINTS = 100_000
+MAX_TABLE_ROWS = 25
+SYMBOLIC_TIMEOUT = float(os.getenv("STUDYBUDDY_SYMBOLIC_TIMEOUT", "10"))
+
+
+class MathError(ValueError):
+    pass
+
+
+def _whole(n, name: str, limit: int) -> int:
+    if n != int(n) or not 0 <= n <= limit:
+        raise MathError(f"{name} needs whole numbers from 0 to {limit}")
+    return int(n)
+
+
+def _factorial(n):
+    return math.factorial(_whole(n, "factorial", MAX_FACTORIAL))
+
+
+def _comb(n, k):
+    return math.comb(_whole(n, "comb", MAX_FACTORIAL), _whole(k, "comb", MAX_FACTORIAL))
+
+
+def _perm(n, k=None):
+    return math.perm(_whole(n, "perm", MAX_FACTORIAL), None if k is None else _whole(k, "perm", MAX_FACTORIAL))
+
+
+def _round(x, ndigits=None):
+    if ndigits is None:
+        return round(x)
+    if ndigits != int(ndigits) or abs(ndigits) > MAX_ROUND_DIGITS:
+        raise MathError(f"round needs a whole number of digits from -{MAX_ROUND_DIGITS} to {MAX_ROUND_DIGITS}")
+    return round(x, int(ndigits))
+
+
+def _log(x, base=None):
+    return math.log(x) if base is None else math.log(x, base)
+
+
+CONSTANTS = {"pi": math.pi, "e": math.e, "tau": math.tau, "inf": math.inf}
+SCALAR_FUNCTIONS = {
+    "sqrt": math.sqrt, "cbrt": lambda x: math.copysign(abs(x) ** (1 / 3), x),
+    "exp": math.exp, "log": _log, "ln": math.log, "log10": math.log10, "log2": math.log2,
+    "sin": math.sin, "cos": math.cos, "tan": math.tan, "asin": math.asin, "acos": math.acos, "atan": math.atan,
+    "atan2": math.atan2, "sinh": math.sinh, "cosh": math.cosh, "tanh": math.tanh,
+    "degrees": math.degrees, "radians": math.radians, "hypot": math.hypot,
+    "floor": math.floor, "ceil": math.ceil, "round": _round, "abs": abs,
+    "factorial": _factorial, "comb": _comb, "perm": _perm, "gcd": math.gcd, "lcm": math.lcm,
+    "min": min, "max": max, "sum": sum,
+}
+_BINARY = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.Pow: operator.pow,
+}
+_UNARY = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+
+
+def _vector_functions() -> dict:
+    import numpy as np
+
+    return {
+        "sqrt": np.sqrt, "cbrt": np.cbrt, "exp": np.exp, "log": np.log, "ln": np.log, "log10": np.log10,
+        "log2": np.log2, "sin": np.sin, "cos": np.cos, "tan": np.tan, "asin": np.arcsin, "acos": np.arccos,
+        "atan": np.arctan, "atan2": np.arctan2, "sinh": np.sinh, "cosh": np.cosh, "tanh": np.tanh,
+        "degrees": np.degrees, "radians": np.radians, "hypot": np.hypot, "floor": np.floor, "ceil": np.ceil,
+        "abs": np.abs,
+    }
+
+
+def _exact(value):
+    "Fractions with denominator 1 become ints, so comb, gcd and friends accept them"
+    if isinstance(value, Fraction) and value.denominator == 1:
+        return value.numerator
+    return value
+
+
+def _bits(value) -> int:
+    if isinstance(value, Fraction):
+        return max(value.numerator.bit_length(), value.denominator.bit_length())
+    return value.bit_length() if isinstance(value, int) else 0
+
+
+def _parse(source: str, mode: str) -> ast.AST:
+    if len(source) > MAX_EXPRESSION_CHARS:
+        raise MathError(f"expression is longer than {MAX_EXPRESSION_CHARS} characters")
+    try:
+        # students write powers as x^2
+        return ast.parse(source.strip().replace("^", "**"), mode=mode)
+    except SyntaxError as e:
+        raise MathError(f"cannot parse {source!r}: {e.msg}") from None
+
+
+def _evaluate(node: ast.AST, names: dict, functions: dict, exact: bool):
+    if isinstance(node, ast.Expression):
+        return _evaluate(node.body, names, functions, exact)
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        # decimals are kept exact, so 0.1 + 0.2 is 3/10
+        return _exact(Fraction(repr(node.value))) if exact and isinstance(node.value, float) else node.value
+    if isinstance(node, ast.Name):
+        if node.id in names:
+            return names[node.id]
+        raise MathError(f"unknown name {node.id!r}")
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [_evaluate(item, names, functions, exact) for item in node.elts]
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY:
+        return _UNARY[type(node.op)](_evaluate(node.operand, names, functions, exact))
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+        left = _evaluate(node.left, names, functions, exact)
+        right = _evaluate(node.right, names, functions, exact)
+        if isinstance(left, list) or isinstance(right, list):
+            # [0] * 10^9 would repeat the list instead of doing arithmetic
+            raise MathError("lists can only be passed to min, max and sum")
+        if isinstance(node.op, ast.Pow) and isinstance(right, int):
+            # checked before computing, 2^10^9 would otherwise run for minutes
+            if abs(right) > MAX_EXPONENT or _bits(left) * abs(right) > MAX_INT_BITS:
+                raise MathError("the result is too large")
+        if exact and isinstance(node.op, ast.Div) and isinstance(left, (int, Fraction)) and isinstance(right, (int, Fraction)):
+            result = Fraction(left) / Fraction(right)
+        else:
+            result = _BINARY[type(node.op)](left, right)
+        if _bits(result) > MAX_INT_BITS:
+            raise MathError("the result is too large")
+        return _exact(result)
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+        function = functions.get(node.func.id)
+        if function is None:
+            raise MathError(f"unknown function {node.func.id!r}")
+        args = [_evaluate(arg, names, functions, exact) for arg in node.args]
+        if node.func.id in ("min", "max", "sum"):
+            result = function(args[0] if len(args) == 1 and isinstance(args[0], list) else args)
+        else:
+            result = _exact(function(*args))
+        if _bits(result) > MAX_INT_BITS:
+            raise MathError("the result is too large")
+        return result
+    raise MathError(f"{type(node).__name__} is not allowed in an expression")
+
+
+def _format(value) -> str:
+    if isinstance(value, list):
+        return "[" + ", ".join(_format(v) for v in value) + "]"
+    if isinstance(value, Fraction):
+        if value.denominator == 1:
+            return str(value.numerator)
+        if value.denominator > MAX_SHOWN_DENOMINATOR:
+            return f"{float(value):.15g}"
+        return f"{value.numerator}/{value.denominator} (≈ {float(value):.12g})"
+    if isinstance(value, float):
+        return f"{value:.12g}"
+    return str(value)
+
+
+class Variable(BaseModel):
+    name: str
+    value: float
+
+
+def calculate_lines(expressions: list[str], variables: list[Variable] | None = None) -> str:
+    "Evaluates expressions and 'name = expression' assignments in order, exactly where possible"
+    names = dict(CONSTANTS)
+    for variable in variables or []:
+        names[variable.name] = _exact(Fraction(repr(variable.value))) if math.isfinite(variable.value) else variable.value
+    lines = []
+    for source in expressions:
+        try:
+            module = _parse(source, "exec")
+            for statement in module.body:
+                if isinstance(statement, ast.Assign) and len(statement.targets) == 1 and isinstance(statement.targets[0], ast.Name):
+                    value = _evaluate(statement.value, names, SCALAR_FUNCTIONS, exact=True)
+                    names[statement.targets[0].id] = value
+                    lines.append(f"{statement.targets[0].id} = {_format(value)}")
+                elif isinstance(statement, ast.Expr):
+                    lines.append(f"{ast.unparse(statement.value)} = {_format(_evaluate(statement.value, names, SCALAR_FUNCTIONS, exact=True))}")
+                else:
+                    raise MathError(f"{type(statement).__name__} is not allowed")
+        except (MathError, ArithmeticError, TypeError, ValueError, RecursionError) as e:
+            lines.append(f"{source}: error: {e}")
+    return "\n".join(lines)
+
+
+def tabulate(expression: str, variable: str, start: float, stop: float, points: int) -> str:
+    "Evaluates f(variable) on a grid with numpy: sample values, extrema, sign changes and the area"
+    import numpy as np
+
+    if not start < stop:
+        raise MathError("start has to be smaller than stop")
+    tree = _parse(expression, "eval")
+    if any(isinstance(node, (ast.List, ast.Tuple)) for node in ast.walk(tree)):
+        raise MathError("lists are not allowed in a function of one variable")
+    grid = np.linspace(start, stop, max(2, min(points, MAX_GRID_POINTS)))
+    names = {**CONSTANTS, variable: grid}
+    with np.errstate(all="ignore"):
+        values = np.asarray(_evaluate(tree, names, _vector_functions(), exact=False), dtype="float64")
+    if values.shape != grid.shape:
+        values = np.full(grid.shape, float(values))
+    finite = np.isfinite(values)
+    if not finite.any():
+        return f"{expression} is undefined on [{start:g}, {stop:g}]"
+
+    rows = np.unique(np.linspace(0, len(grid) - 1, min(MAX_TABLE_ROWS, len(grid))).round().astype(int))
+    lines = [f"{variable},{expression}"] + [f"{grid[i]:.6g},{values[i]:.10g}" for i in rows]
+    masked = np.where(finite, values, np.nan)
+    low, high = int(np.nanargmin(masked)), int(np.nanargmax(masked))
+    lines.append(f"minimum {values[low]:.10g} at {variable}={grid[low]:.6g}; maximum {values[high]:.10g} at {variable}={grid[high]:.6g}")
+    crossings = np.nonzero(finite[:-1] & finite[1:] & (np.sign(values[:-1]) * np.sign(values[1:]) < 0))[0]
+    roots = [grid[i] - values[i] * (grid[i + 1] - grid[i]) / (values[i + 1] - values[i]) for i in crossings[:20]]
+    roots += list(grid[values == 0][:20])
+    if roots:
+        lines.append(f"sign changes near {variable} = " + ", ".join(f"{r:.8g}" for r in sorted(roots)))
+    if finite.all():
+        area = float(np.sum((values[1:] + values[:-1]) * np.diff(grid)) / 2)
+        lines.append(f"area under the curve (trapezoid, {len(grid):,} points) = {area:.10g}")
+    else:
+        lines.append(f"{int((~finite).sum())} grid points are undefined, so no area is given")
+    return "\n".join(lines)
+
+
+def _modes(data: list[Fraction]) -> str:
+    modes = statistics.multimode(data)
+    if len(modes) == len(set(data)) and len(data) > 1:
+        return "none, every value occurs equally often"
+    return ", ".join(_format(m) for m in modes)
+
+
+def describe(values: list[float], paired: list[float] | None = None) -> str:
+    "Descriptive statistics of a list, plus correlation and a least-squares line against a paired list"
+    if not values:
+        raise MathError("no values given")
+    data = [Fraction(repr(v)) for v in values]
+    lines = [
+        f"n = {len(data)}",
+        f"sum = {_format(sum(data))}",
+        f"mean = {_format(statistics.mean(data))}",
+        f"median = {_format(statistics.median(data))}",
+        f"mode = {_modes(data)}",
+        f"min = {_format(min(data))}, max = {_format(max(data))}, range = {_format(max(data) - min(data))}",
+    ]
+    if len(data) > 1:
+        lines += [
+            f"population variance = {_format(statistics.pvariance(data))}, population std = {math.sqrt(statistics.pvariance(data)):.12g}",
+            f"sample variance = {_format(statistics.variance(data))}, sample std = {math.sqrt(statistics.variance(data)):.12g}",
+        ]
+        q1, q2, q3 = statistics.quantiles([float(v) for v in data], n=4, method="inclusive")
+        lines.append(f"quartiles (inclusive) Q1 = {q1:.12g}, Q2 = {q2:.12g}, Q3 = {q3:.12g}, IQR = {q3 - q1:.12g}")
+    if paired is not None:
+        if len(paired) != len(values) or len(values) < 2:
+            raise MathError("paired values need the same length as values, at least 2")
+        slope, intercept = statistics.linear_regression(values, paired)
+        lines += [
+            f"correlation r = {statistics.correlation(values, paired):.12g}",
+            f"least-squares line: paired = {slope:.12g} * value + {intercept:.12g}",
+        ]
+    return "\n".join(lines)
+
+
+SymbolicOperation = Literal["simplify", "expand", "factor", "solve", "differentiate", "integrate"]
+SYMBOLIC_FUNCTIONS = (
+    "sqrt", "cbrt", "exp", "log", "ln", "log10", "log2", "sin", "cos", "tan", "asin", "acos", "atan", "atan2",
+    "sinh", "cosh", "tanh", "floor", "ceil", "abs", "factorial",
+)
+_SYMBOLIC_NODES = (ast.Expression, ast.Constant, ast.Name, ast.BinOp, ast.UnaryOp, ast.Call, ast.Load, ast.operator, ast.unaryop)
+
+
+def _check_symbolic(text: str) -> None:
+    "sympy.parse_expr runs eval, so the text has to pass a whitelist first"
+    for node in ast.walk(_parse(text, "eval")):
+        if not isinstance(node, _SYMBOLIC_NODES):
+            raise MathError(f"{type(node).__name__} is not allowed in an expression")
+        # strings would be evaluated by parse_expr; bool is a subclass of int, so the type is compared
+        if isinstance(node, ast.Constant) and type(node.value) not in (int, float):
+            raise MathError(f"{node.value!r} is not a number")
+        if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and node.func.id in SYMBOLIC_FUNCTIONS):
+            raise MathError(f"only these functions can be used: {', '.join(SYMBOLIC_FUNCTIONS)}")
+        if isinstance(node, ast.Name) and node.id.startswith("_"):
+            raise MathError(f"unknown name {node.id!r}")
+
+
+def _approx(value) -> str:
+    try:
+        number = complex(value.evalf())
+    except (TypeError, ValueError):
+        return str(value)
+    if number.imag == 0:
+        return f"{value} (≈ {number.real:.12g})" if not value.is_Integer else str(value)
+    return f"{value} (≈ {number:.10g})"
+
+
+def symbolic(operation: str, expression: str, variable: str, lower: str | None, upper: str | None) -> str:
+    try:
+        import sympy
+    except ImportError:
+        return "Symbolic math is not available here (sympy is not installed); use calculate or tabulate_function instead."
+
+    sides = expression.split("=") if operation == "solve" else [expression]
+    if len(sides) > 2:
+        raise MathError("an equation can have only one '='")
+    for text in sides + [bound for bound in (lower, upper) if bound]:
+        _check_symbolic(text)
+
+    symbol = sympy.Symbol(variable)
+    local = {
+        variable: symbol, "e": sympy.E, "pi": sympy.pi, "ln": sympy.log, "abs": sympy.Abs,
+        "log10": lambda x: sympy.log(x, 10), "log2": lambda x: sympy.log(x, 2),
+    }
+
+    def parse(text: str):
+        return sympy.parse_expr(text.replace("^", "**"), local_dict=local)
+
+    expr = parse(sides[0]) - parse(sides[1]) if len(sides) == 2 else parse(sides[0])
+    if operation == "solve":
+        solutions = sympy.solve(expr, symbol)
+        return f"{variable} = " + ", ".join(_approx(s) for s in solutions) if solutions else "no solution"
+    if operation == "integrate":
+        if lower and upper:
+            return _approx(sympy.integrate(expr, (symbol, parse(lower), parse(upper))))
+        return f"{sympy.integrate(expr, symbol)} + C"
+    if operation == "differentiate":
+        return str(sympy.diff(expr, symbol))
+    return str({"simplify": sympy.simplify, "expand": sympy.expand, "factor": sympy.factor}[operation](expr))
+
+
+@function_tool("calculate")
+def calculate(expressions: list[str], variables: list[Variable] | None = None) -> str:
+    """Evaluates arithmetic exactly: fractions stay fractions and integers are never rounded.
+
+    Args:
+        expressions: Expressions or assignments evaluated in order, e.g. ["a = 17^3", "b = a / 12", "sqrt(b) + log(8, 2)"].
+            Allowed: + - * / // % ^, pi, e, and sqrt, cbrt, exp, log(x, base), ln, log10, log2, trigonometric and
+            hyperbolic functions (radians), degrees, radians, hypot, floor, ceil, round, abs, factorial, comb, perm,
+            gcd, lcm, min, max, sum.
+        variables: Values for names used in the expressions.
+    """
+    return calculate_lines(expressions, variables)
+
+
+@function_tool("tabulate_function")
+def tabulate_function(expression: str, variable: str = "x", start: float = -10.0, stop: float = 10.0, points: int = 1001) -> str:
+    """Evaluates a function of one variable over a range, vectorized: sample values, minimum and maximum, approximate
+    roots (sign changes) and the numerical area under the curve.
+
+    Args:
+        expression: The function, e.g. "x^3 - 2*x + 1".
+        variable: The variable name in the expression.
+        start: Start of the range.
+        stop: End of the range.
+        points: Number of grid points, at most 100000.
+    """
+    try:
+        return tabulate(expression, variable, start, stop, points)
+    except (MathError, ArithmeticError, TypeError, ValueError) as e:
+        return f"error: {e}"
+
+
+@function_tool("describe_data")
+def describe_data(values: list[float], paired: list[float] | None = None) -> str:
+    """Descriptive statistics of a list of numbers: mean, median, mode, variances, standard deviations, quartiles.
+    With a paired list of the same length, also the correlation and the least-squares line.
+
+    Args:
+        values: The data.
+        paired: Optional second variable, one value per entry in values.
+    """
+    try:
+        return describe(values, paired)
+    except (MathError, ArithmeticError, statistics.StatisticsError, ValueError) as e:
+        return f"error: {e}"
+
+
+@function_tool("solve_symbolic")
+async def solve_symbolic(
+    operation: SymbolicOperation, expression: str, variable: str = "x", lower: str | None = None, upper: str | None = None
+) -> str:
+    """Symbolic algebra and calculus.
+
+    Args:
+        operation: simplify, expand, factor, solve (expression may be an equation with one '='), differentiate or integrate.
+        expression: e.g. "x^2 - 5*x + 6 = 0" or "x^2*sin(x)".
+        variable: The variable to solve for, differentiate or integrate by.
+        lower: Lower bound for a definite integral, e.g. "0".
+        upper: Upper bound for a definite integral, e.g. "pi".
+    """
+    try:
+        # a timed out thread keeps running until sympy returns, but the turn goes on
+        return await asyncio.wait_for(asyncio.to_thread(symbolic, operation, expression, variable, lower, upper), SYMBOLIC_TIMEOUT)
+    except asyncio.TimeoutError:
+        return f"error: gave up after {SYMBOLIC_TIMEOUT:g} seconds; try tabulate_function for a numerical answer"
+    except Exception as e:
+        return f"error: {e}"
+
+
+MATH_TOOLS = [calculate, tabulate_function, describe_data, solve_symbolic]
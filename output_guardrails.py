@@ -1,12 +1,100 @@
+import asyncio
+import os
 from pydantic import BaseModel
-from agents import Agent, GuardrailFunctionOutput, RunContextWrapper, Runner, output_guardrail
+from agents import Agent, GuardrailFunctionOutput, RunContextWrapper, output_guardrail
 from my_secrets import Secrets
+from guardrail_cache import cache_key, instructions_version, run_cached
+from guardrail_prescreen import Verdict, screen_pii, screen_self_reference, stats as prescreen_stats
+from telemetry import timed
 
 secrets = Secrets()
 
+# check responses in windows while they stream instead of after the last token
+STREAMING_GUARDRAILS = os.getenv("STUDYBUDDY_STREAMING_GUARDRAILS", "1") != "0"
+# judge every check that needs the LLM in one structured-output call instead of one call per guardrail
+COMBINED_GUARDRAILS = os.getenv("STUDYBUDDY_COMBINED_GUARDRAILS", "1") != "0"
+# leave a check out of the list to switch it off
+OUTPUT_CHECKS = [c.strip() for c in os.getenv("STUDYBUDDY_OUTPUT_CHECKS", "pii,hallucination,self_reference").split(",") if c.strip()]
+
 class MessageOutput(BaseModel):
     response: str
 
+def _output_text(output: MessageOutput | str) -> str:
+    return output.response if isinstance(output, MessageOutput) else str(output)
+
+def allowed_contacts(ctx: RunContextWrapper) -> set[str]:
+    # the developer's own contact details are expected in developer_info answers
+    developer = getattr(ctx.context, "developer", None)
+    mail = getattr(developer, "mail", None)
+    return {mail} if mail else set()
+
+
+# All checks that need the LLM for a text are judged in one call. The
+# guardrails still run separately and trip separately; the ones judging the
+# same text share the call and each reads its own flag from the verdict.
+class CombinedCheckOutput(BaseModel):
+    contains_pii: bool
+    is_factually_inaccurate: bool
+    contains_self_reference: bool
+    is_developer_context: bool
+    reasoning: str
+
+CHECK_FLAGS = {"pii": "contains_pii", "hallucination": "is_factually_inaccurate", "self_reference": "contains_self_reference"}
+CHECK_RULES = {
+    "pii": "- contains_pii: the output contains PII like names, emails, or phone numbers. Ignore mock data, placeholders, and internal developer examples.",
+    "hallucination": "- is_factually_inaccurate: the response contains fabricated or unverified facts. Do not flag fictional examples or developer test strings.",
+    "self_reference": "- contains_self_reference: statements referring to the AI model itself (e.g., \"As an AI model...\"). Never flag answers to a user's question about AI. Ignore developer debug logs or internal technical references.",
+}
+
+_combined_agents: dict[frozenset[str], Agent] = {}
+_in_flight: dict[str, asyncio.Future] = {}
+
+def combined_agent(checks: frozenset[str]) -> Agent:
+    "The guardrail agent judging exactly these checks"
+    agent = _combined_agents.get(checks)
+    if agent is None:
+        names = [c for c in CHECK_FLAGS if c in checks]
+        rules = "\n".join(CHECK_RULES[c] for c in names)
+        agent = _combined_agents[checks] = Agent(
+            name=f"Output Guardrail ({', '.join(names)})",
+            instructions=f"""
+Check the output for each issue below and set its flag. Flags of checks not listed stay False.
+{rules}
+- is_developer_context: True if it's developer-focused or dev/test content.
+- reasoning: one or two sentences on the flags you set.
+""",
+            output_type=CombinedCheckOutput,
+            model=secrets.gemini_api_model,
+        )
+    return agent
+
+def _escalates(check: str, text: str, ctx: RunContextWrapper) -> bool:
+    if check == "pii":
+        return screen_pii(text, allowed_contacts(ctx)).verdict == Verdict.ESCALATE
+    if check == "self_reference":
+        return screen_self_reference(text).verdict == Verdict.ESCALATE
+    return True
+
+async def combined_verdict(ctx: RunContextWrapper, output: MessageOutput | str, check: str) -> CombinedCheckOutput:
+    "One verdict for every enabled check the local pre-screen cannot decide, shared by concurrent callers"
+    text = _output_text(output)
+    checks = frozenset(c for c in OUTPUT_CHECKS if c in CHECK_FLAGS and _escalates(c, text, ctx)) | {check}
+    agent = combined_agent(checks)
+    key = cache_key(agent.name, instructions_version(agent), output)
+    task = _in_flight.get(key)
+    if task is None:
+        task = _in_flight[key] = asyncio.ensure_future(run_cached(agent, output, ctx))
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    # one guardrail being cancelled must not cancel the call the others wait for
+    return await asyncio.shield(task)
+
+async def _llm_check(ctx: RunContextWrapper, output: MessageOutput | str, check: str, agent: Agent) -> BaseModel:
+    if not COMBINED_GUARDRAILS:
+        return await run_cached(agent, output, ctx)
+    verdict = await combined_verdict(ctx, output, check)
+    flag = CHECK_FLAGS[check]
+    return agent.output_type(**{flag: getattr(verdict, flag)}, is_developer_context=verdict.is_developer_context, reasoning=verdict.reasoning)
+
 
 # 1. PII
 class PIICheckOutput(BaseModel):
@@ -28,9 +116,16 @@ Return:
 )
 
 @output_guardrail
+@timed("output_guardrail", guardrail="pii")
 async def pii_output_guardrail(ctx: RunContextWrapper, agent: Agent, output: MessageOutput) -> GuardrailFunctionOutput:
-    result = await Runner.run(pii_agent, output, context=ctx.context)
-    data = result.final_output
+    screen = screen_pii(_output_text(output), allowed_contacts(ctx))
+    if screen.verdict != Verdict.ESCALATE:
+        prescreen_stats.record("pii", f"local_{screen.verdict.value}")
+        data = PIICheckOutput(contains_pii=screen.verdict == Verdict.FAIL, is_developer_context=False, reasoning=screen.reasoning)
+        return GuardrailFunctionOutput(output_info=data, tripwire_triggered=data.contains_pii)
+
+    prescreen_stats.record("pii", "llm")
+    data = await _llm_check(ctx, output, "pii", pii_agent)
     return GuardrailFunctionOutput(output_info=data, tripwire_triggered=data.contains_pii and not data.is_developer_context)
 
 # 2. Hallucination
@@ -53,9 +148,11 @@ Return:
 )
 
 @output_guardrail
+@timed("output_guardrail", guardrail="hallucination")
 async def hallucination_output_guardrail(ctx: RunContextWrapper, agent: Agent, output: MessageOutput) -> GuardrailFunctionOutput:
-    result = await Runner.run(hallucination_agent, output, context=ctx.context)
-    data = result.final_output
+    # factual accuracy has no reliable local signal, so it always goes to the LLM
+    prescreen_stats.record("hallucination", "llm")
+    data = await _llm_check(ctx, output, "hallucination", hallucination_agent)
     return GuardrailFunctionOutput(output_info=data, tripwire_triggered=data.is_factually_inaccurate and not data.is_developer_context)
 
 
@@ -80,7 +177,26 @@ Return:
 )
 
 @output_guardrail
+@timed("output_guardrail", guardrail="self_reference")
 async def self_reference_output_guardrail(ctx: RunContextWrapper, agent: Agent, output: MessageOutput) -> GuardrailFunctionOutput:
-    result = await Runner.run(self_reference_agent, output, context=ctx.context)
-    data = result.final_output
+    screen = screen_self_reference(_output_text(output))
+    if screen.verdict != Verdict.ESCALATE:
+        prescreen_stats.record("self_reference", f"local_{screen.verdict.value}")
+        data = SelfReferenceCheckOutput(contains_self_reference=screen.verdict == Verdict.FAIL, is_developer_context=False, reasoning=screen.reasoning)
+        return GuardrailFunctionOutput(output_info=data, tripwire_triggered=data.contains_self_reference)
+
+    prescreen_stats.record("self_reference", "llm")
+    data = await _llm_check(ctx, output, "self_reference", self_reference_agent)
     return GuardrailFunctionOutput(output_info=data, tripwire_triggered=data.contains_self_reference and not data.is_developer_context)
+
+
+# the guardrails of the checks switched on, for the triage agent and the streaming checks
+OUTPUT_GUARDRAILS = [
+    guardrail
+    for check, guardrail in (
+        ("pii", pii_output_guardrail),
+        ("hallucination", hallucination_output_guardrail),
+        ("self_reference", self_reference_output_guardrail),
+    )
+    if check in OUTPUT_CHECKS
+]
@@ -0,0 +1,98 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections.abc import AsyncIterator
+from concurrent.futures import ProcessPoolExecutor
+
+from disk_cache import CACHE_DIR as ROOT_CACHE_DIR
+
+# PDF text extraction with PyMuPDF. Page ranges are extracted in a process
+# pool so large documents never block the event loop, pages are yielded in
+# order as soon as they are ready, and results are cached on disk by file hash.
+
+CACHE_DIR = ROOT_CACHE_DIR / "pdf_pages"
+WORKERS = int(os.getenv("STUDYBUDDY_PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PAGES_PER_TASK = int(os.getenv("STUDYBUDDY_PDF_PAGES_PER_TASK", "16"))
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=WORKERS)
+    return _pool
+
+
+def _page_count(path: str) -> int:
+    import pymupdf
+
+    with pymupdf.open(path) as doc:
+        return doc.page_count
+
+
+def _extract_range(path: str, start: int, stop: int) -> list[str]:
+    import pymupdf
+
+    with pymupdf.open(path) as doc:
+        return [doc[i].get_text() for i in range(start, stop)]
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_cache(digest: str) -> list[str] | None:
+    cache_file = CACHE_DIR / f"{digest}.json"
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache(digest: str, pages: list[str]) -> None:
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = CACHE_DIR / f"{digest}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(pages, f, ensure_ascii=False)
+    os.replace(tmp, CACHE_DIR / f"{digest}.json")
+
+
+async def iter_pdf_pages(path: str) -> AsyncIterator[tuple[int, str]]:
+    "Yields (page number, text) in page order while later pages are still being extracted"
+    digest = await asyncio.to_thread(file_digest, path)
+    cached = await asyncio.to_thread(_read_cache, digest)
+    if cached is not None:
+        for number, text in enumerate(cached):
+            yield number, text
+        return
+
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    count = await loop.run_in_executor(pool, _page_count, path)
+    tasks = [
+        loop.run_in_executor(pool, _extract_range, path, start, min(start + PAGES_PER_TASK, count))
+        for start in range(0, count, PAGES_PER_TASK)
+    ]
+    pages: list[str] = []
+    try:
+        for task in tasks:
+            for text in await task:
+                yield len(pages), text
+                pages.append(text)
+    finally:
+        for task in tasks:
+            task.cancel()
+    await asyncio.to_thread(_write_cache, digest, pages)
+
+
+async def extract_pdf(path: str) -> str:
+    "Full text of a PDF, skipping pages without text"
+    # a blank line between pages keeps page boundaries visible to the chunkers
+    return "\n\n".join([text async for _, text in iter_pdf_pages(path) if text.strip()])
@@ -0,0 +1,382 @@
+import os
+import threading
+import time
+import tracemalloc
+import logging
+from dataclasses import dataclass, field
+
+import chainlit as cl
+from agents import (
+    Agent,
+    AsyncOpenAI,
+    OpenAIChatCompletionsModel,
+    set_default_openai_api,
+    set_default_openai_client,
+    set_tracing_disabled,
+    RunContextWrapper,
+    function_tool,
+)
+from openai import DefaultAsyncHttpxClient
+from input_guardrails import malicious_intent_guardrail
+from output_guardrails import OUTPUT_GUARDRAILS, STREAMING_GUARDRAILS
+from my_secrets import Secrets
+from document_store import DocumentStore, search_documents
+from tabular import query_table
+from llm_scheduler import scheduled_transport
+from math_tools import MATH_TOOLS
+from study_scheduler import plan_study_schedule
+
+logger = logging.getLogger(__name__)
+
+secrets = Secrets()
+
+# connection pool shared by every session of this worker process
+MAX_CONNECTIONS = int(os.getenv("STUDYBUDDY_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("STUDYBUDDY_MAX_KEEPALIVE_CONNECTIONS", "20"))
+
+@dataclass(frozen=True)
+class Developer:
+    name:str
+    mail:str
+    github:str
+
+DEVELOPER = Developer(
+    name="Muhammad Usman",
+    mail="muhammadusman5965etc@gmail.com",
+    github="https://github.com/MuhammadUsmanGM"
+)
+
+@dataclass
+class StudyContext:
+    "Per-session run context handed to the agents, tools and guardrails"
+    developer: Developer = DEVELOPER
+    # input guardrail verdicts for turns already judged in this session
+    turn_verdicts: dict = field(default_factory=dict)
+    documents: DocumentStore = field(default_factory=DocumentStore)
+
+@function_tool("developer_info")
+@cl.step(type="Developer Info")
+def developer_info(ctx: RunContextWrapper[StudyContext]) -> str:
+    "Returns the name, mail and github of the developer"
+    developer = ctx.context.developer
+    return f"Developer name: {developer.name}, Developer mail: {developer.mail}, Developer github: {developer.github}"
+
+
+@dataclass
+class RegistryStats:
+    build_ms: float = 0.0
+    graph_bytes: int = 0
+    sessions: int = 0
+
+    @property
+    def bytes_saved(self) -> int:
+        # every session after the first reuses the graph instead of rebuilding it
+        return self.graph_bytes * max(self.sessions - 1, 0)
+
+
+_lock = threading.Lock()
+_client: AsyncOpenAI | None = None
+_model: OpenAIChatCompletionsModel | None = None
+_agent: Agent | None = None
+stats = RegistryStats()
+
+
+def get_client() -> AsyncOpenAI:
+    "Returns the process-wide Gemini client, creating it (and the SDK defaults) on first use"
+    global _client
+    with _lock:
+        if _client is None:
+            _client = AsyncOpenAI(
+                api_key=secrets.gemini_api_key,
+                base_url=secrets.gemini_base_url,
+                # retries happen in the scheduler, where they respect the rate limits
+                max_retries=0,
+                http_client=DefaultAsyncHttpxClient(
+                    transport=scheduled_transport(MAX_CONNECTIONS, MAX_KEEPALIVE_CONNECTIONS),
+                ),
+            )
+            set_default_openai_api("chat_completions")
+            set_default_openai_client(_client)
+            set_tracing_disabled(True)
+        return _client
+
+
+def get_model() -> OpenAIChatCompletionsModel:
+    "Returns the chat completions model bound to the shared client"
+    global _model
+    client = get_client()
+    with _lock:
+        if _model is None:
+            _model = OpenAIChatCompletionsModel(
+                model=secrets.gemini_api_model,
+                openai_client=client,
+            )
+        return _model
+
+
+def get_agent() -> Agent:
+    "Returns the StudyBuddyAI triage agent, building the agent graph once per process"
+    global _agent
+    model = get_model()
+    with _lock:
+        if _agent is None:
+            tracing = tracemalloc.is_tracing()
+            if not tracing:
+                tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            started = time.perf_counter()
+            _agent = _build_agent_graph(model)
+            stats.build_ms = (time.perf_counter() - started) * 1000
+            stats.graph_bytes = max(tracemalloc.get_traced_memory()[0] - before, 0)
+            if not tracing:
+                tracemalloc.stop()
+            logger.info(
+                "Agent graph built in %.1f ms (~%.1f KiB, shared by all sessions)",
+                stats.build_ms, stats.graph_bytes / 1024,
+            )
+        stats.sessions += 1
+        logger.debug(
+            "Session %d reused the agent graph, ~%.1f KiB saved so far",
+            stats.sessions, stats.bytes_saved / 1024,
+        )
+        return _agent
+
+
+def get_specialist(name: str) -> Agent:
+    "Returns the specialist agent the triage agent would hand off to under this name"
+    specialist = next((h for h in (_agent or get_agent()).handoffs if h.name == name), None)
+    if specialist is None:
+        raise KeyError(name)
+    return specialist
+
+
+def _build_agent_graph(model: OpenAIChatCompletionsModel) -> Agent:
+    summarizer_agent = Agent(
+        name="Text_Summarizer",
+        instructions="""
+                    Summarizes input text or the textual content of a supported file (PDF, DOCX, or TXT).
+
+                    - summarize the text in all formats like in bullets , points, neutral or plain
+                    - by default summarize the text in default format 
+                    - return the output in plain text
+                    - summarize the text in 3 to 5 lines if the text provided is of around 20 lines 
+                    - summarize to the precise and in one-fourth length of original text
+                    - if required length of summarized text can be increased or decreased
+                    - do not mix up the name of tool with other available tools
+                    - while summarizing the content always keep on the topic do not hallucinate anything from by yourself 
+                    """,
+        model=model,
+        handoff_description="Generates concise summaries from raw text or documents (PDF, DOCX, TXT) with customizable tone and length.",
+    )
+
+    explainer_agent = Agent(
+        name="Concept_Explainer",
+        instructions="""
+                    Explains a concept clearly and contextually, using either direct input or content extracted from a file.
+                    -if user uploads a file and ask for any concept from the file then explain it if file format is supported
+                    - if the file format is not supported then return a unsupported file error
+                    - explain concept in plain text and be on topic
+                    - always keep on the topic to explain concept which the user asked
+                    - do not hallucinate any other concept while explaining the one provided by user
+                    - do not mix the tool name with other and use the tool with the requirement of the user
+                    - use tool by the requirement of prompt provided by user
+                    - if the user asks about an uploaded document, use the search_documents tool to find the relevant passages
+                     """,
+        model=model,
+        tools=[search_documents],
+        handoff_description="Explains complex concepts from text or documents (PDF, DOCX, TXT) with adjustable depth and audience focus.",
+    )
+
+    quiz_generator_agent = Agent(
+        name="Quiz_Generator",
+        instructions="""
+                    Generates a customizable quiz on a given topic with flexible question count.
+                    - if user mention the difficulty then ok else take the difficulty as moderate by default
+                    - the default number of quiz generated is 10 at a time its a default value 
+                      if user requires the number of quiz more then this or less then user requirement takes precedence
+                    - the format of quiz should be like a statement with four available options and at the end of all the questions give 
+                      the right answers for every question with number of question
+                    - if user uploads a supported file and ask to generate quiz from it then generate quiz using uploaded file
+                    - if file format is unsupported then return a unsupported file error
+                    """,
+        model=model,
+        handoff_description="Generates quizzes on any topic with customizable difficulty, format, and flexible question count (default: 10)",
+    )
+
+    translator_agent = Agent(
+        name="Text_Translator",
+        instructions="""
+                    Translate the text from user input or from the supported files provided by the user.
+                    - never mixed the tool name with other tools
+                    - return the final translated result in plain text
+                    - if user uploads a supported format file to translate then translate into the user required file 
+                    - if file is unsupported then return an unsupported file format
+                    - Translation should be simple and in plain text do not include any source code in it
+                    """,
+        model=model,
+        handoff_description="Translates text or content from files (PDF, DOCX, TXT) into any target language with optional auto-detection.",
+    )
+
+    lookup_definition_agent = Agent(
+        name="Lookup_Definition_Agent",
+        instructions="""
+                    Retrieves clear, accurate definitions for terms or concepts, either from direct input or extracted from supported files.
+                    - Lookup for the definition of user specified words from supported files
+                    - Also can get definition directly from llm
+                    - if the definition of user specified word isn't in the file provided by user then ask the user to get it from llm 
+                    - if definition is got by llm give the most appropriate definition 
+                    - while getting definition from llm:
+                        return definition and also its source
+                    - use the search_documents tool to look up the term in the files uploaded in this session
+                    """,
+        model=model,
+        tools=[search_documents],
+        handoff_description="Finds accurate definitions from text or documents (PDF, DOCX, TXT) or directly get from llm, with optional context awareness and usage examples.",
+    )
+
+    flashcard_generator_agent = Agent(
+        name="FlashCard_Generator_Agent",
+        instructions="""
+                    Generates concise, effective flashcards for active recall and spaced repetition from user input or uploaded study materials.
+                    Functionality:
+                    - Accept text input or supported file types (PDF, DOCX, TXT) containing study material.
+                    - Automatically identify key concepts, definitions, formulas, or facts suitable for flashcards.
+                    - Generate flashcards in a "question → answer" format for maximum memory retention.
+                    - Ensure that each flashcard is focused, specific, and not overloaded with information.
+                    - Group flashcards by topic or section if possible for better organization.
+                    - Avoid duplicating content or generating cards from non-educational content.
+                    - If the file includes headings or sections, reflect that structure in the flashcards.
+                    - Ask the user if they prefer fill-in-the-blank, definition-based, or multiple-choice formats (optional).
+                    - Politely request clarification if the content is unclear or too vague for flashcard generation.
+                    Supported file types: `.pdf`, `.docx`, `.txt`
+                    """,
+        model=model,
+        handoff_description="Generates smart flashcards from topics or files (PDF, DOCX, TXT) in Q&A, cloze, or definition formats for effective studying.",
+    )
+
+    study_schedular_agent = Agent(
+        name="Study_Schedular_Agent",
+        instructions="""
+                Creates a personalized, goal-oriented study schedule based on user input or the content of an uploaded file.
+                Functionality:
+                - design the most effective and precise schedule tailored to the user's academic needs.
+                - collect relevant information from the user (e.g., subjects, goals, deadlines, availability) to generate an optimal schedule.
+                - By default, keep Sundays as rest/break days.
+                - If the user explicitly requests to include Sunday in the schedule, prioritize their preference.
+                - If the user uploads a lecture or class timetable, use that as the foundation and align the study schedule accordingly.
+                - Ensure the final schedule is practical, balanced, and achievable.
+                - Never lay out the timetable yourself: collect the subjects with hours and deadlines, the availability, rest days and busy blocks, then call the plan_study_schedule tool. Pass the lectures of an uploaded timetable as busy blocks (use search_documents to read them) and leave rest_days out unless the user wants to study on Sundays or rest on other days.
+                - Present the schedule the tool returns as it is, with a short note on subjects that do not fit; call the tool again when the user changes a constraint.
+                Supported file types: .pdf, .docx, .txt
+                """,
+        model=model,
+        tools=[plan_study_schedule, search_documents],
+        handoff_description="Generates personalized study plans from goals or files, based on deadlines, availability, and custom preferences.",
+    )
+
+    code_explainer_agent = Agent(
+        name="Code_Explainer_Agent",
+        instructions="""
+                Provides clear, accurate explanations of code based on user input or uploaded files.
+                Functionality:
+                - Analyze and explain the purpose and logic of the code in simple, understandable terms.
+                - Support multiple programming languages such as Python, C++, JavaScript, and others.
+                - Accept direct code snippets or code files (e.g., `.py`, `.cpp`, `.js`, `.txt`) for analysis.
+                - automatically detect the language of the code if not specified by the user.
+                - break down complex logic, loops, conditions, and functions into step-by-step explanations.
+                - if the user provides a specific question about a section of the code, focus the explanation accordingly.
+                - Clearly differentiate between code comments, syntax, logic flow, and potential issues or optimizations.
+                - avoid guessing when the code is ambiguous — instead, ask the user for clarification.
+                - always debug the code or suggest the debugged code to user
+
+                Supported file types: `.py`, `.cpp`, `.js`, `.txt`, `.java`, `.c`
+                """,
+        model=model,
+        handoff_description="Explains and optionally debugs code from input or files (e.g., .py, .cpp, .js). Supports logic, structure, performance, or bug analysis.",
+    )
+
+    math_solver_agent = Agent(
+        name="Math_Problem_Solver",
+        instructions="""
+                    Solves math problems step-by-step, either from user input or extracted from uploaded files.
+
+                    Functionality:
+                    - Accept direct math questions (text) or files containing math problems (PDF, DOCX, TXT).
+                    - Accurately identify the type of math problem: algebra, calculus, trigonometry, arithmetic, statistics, geometry, etc.
+                    - Solve the problem with detailed, logical steps — not just the final answer.
+                    - Clearly explain formulas, substitutions, simplifications, and derivations used in solving.
+                    - Provide graph-based insights if needed (e.g., plotting functions or visualizing equations).
+                    - If the input contains multiple problems, handle them one at a time and provide clear separation.
+                    - If the file contains both theory and problems, focus only on solving the problems.
+                    - Politely ask for clarification if a problem is incomplete, ambiguous, or requires assumptions.
+                    - For an uploaded CSV or Excel table you only see its profile; use the query_table tool to compute statistics on the full data instead of estimating them.
+                    - Never do arithmetic in your head: compute every numeric step with the calculate tool (batch the steps of a problem in one call), use tabulate_function to evaluate or plot a function over a range, describe_data for statistics of a list of numbers and solve_symbolic for algebra, derivatives and integrals. Explain the steps around the tool results.
+
+                    Supported file types: `.pdf`, `.docx`, `.txt`, `.csv`, `.tsv`, `.xlsx`
+                    """,
+        model=model,
+        tools=[query_table, *MATH_TOOLS],
+        handoff_description="Solves math problems with step-by-step reasoning, plotting, and support for algebra, calculus, linear algebra, and more.",
+    )
+
+    research_assistant_agent = Agent(
+        name = "Research_Assistant",
+        instructions="""
+                Helps users gather, organize, and summarize high-quality research materials on a given topic.
+
+                Functionality:
+                - Accepts research queries as direct input or extracts topics from uploaded files (PDF, DOCX, TXT).
+                - Searches for credible academic sources, journal articles, reports, and authoritative websites.
+                - Summarizes key findings, arguments, or data from retrieved sources in clear, concise language.
+                - Can highlight pros/cons, gaps in research, or areas for further investigation.
+                - Organizes results thematically or chronologically if needed.
+                - Supports generating brief literature reviews or annotated bibliographies.
+                - Can cite sources in standard formats (APA, MLA, Chicago) upon request.
+                - Handles interdisciplinary topics by identifying relevant cross-domain materials.
+                - If file input contains specific instructions (e.g., focus questions, constraints), integrates them into the research.
+                - Politely requests clarification if the topic is too broad, vague, or lacks context.
+                - For an uploaded CSV or Excel dataset you only see its profile; use the query_table tool to filter and aggregate the full data.
+                Supported file types: `.pdf`, `.docx`, `.txt`, `.csv`, `.tsv`, `.xlsx`
+                """,
+                model=model,
+                tools=[query_table],
+                handoff_description="Finds and summarizes credible sources to support deep research.",
+    )
+
+    agent = Agent(
+        name="StudyBuddyAI",
+        instructions="""You are a helpful and knowledgeable study assistant and uses available tools to give the most precise answers. 
+                    Your goal is to provide clear, precise, and well-informed answers to questions related to academic learning, technology, science, programming, and general knowledge.
+                    You are allowed to answer:
+                    - Developer info 
+                    - basic discussion 
+                    - Educational questions (e.g., "What is photosynthesis?", "What is AI?")
+                    - Technical or programming questions (e.g., "How do loops work in Python?")
+                    - Study-related topics from any academic field (e.g., math, history, biology)
+                    - Research-related or factual queries (e.g., "What is the capital of France?")
+                    - if the user asks anything about developer info then use the developer info tool and get the info using it
+                    You should politely decline to respond to:
+                    - Personal, social, or entertainment-focused topics
+                    - Inappropriate, harmful, or off-topic content
+                    - Requests unrelated to learning or educational growth
+                    Avoid mixing the name of tools and use the tools that user asks to use or by the requirement of the prompt provided
+                    by user.
+                    Stay helpful, focused, and safe.""",
+        model=model,
+        handoffs=[summarizer_agent,
+                  explainer_agent,
+                  quiz_generator_agent,
+                  translator_agent,
+                  lookup_definition_agent,
+                  code_explainer_agent,
+                  study_schedular_agent,
+                  math_solver_agent,
+                  flashcard_generator_agent,
+                  research_assistant_agent,],
+        tools=[developer_info],
+        input_guardrails=[malicious_intent_guardrail],
+        # in streaming mode main() checks the response while it is generated instead
+        output_guardrails=[] if STREAMING_GUARDRAILS else OUTPUT_GUARDRAILS,
+    )
+
+    return agent
@@ -0,0 +1,128 @@
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass
+
+# Local routing in front of the StudyBuddyAI triage agent. Starter clicks and
+# messages that clearly name one task go straight to the specialist; anything
+# unclear still goes through the triage LLM hop.
+
+logger = logging.getLogger(__name__)
+
+CONFIDENCE_THRESHOLD = float(os.getenv("STUDYBUDDY_ROUTER_THRESHOLD", "0.75"))
+
+# cl.Starter label -> specialist agent name
+STARTER_AGENTS = {
+    "Text Summarizer": "Text_Summarizer",
+    "Concept Explainer": "Concept_Explainer",
+    "Quiz Generator": "Quiz_Generator",
+    "Text Translator": "Text_Translator",
+    "Definition Lookup": "Lookup_Definition_Agent",
+    "Flashcard Generator": "FlashCard_Generator_Agent",
+    "Study Scheduler": "Study_Schedular_Agent",
+    "Code Explainer": "Code_Explainer_Agent",
+    "Math Solver": "Math_Problem_Solver",
+    "Research Assistant": "Research_Assistant",
+}
+
+# (pattern, weight) intent rules per specialist
+INTENT_RULES: dict[str, list[tuple[re.Pattern, float]]] = {
+    "Text_Summarizer": [
+        (re.compile(r"\b(summar(y|ize|ise)|tl;?dr|condense|key points of)\b", re.I), 1.0),
+    ],
+    "Text_Translator": [
+        (re.compile(r"\btranslat\w*\b", re.I), 1.0),
+        (re.compile(r"\b(in|into|to) (urdu|english|arabic|french|spanish|german|chinese|hindi|japanese|turkish)\b", re.I), 0.4),
+    ],
+    "Quiz_Generator": [
+        (re.compile(r"\b(quiz|mcqs?|multiple[- ]choice questions?|test me)\b", re.I), 1.0),
+    ],
+    "FlashCard_Generator_Agent": [
+        (re.compile(r"\bflash ?cards?\b", re.I), 1.0),
+    ],
+    "Lookup_Definition_Agent": [
+        (re.compile(r"\b(define|definition of|meaning of)\b", re.I), 1.0),
+        (re.compile(r"^\s*what does \S+ mean\b", re.I), 0.8),
+    ],
+    "Study_Schedular_Agent": [
+        (re.compile(r"\b(study (plan|schedule|timetable)|schedule|timetable|revision plan)\b", re.I), 1.0),
+    ],
+    "Code_Explainer_Agent": [
+        (re.compile(r"\b(debug|this code|my code|code snippet|stack ?trace|traceback|compile error)\b", re.I), 1.0),
+        (re.compile(r"```|\bdef \w+\(|#include\b|\bpublic static void\b", re.I), 0.8),
+    ],
+    "Math_Problem_Solver": [
+        (re.compile(r"\b(solve|integrate|differentiate|derivative|integral|equation|simplify|factori[sz]e|limit of)\b", re.I), 1.0),
+        (re.compile(r"\d\s*[-+*/^=]\s*\d|\bx\s*[=^]", re.I), 0.5),
+    ],
+    "Research_Assistant": [
+        (re.compile(r"\b(research|literature review|sources on|citations?|bibliography|journal articles?)\b", re.I), 1.0),
+    ],
+    "Concept_Explainer": [
+        (re.compile(r"\b(explain|how does|why does|what is the difference between)\b", re.I), 0.8),
+    ],
+}
+
+# questions the triage agent answers itself with its own tools
+TRIAGE_ONLY_RE = re.compile(r"\b(developer|who (made|built|created) you|your (creator|github|mail|email))\b", re.I)
+
+
+@dataclass
+class Route:
+    agent_name: str | None
+    confidence: float
+    reason: str
+
+
+def route(message: str, starter_messages: dict[str, str] | None = None) -> Route:
+    "Picks a specialist for the message, or agent_name=None to fall back to LLM triage"
+    text = message.strip()
+    if starter_messages and text in starter_messages:
+        return Route(starter_messages[text], 1.0, "starter")
+    if TRIAGE_ONLY_RE.search(text):
+        return Route(None, 0.0, "triage tools")
+
+    scores = {
+        name: sum(weight for pattern, weight in rules if pattern.search(text))
+        for name, rules in INTENT_RULES.items()
+    }
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    (best, best_score), (_, runner_up) = ranked[0], ranked[1]
+    if best_score == 0:
+        return Route(None, 0.0, "no intent matched")
+    # confidence drops when another task matches almost as strongly, e.g. "summarize and translate"
+    confidence = round(min(best_score, 1.0) * (best_score - runner_up) / best_score, 3)
+    if confidence < CONFIDENCE_THRESHOLD:
+        return Route(None, confidence, f"unsure between {best} and {ranked[1][0]}")
+    return Route(best, confidence, "intent rules")
+
+
+class RouterStats:
+    "Routing decisions and an estimate of the triage latency they avoided"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.direct = 0
+        self.triage = 0
+        # moving average of the triage hop, measured on turns that used it
+        self.triage_ms = 0.0
+        self.saved_ms = 0.0
+
+    def record_triage(self, hop_ms: float | None) -> None:
+        with self._lock:
+            self.triage += 1
+            if hop_ms is not None:
+                self.triage_ms = hop_ms if not self.triage_ms else 0.8 * self.triage_ms + 0.2 * hop_ms
+
+    def record_direct(self, decision: Route) -> None:
+        with self._lock:
+            self.direct += 1
+            self.saved_ms += self.triage_ms
+            logger.info(
+                "Routed to %s locally (%s, confidence %.2f), saved ~%.0f ms of triage",
+                decision.agent_name, decision.reason, decision.confidence, self.triage_ms,
+            )
+
+
+stats = RouterStats()
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass, field
+
+# Conversation state kept outside the worker process, so any Chainlit worker
+# behind a load balancer can serve the next message of a conversation.
+
+STATE_DB_PATH = os.getenv("STUDYBUDDY_STATE_DB", "session_state.db")
+# saves retried after a conflict before the turn is given up
+SAVE_ATTEMPTS = int(os.getenv("STUDYBUDDY_STATE_SAVE_ATTEMPTS", "5"))
+
+
+@dataclass
+class DocumentRef:
+    digest: str
+    name: str
+
+
+@dataclass
+class SessionState:
+    history: dict = field(default_factory=dict)
+    documents: list[DocumentRef] = field(default_factory=list)
+    settings: dict = field(default_factory=dict)
+    # incremented on every save; used for optimistic concurrency
+    version: int = 0
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, payload: str) -> "SessionState":
+        data = json.loads(payload)
+        data["documents"] = [DocumentRef(**ref) for ref in data.get("documents", [])]
+        return cls(**data)
+
+
+class SessionStateBackend(ABC):
+    """Storage for session state and document text.
+
+    Implementations must be safe to share between processes. A Redis-like
+    backend maps this onto one key per session (WATCH/MULTI or a Lua script
+    for save) and one key per document digest.
+    """
+
+    @abstractmethod
+    async def version(self, session_id: str) -> int:
+        "Current version of the stored state, 0 if there is none"
+
+    @abstractmethod
+    async def load(self, session_id: str) -> SessionState | None:
+        ...
+
+    @abstractmethod
+    async def save(self, session_id: str, state: SessionState) -> bool:
+        "Stores the state if nobody saved since it was loaded; returns False on a conflict"
+
+    @abstractmethod
+    async def delete(self, session_id: str) -> None:
+        ...
+
+    @abstractmethod
+    async def put_document(self, digest: str, text: str) -> None:
+        ...
+
+    @abstractmethod
+    async def get_document(self, digest: str) -> str | None:
+        ...
+
+
+class SQLiteStateBackend(SessionStateBackend):
+    "Local backend on a SQLite file in WAL mode; processes on one host can share it"
+
+    def __init__(self, path: str = STATE_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS session_state (
+                    session_id TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    updated REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS documents (
+                    digest TEXT PRIMARY KEY,
+                    text TEXT NOT NULL
+                );
+            """)
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per worker thread; sqlite connections are not shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _version(self, session_id: str) -> int:
+        row = self._conn().execute("SELECT version FROM session_state WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def _load(self, session_id: str) -> SessionState | None:
+        row = self._conn().execute("SELECT payload FROM session_state WHERE session_id = ?", (session_id,)).fetchone()
+        return SessionState.from_json(row[0]) if row else None
+
+    def _save(self, session_id: str, state: SessionState) -> bool:
+        expected = state.version
+        state.version = expected + 1
+        conn = self._conn()
+        if expected == 0:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO session_state (session_id, payload, version, updated) VALUES (?, ?, ?, ?)",
+                (session_id, state.to_json(), state.version, time.time()),
+            )
+        else:
+            cursor = conn.execute(
+                "UPDATE session_state SET payload = ?, version = ?, updated = ? WHERE session_id = ? AND version = ?",
+                (state.to_json(), state.version, time.time(), session_id, expected),
+            )
+        if cursor.rowcount != 1:
+            state.version = expected
+            return False
+        return True
+
+    def _delete(self, session_id: str) -> None:
+        self._conn().execute("DELETE FROM session_state WHERE session_id = ?", (session_id,))
+
+    def _put_document(self, digest: str, text: str) -> None:
+        self._conn().execute("INSERT OR IGNORE INTO documents (digest, text) VALUES (?, ?)", (digest, text))
+
+    def _get_document(self, digest: str) -> str | None:
+        row = self._conn().execute("SELECT text FROM documents WHERE digest = ?", (digest,)).fetchone()
+        return row[0] if row else None
+
+    async def version(self, session_id: str) -> int:
+        return await asyncio.to_thread(self._version, session_id)
+
+    async def load(self, session_id: str) -> SessionState | None:
+        return await asyncio.to_thread(self._load, session_id)
+
+    async def save(self, session_id: str, state: SessionState) -> bool:
+        return await asyncio.to_thread(self._save, session_id, state)
+
+    async def delete(self, session_id: str) -> None:
+        await asyncio.to_thread(self._delete, session_id)
+
+    async def put_document(self, digest: str, text: str) -> None:
+        await asyncio.to_thread(self._put_document, digest, text)
+
+    async def get_document(self, digest: str) -> str | None:
+        return await asyncio.to_thread(self._get_document, digest)
+
+
+async def save_turn(
+    backend: SessionStateBackend,
+    session_id: str,
+    state: SessionState,
+    new_items: list,
+    new_documents: list[DocumentRef],
+    attempts: int = SAVE_ATTEMPTS,
+) -> SessionState | None:
+    "Saves a turn, re-applied to the reloaded state on a conflict; the stored state, or None if every attempt conflicted"
+    for _ in range(attempts):
+        if await backend.save(session_id, state):
+            return state
+        stored = await backend.load(session_id) or SessionState(settings=state.settings)
+        known = {ref.digest for ref in stored.documents}
+        stored.documents += [ref for ref in new_documents if ref.digest not in known]
+        stored.history = {**stored.history, "items": [*stored.history.get("items", []), *new_items]}
+        state = stored
+    return None
+
+
+_backend: SessionStateBackend | None = None
+
+
+def get_state_backend() -> SessionStateBackend:
+    global _backend
+    if _backend is None:
+        _backend = SQLiteStateBackend()
+    return _backend
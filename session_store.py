@@ -0,0 +1,151 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# Append-only conversation store. Turns are queued by the event loop and
+# written by one background thread in batched transactions to SQLite (WAL).
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.getenv("STUDYBUDDY_SESSION_DB", "sessions.db")
+BATCH_SIZE = int(os.getenv("STUDYBUDDY_SESSION_BATCH_SIZE", "256"))
+FLUSH_INTERVAL = float(os.getenv("STUDYBUDDY_SESSION_FLUSH_INTERVAL", "0.05"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    started REAL NOT NULL,
+    ended REAL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+"""
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class SessionStore:
+    "Conversation history of every session, written incrementally by a background writer"
+
+    def __init__(self, path: str = DB_PATH, batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        with _connect(path) as conn:
+            conn.executescript(SCHEMA)
+        self._queue: queue.Queue = queue.Queue()
+        # number of items of each live session that were already queued
+        self._synced: dict[str, int] = {}
+        self._reader = _connect(path)
+        self._reader_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._write_loop, name="session-store-writer", daemon=True)
+        self._writer.start()
+
+    def sync(self, session_id: str, items: list[dict]) -> None:
+        "Queues the items of a session that have not been written yet; never blocks"
+        start = self._synced.get(session_id)
+        if start is None:
+            start = 0
+            self._queue.put(("start", session_id, time.time()))
+        if start > len(items):
+            start = len(items)
+        now = time.time()
+        rows = []
+        for seq in range(start, len(items)):
+            item = items[seq]
+            content = item.get("content", "")
+            rows.append((
+                session_id,
+                seq,
+                item.get("role", "user"),
+                content if isinstance(content, str) else json.dumps(content, ensure_ascii=False),
+                now,
+            ))
+        if rows:
+            self._queue.put(("messages", rows))
+        self._synced[session_id] = len(items)
+
+    def end(self, session_id: str, items: list[dict]) -> None:
+        self.sync(session_id, items)
+        self._queue.put(("end", session_id, time.time()))
+        self._synced.pop(session_id, None)
+
+    def _load(self, session_id: str) -> list[dict]:
+        with self._reader_lock:
+            rows = self._reader.execute(
+                "SELECT role, content FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    async def load(self, session_id: str) -> list[dict]:
+        "History of a previous session in turn order"
+        return await asyncio.to_thread(self._load, session_id)
+
+    async def flush(self) -> None:
+        "Waits until everything queued so far is committed"
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        await asyncio.to_thread(done.wait)
+
+    def _write_loop(self) -> None:
+        conn = _connect(self.path)
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(conn, batch)
+            except Exception as e:
+                logger.error("Could not write %d session records: %s", len(batch), e)
+            for entry in batch:
+                if entry[0] == "flush":
+                    entry[1].set()
+
+    @staticmethod
+    def _write_batch(conn: sqlite3.Connection, batch: list[tuple]) -> None:
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO sessions (session_id, started) VALUES (?, ?)",
+                [entry[1:] for entry in batch if entry[0] == "start"],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO messages (session_id, seq, role, content, created) VALUES (?, ?, ?, ?, ?)",
+                [row for entry in batch if entry[0] == "messages" for row in entry[1]],
+            )
+            conn.executemany(
+                "UPDATE sessions SET ended = ? WHERE session_id = ?",
+                [(entry[2], entry[1]) for entry in batch if entry[0] == "end"],
+            )
+
+
+_store: SessionStore | None = None
+
+
+def get_session_store() -> SessionStore:
+    global _store
+    if _store is None:
+        _store = SessionStore()
+    return _store
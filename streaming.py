@@ -0,0 +1,79 @@
+import asyncio
+import os
+import time
+from collections.abc import Awaitable, Callable
+
+# Coalesces streamed text deltas so each websocket emit carries more text.
+# The first delta is emitted at once, so time-to-first-token is unchanged;
+# after that text is flushed by size or by age, whichever comes first.
+
+FLUSH_MS = float(os.getenv("STUDYBUDDY_STREAM_FLUSH_MS", "30"))
+FLUSH_CHARS = int(os.getenv("STUDYBUDDY_STREAM_FLUSH_CHARS", "256"))
+
+
+class StreamBuffer:
+    "Buffers deltas for emit(); push() per delta, close() once the stream ends"
+
+    def __init__(self, emit: Callable[[str], Awaitable], flush_ms: float = FLUSH_MS, flush_chars: int = FLUSH_CHARS):
+        self.emit = emit
+        self.window = flush_ms / 1000
+        self.flush_chars = flush_chars
+        self.emits = 0
+        self._buffer: list[str] = []
+        self._size = 0
+        self._first = True
+        self._last_flush = 0.0
+        self._timer: asyncio.TimerHandle | None = None
+        self._pending: asyncio.Task | None = None
+
+    async def push(self, delta: str) -> None:
+        if not delta:
+            return
+        if self._first or self.window <= 0:
+            self._first = False
+            self._last_flush = time.monotonic()
+            self.emits += 1
+            await self.emit(delta)
+            return
+
+        self._buffer.append(delta)
+        self._size += len(delta)
+        if self._size >= self.flush_chars or time.monotonic() - self._last_flush >= self.window:
+            await self.flush()
+        elif self._timer is None:
+            # make sure a pause in the model output does not hold text back longer than the window
+            delay = max(0.0, self._last_flush + self.window - time.monotonic())
+            self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        if self._buffer:
+            self._pending = asyncio.ensure_future(self.flush())
+
+    async def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+        # take the text before awaiting, so emits keep the order of the deltas
+        text = "".join(self._buffer)
+        self._buffer.clear()
+        self._size = 0
+        self._last_flush = time.monotonic()
+        self.emits += 1
+        await self.emit(text)
+
+    async def close(self) -> None:
+        await self.flush()
+        if self._pending is not None:
+            await self._pending
+            self._pending = None
+
+    def discard(self) -> None:
+        "Drops buffered text that was not emitted yet, e.g. when a response is withdrawn"
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._buffer.clear()
+        self._size = 0
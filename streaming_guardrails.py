@@ -0,0 +1,99 @@
+import asyncio
+import os
+from collections.abc import AsyncIterator
+
+from agents import Agent, OutputGuardrail, OutputGuardrailTripwireTriggered, RunContextWrapper
+from guardrail_prescreen import Verdict, screen_pii, screen_self_reference
+from output_guardrails import (
+                            OUTPUT_GUARDRAILS,
+                            allowed_contacts,
+                            pii_output_guardrail,
+                            self_reference_output_guardrail)
+
+# Output guardrails that run while the response is still being generated.
+# Text is checked in windows as it streams; only a short tail is held back
+# so the local pre-screen can see patterns that span deltas, and the stream
+# is cut off as soon as any check trips.
+
+WINDOW_CHARS = int(os.getenv("STUDYBUDDY_GUARDRAIL_WINDOW_CHARS", "1500"))
+# earlier text repeated at the start of each window so nothing is judged without its context
+OVERLAP_CHARS = int(os.getenv("STUDYBUDDY_GUARDRAIL_OVERLAP_CHARS", "200"))
+TAIL_CHARS = int(os.getenv("STUDYBUDDY_GUARDRAIL_TAIL_CHARS", "120"))
+# whole-document summaries and translations get one LLM check per this many characters
+PIPELINE_WINDOW_CHARS = int(os.getenv("STUDYBUDDY_PIPELINE_GUARDRAIL_WINDOW_CHARS", "12000"))
+# how far back a checked window reaches for the start of its paragraph
+PARAGRAPH_CHARS = 2000
+
+STREAM_GUARDRAILS: list[OutputGuardrail] = OUTPUT_GUARDRAILS
+
+# local checks that can trip before text is released, with the guardrail they belong to
+_LOCAL_SCREENS = [
+    (pii_output_guardrail, lambda text, ctx: screen_pii(text, allowed_contacts(ctx))),
+    (self_reference_output_guardrail, lambda text, ctx: screen_self_reference(text)),
+]
+
+
+async def guard_stream(
+    deltas: AsyncIterator[str],
+    context,
+    agent: Agent,
+    guardrails: list[OutputGuardrail] = STREAM_GUARDRAILS,
+    window_chars: int = WINDOW_CHARS,
+    tail_chars: int = TAIL_CHARS,
+) -> AsyncIterator[str]:
+    "Passes deltas through while checking them; raises OutputGuardrailTripwireTriggered to cut the stream"
+    ctx = RunContextWrapper(context=context)
+    pending: list[asyncio.Task] = []
+    text = ""
+    released = 0
+    checked = 0
+
+    def launch(window: str) -> None:
+        pending.extend(asyncio.create_task(guardrail.run(ctx, agent, window)) for guardrail in guardrails)
+
+    def raise_if_tripped() -> None:
+        for task in [t for t in pending if t.done()]:
+            pending.remove(task)
+            result = task.result()
+            if result.output.tripwire_triggered:
+                raise OutputGuardrailTripwireTriggered(result)
+
+    def paragraph_start(position: int) -> int:
+        # the screens tell a quoted or mid-sentence phrase from one the answer opens with
+        return max(text.rfind("\n", 0, position) + 1, position - PARAGRAPH_CHARS, 0)
+
+    async def screen_locally(window: str) -> None:
+        for guardrail, screen in _LOCAL_SCREENS:
+            if any(g is guardrail for g in guardrails) and screen(window, ctx).verdict == Verdict.FAIL:
+                # the guardrail decides this locally too, so this returns without an LLM call
+                result = await guardrail.run(ctx, agent, window)
+                if result.output.tripwire_triggered:
+                    raise OutputGuardrailTripwireTriggered(result)
+
+    try:
+        async for delta in deltas:
+            text += delta
+            raise_if_tripped()
+            if len(text) - checked >= window_chars:
+                launch(text[paragraph_start(max(0, checked - OVERLAP_CHARS)):])
+                checked = len(text)
+            release_to = len(text) - tail_chars
+            if release_to > released:
+                await screen_locally(text[paragraph_start(max(0, released - tail_chars)):len(text)])
+                yield text[released:release_to]
+                released = release_to
+
+        if checked < len(text):
+            launch(text[paragraph_start(max(0, checked - OVERLAP_CHARS)):])
+        await screen_locally(text[paragraph_start(max(0, released - tail_chars)):])
+        # only the last window is still being checked at this point
+        await asyncio.gather(*pending)
+        raise_if_tripped()
+        if released < len(text):
+            yield text[released:]
+    finally:
+        for task in pending:
+            task.cancel()
+        # the source stops with the stream, whether it was cut off or abandoned
+        if hasattr(deltas, "aclose"):
+            await deltas.aclose()
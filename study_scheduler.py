@@ -0,0 +1,304 @@
+import bisect
+import math
+import re
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from itertools import groupby
+from typing import Literal
+
+from pydantic import BaseModel
+from agents import function_tool
+
+# Deterministic study timetables for Study_Schedular_Agent. Free time is
+# the weekly availability minus rest days and busy blocks (lectures from an
+# uploaded timetable), cut into equal sessions. Sessions are handed out slot
+# by slot: every subject keeps an even pace towards its deadline, and when
+# the remaining slots before some deadline are exactly enough for the work
+# due by then, only those subjects are scheduled (earliest deadline first
+# stays feasible). A semester of hundreds of sessions takes milliseconds.
+
+MAX_DAYS = 400
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+Weekday = Literal["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+TIME_RE = re.compile(r"^\s*(\d{1,2})(?::(\d{2}))?\s*$")
+
+
+class ScheduleError(ValueError):
+    pass
+
+
+class StudySubject(BaseModel):
+    name: str
+    hours: float
+    # ISO date of the exam or due date; study ends the day before
+    deadline: str | None = None
+
+
+class TimeWindow(BaseModel):
+    # a weekday name, "daily", "weekdays", "weekends" or an ISO date
+    day: str
+    start: str
+    end: str
+    label: str = ""
+
+
+@dataclass(frozen=True)
+class Session:
+    day: date
+    start: int
+    end: int
+    subject: str
+
+
+@dataclass
+class Schedule:
+    start: date
+    end: date
+    session_minutes: int
+    sessions: list[Session] = field(default_factory=list)
+    needed: dict[str, int] = field(default_factory=dict)
+    deadlines: dict[str, date] = field(default_factory=dict)
+    free_slots: int = 0
+
+
+def _date(value: str, what: str) -> date:
+    try:
+        return date.fromisoformat(value.strip())
+    except ValueError:
+        raise ScheduleError(f"{what} {value!r} is not a date like 2025-03-14") from None
+
+
+def _minutes(value: str) -> int:
+    match = TIME_RE.match(value)
+    if not match or int(match.group(1)) > 24 or int(match.group(2) or 0) > 59:
+        raise ScheduleError(f"{value!r} is not a time like 17:30")
+    return min(int(match.group(1)) * 60 + int(match.group(2) or 0), 24 * 60)
+
+
+def _clock(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _matcher(spec: str):
+    "Which dates a window applies to"
+    key = spec.strip().lower()
+    if key in WEEKDAYS:
+        weekday = WEEKDAYS.index(key)
+        return lambda day: day.weekday() == weekday
+    if key in ("daily", "every day", "everyday"):
+        return lambda day: True
+    if key == "weekdays":
+        return lambda day: day.weekday() < 5
+    if key == "weekends":
+        return lambda day: day.weekday() >= 5
+    on = _date(spec, "day")
+    return lambda day: day == on
+
+
+def _intervals(windows: list[TimeWindow]) -> list[tuple]:
+    parsed = []
+    for window in windows:
+        start, end = _minutes(window.start), _minutes(window.end)
+        if end <= start:
+            raise ScheduleError(f"{window.day} {window.start}-{window.end} ends before it starts")
+        parsed.append((_matcher(window.day), start, end))
+    return parsed
+
+
+def _free(day: date, availability: list[tuple], busy: list[tuple]) -> list[tuple[int, int]]:
+    "Available minutes of one day minus the busy blocks, as sorted disjoint intervals"
+    free = sorted((start, end) for matches, start, end in availability if matches(day))
+    merged: list[list[int]] = []
+    for start, end in free:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    for matches, busy_start, busy_end in busy:
+        if not matches(day):
+            continue
+        cut = []
+        for start, end in merged:
+            if busy_end <= start or busy_start >= end:
+                cut.append([start, end])
+                continue
+            if start < busy_start:
+                cut.append([start, busy_start])
+            if busy_end < end:
+                cut.append([busy_end, end])
+        merged = cut
+    return [(start, end) for start, end in merged]
+
+
+def _slots(start: date, end: date, availability, busy, rest_days: set[int], session: int, pause: int, per_day: int):
+    slots = []
+    day = start
+    while day < end:
+        if day.weekday() not in rest_days:
+            count = 0
+            for window_start, window_end in _free(day, availability, busy):
+                t = window_start
+                while t + session <= window_end and count < per_day:
+                    slots.append((day, t, t + session))
+                    count += 1
+                    t += session + pause
+        day += timedelta(days=1)
+    return slots
+
+
+def build_schedule(
+    subjects: list[StudySubject],
+    availability: list[TimeWindow],
+    busy: list[TimeWindow] | None = None,
+    start_date: str | None = None,
+    end_date: str | None = None,
+    rest_days: list[str] | None = None,
+    session_minutes: int = 60,
+    break_minutes: int = 10,
+    max_hours_per_day: float = 6,
+) -> Schedule:
+    if not subjects:
+        raise ScheduleError("no subjects given")
+    if not availability:
+        raise ScheduleError("no availability given; ask when the student can study")
+    if not 15 <= session_minutes <= 240:
+        raise ScheduleError("sessions have to be 15 to 240 minutes long")
+    if not 0 <= break_minutes <= 240:
+        raise ScheduleError("breaks have to be 0 to 240 minutes long")
+    if not 0 < max_hours_per_day <= 24:
+        raise ScheduleError("the study hours per day have to be more than 0 and at most 24")
+    if len({s.name for s in subjects}) != len(subjects):
+        raise ScheduleError("subject names have to be unique")
+
+    start = _date(start_date, "start date") if start_date else date.today()
+    end = _date(end_date, "end date") if end_date else None
+    deadlines = {s.name: _date(s.deadline, f"deadline of {s.name}") for s in subjects if s.deadline}
+    if end is None:
+        if not deadlines:
+            raise ScheduleError("give an end date or a deadline for at least one subject")
+        end = max(deadlines.values())
+    if (end - start).days > MAX_DAYS:
+        raise ScheduleError(f"plans can cover at most {MAX_DAYS} days")
+    if end <= start:
+        raise ScheduleError("the plan ends before it starts")
+    for subject in subjects:
+        deadlines[subject.name] = min(deadlines.get(subject.name, end), end)
+    rest = set()
+    for name in ["sunday"] if rest_days is None else rest_days:
+        if name.strip().lower() not in WEEKDAYS:
+            raise ScheduleError(f"{name!r} is not a weekday")
+        rest.add(WEEKDAYS.index(name.strip().lower()))
+
+    per_day = int(max_hours_per_day * 60 // session_minutes)
+    if per_day < 1:
+        raise ScheduleError(f"one {session_minutes}-minute session is more than {max_hours_per_day:g} h a day; use shorter sessions")
+    slots = _slots(start, end, _intervals(availability), _intervals(busy or []), rest, session_minutes, break_minutes, per_day)
+    slot_days = [day for day, _, _ in slots]
+    # sessions of a subject can use the slots before its deadline, a prefix of the list
+    last = {name: bisect.bisect_left(slot_days, deadline) for name, deadline in deadlines.items()}
+    needed = {s.name: math.ceil(s.hours * 60 / session_minutes - 1e-9) for s in subjects}
+
+    # earliest deadlines first, cut what cannot fit
+    order = sorted(needed, key=lambda name: (deadlines[name], name))
+    used = 0
+    planned = {}
+    for name in order:
+        planned[name] = max(0, min(needed[name], last[name] - used))
+        used += planned[name]
+
+    schedule = Schedule(start, end, session_minutes, needed=needed, deadlines=deadlines)
+    done = dict.fromkeys(order, 0)
+    groups = [(last[names[0]], names) for names in (list(g) for _, g in groupby(order, key=deadlines.get))]
+    previous: Session | None = None
+    for i, (day, slot_start, slot_end) in enumerate(slots):
+        # the earliest deadline whose remaining work fills every slot left before it
+        limit = None
+        demand = 0
+        for slot_limit, names in groups:
+            demand += sum(planned[n] - done[n] for n in names)
+            if demand and demand >= slot_limit - i:
+                limit = slot_limit
+                break
+        best, best_key = None, None
+        for name in order:
+            if done[name] >= planned[name] or i >= last[name] or (limit is not None and last[name] > limit):
+                continue
+            # how far behind an even pace over its own slots the subject is after this one
+            lag = planned[name] * (i + 1) / last[name] - done[name]
+            if previous is not None and previous.day == day and previous.subject == name:
+                lag -= 0.25
+            key = (lag, -deadlines[name].toordinal())
+            if best_key is None or key > best_key:
+                best, best_key = name, key
+        if best is None or (limit is None and best_key[0] < 0.5):
+            schedule.free_slots += 1
+            continue
+        done[best] += 1
+        previous = Session(day, slot_start, slot_end, best)
+        schedule.sessions.append(previous)
+    return schedule
+
+
+def format_schedule(schedule: Schedule, rest_days: list[str] | None = None) -> str:
+    counts: dict[str, list[Session]] = {name: [] for name in schedule.needed}
+    for session in schedule.sessions:
+        counts[session.subject].append(session)
+    hours = schedule.session_minutes / 60
+    lines = [
+        f"Plan {schedule.start.isoformat()} to {(schedule.end - timedelta(days=1)).isoformat()}: "
+        f"{len(schedule.sessions)} sessions of {schedule.session_minutes} min, "
+        f"{schedule.free_slots} free slots left. Rest days: {', '.join(['sunday'] if rest_days is None else rest_days) or 'none'}.",
+        "",
+        "Subjects:",
+    ]
+    for name, sessions in counts.items():
+        line = f"- {name}: {len(sessions)} sessions ({len(sessions) * hours:g} h) before {schedule.deadlines[name].isoformat()}"
+        if len(sessions) < schedule.needed[name]:
+            line += f"; {(schedule.needed[name] - len(sessions)) * hours:g} h do not fit, add time or move the deadline"
+        lines.append(line)
+    lines += ["", "Schedule:"]
+    current = None
+    for session in schedule.sessions:
+        text = f"{_clock(session.start)}-{_clock(session.end)} {session.subject}"
+        if session.day != current:
+            current = session.day
+            lines.append(f"{session.day.strftime('%a')} {session.day.isoformat()}: {text}")
+        else:
+            lines[-1] += f"; {text}"
+    return "\n".join(lines)
+
+
+@function_tool("plan_study_schedule")
+def plan_study_schedule(
+    subjects: list[StudySubject],
+    availability: list[TimeWindow],
+    busy: list[TimeWindow] | None = None,
+    start_date: str | None = None,
+    end_date: str | None = None,
+    rest_days: list[Weekday] | None = None,
+    session_minutes: int = 60,
+    break_minutes: int = 10,
+    max_hours_per_day: float = 6,
+) -> str:
+    """Builds a conflict-free study timetable: no overlaps, nothing on rest days or during busy blocks, every
+    subject finished before its deadline and spread evenly up to it.
+
+    Args:
+        subjects: Each subject with the hours of study it needs and its exam or due date (YYYY-MM-DD).
+        availability: When the student can study, e.g. {"day": "weekdays", "start": "16:00", "end": "21:00"}.
+            day is a weekday name, "daily", "weekdays", "weekends" or a date.
+        busy: Blocks to keep free, such as lectures from an uploaded timetable, in the same form.
+        start_date: First day of the plan, YYYY-MM-DD; today if omitted.
+        end_date: Day after the last study day; the latest deadline if omitted.
+        rest_days: Days without study. Omit to rest on Sundays, give [] to study every day.
+        session_minutes: Length of one study session.
+        break_minutes: Break between two sessions in a row.
+        max_hours_per_day: Most study hours on one day.
+    """
+    try:
+        schedule = build_schedule(
+            subjects, availability, busy, start_date, end_date, rest_days, session_minutes, break_minutes, max_hours_per_day
+        )
+    except ScheduleError as e:
+        return f"error: {e}"
+    return format_schedule(schedule, rest_days)
@@ -0,0 +1,127 @@
+import asyncio
+import os
+import re
+from collections.abc import AsyncIterator
+
+from agents import Agent, Runner
+from openai.types.responses import ResponseTextDeltaEvent
+from my_secrets import Secrets
+from disk_cache import TextCache, text_key
+from document_store import split_chunks
+from telemetry import record_usage
+
+# Map-reduce summarization for documents that are too large for one prompt.
+# Chunks are summarized concurrently (map), partial summaries are merged in
+# rounds until they fit one request (reduce), and the last merge is streamed.
+
+secrets = Secrets()
+
+CHARS_PER_TOKEN = 4
+CHUNK_TOKENS = int(os.getenv("STUDYBUDDY_SUMMARY_CHUNK_TOKENS", "3000"))
+REDUCE_INPUT_TOKENS = int(os.getenv("STUDYBUDDY_SUMMARY_REDUCE_TOKENS", "6000"))
+CONCURRENCY = int(os.getenv("STUDYBUDDY_SUMMARY_CONCURRENCY", "4"))
+# documents above this size go through the pipeline instead of a single prompt
+PIPELINE_MIN_CHARS = int(os.getenv("STUDYBUDDY_SUMMARY_PIPELINE_MIN_CHARS", "12000"))
+MAX_SUMMARY_WORDS = int(os.getenv("STUDYBUDDY_MAX_SUMMARY_WORDS", "1500"))
+
+SUMMARY_REQUEST_RE = re.compile(r"\b(summar(y|ize|ise|izing|ising)|tl;?dr|condense)\b", re.IGNORECASE)
+
+chunk_summarizer_agent = Agent(
+    name="Chunk_Summarizer",
+    instructions="""
+                Summarizes one section of a longer document.
+                - summarize to the precise and in one-fourth length of the section
+                - keep headings, definitions, formulas and key facts
+                - return the output in plain text
+                - always keep on the topic do not hallucinate anything from by yourself
+                """,
+    model=secrets.gemini_api_model,
+)
+
+merge_summarizer_agent = Agent(
+    name="Summary_Merger",
+    instructions="""
+                Combines partial summaries of consecutive sections of one document into a single summary.
+                - keep the order of the sections and remove repetition
+                - follow the format and length the user asked for, otherwise aim for the given word count
+                - return the output in plain text
+                - do not add anything that is not in the partial summaries
+                """,
+    model=secrets.gemini_api_model,
+)
+
+_cache = TextCache("summaries")
+
+
+def wants_summary(request: str) -> bool:
+    return bool(SUMMARY_REQUEST_RE.search(request))
+
+
+def _version(agent: Agent) -> str:
+    return text_key(agent.name, str(agent.instructions), str(agent.model))[:12]
+
+
+async def _summarize(agent: Agent, prompt: str, semaphore: asyncio.Semaphore) -> str:
+    "One cached summarization call; identical input is never sent twice"
+    key = text_key(_version(agent), prompt)
+    cached = await asyncio.to_thread(_cache.get, key)
+    if cached is not None:
+        return cached
+    async with semaphore:
+        result = await Runner.run(agent, prompt)
+    record_usage(agent.name, result.context_wrapper.usage)
+    summary = str(result.final_output)
+    await asyncio.to_thread(_cache.set, key, summary)
+    return summary
+
+
+def _group(parts: list[str], max_chars: int) -> list[list[str]]:
+    groups: list[list[str]] = [[]]
+    size = 0
+    for part in parts:
+        if groups[-1] and size + len(part) > max_chars:
+            groups.append([])
+            size = 0
+        groups[-1].append(part)
+        size += len(part)
+    return groups
+
+
+def _merge_prompt(request: str, parts: list[str], target_words: int) -> str:
+    sections = "\n\n".join(f"[Part {i + 1}]\n{part}" for i, part in enumerate(parts))
+    return f"User request: {request}\nTarget length: about {target_words} words\n\n{sections}"
+
+
+async def summarize_document(text: str, request: str, concurrency: int = CONCURRENCY) -> AsyncIterator[str]:
+    "Streams the summary of a large document as text deltas"
+    semaphore = asyncio.Semaphore(concurrency)
+    chunks = split_chunks(text, CHUNK_TOKENS * CHARS_PER_TOKEN, 0)
+    # one-fourth of the original, capped so a whole textbook still gets a readable summary
+    target_words = max(50, min(len(text.split()) // 4, MAX_SUMMARY_WORDS))
+
+    # map: chunk summaries are cached by chunk content, so an edited document only redoes changed chunks
+    parts = await asyncio.gather(*(_summarize(chunk_summarizer_agent, chunk, semaphore) for chunk in chunks))
+
+    # reduce: merge neighbouring partial summaries until everything fits one request
+    max_chars = REDUCE_INPUT_TOKENS * CHARS_PER_TOKEN
+    while len(parts) > 1 and sum(len(p) for p in parts) > max_chars:
+        groups = _group(parts, max_chars)
+        if len(groups) == len(parts):
+            # every part is already too large to pair up; merge them two at a time
+            groups = [parts[i:i + 2] for i in range(0, len(parts), 2)]
+        group_words = max(50, target_words * 2 // len(groups))
+        parts = await asyncio.gather(*(
+            _summarize(merge_summarizer_agent, _merge_prompt(request, group, group_words), semaphore)
+            for group in groups
+        ))
+
+    result = Runner.run_streamed(merge_summarizer_agent, _merge_prompt(request, list(parts), target_words))
+    try:
+        async for event in result.stream_events():
+            if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+                yield event.data.delta
+    finally:
+        if not result.is_complete:
+            # the turn was abandoned; stop the merge and free its scheduler slot
+            result.cancel()
+    record_usage(merge_summarizer_agent.name, result.context_wrapper.usage)
@@ -0,0 +1,333 @@
+import asyncio
+import os
+import re
+import shutil
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Literal
+
+from pydantic import BaseModel
+from agents import RunContextWrapper, function_tool
+from disk_cache import CACHE_DIR as ROOT_CACHE_DIR
+from pdf_extractor import file_digest
+
+# CSV and Excel uploads. Instead of pasting every row into the prompt, the
+# file is read in chunks into a compact profile (schema, dtypes, summary
+# statistics, a few sample rows) and kept on disk, where the query_table
+# tool runs filters and aggregations on the full data with pandas.
+# pandas is imported inside the functions, only once a table is uploaded.
+
+CACHE_DIR = ROOT_CACHE_DIR / "tables"
+CHUNK_ROWS = int(os.getenv("STUDYBUDDY_TABLE_CHUNK_ROWS", "100000"))
+SAMPLE_ROWS = 5
+MAX_PROFILE_COLUMNS = 50
+# distinct values counted per text column before the counts become a partial top list
+MAX_DISTINCT = 10000
+TOP_VALUES = 5
+MAX_RESULT_ROWS = 50
+MAX_CACHED_FRAMES = 2
+
+TABLE_HEADER_RE = re.compile(r"^\[Table id=(\w+)\]")
+AGGREGATION_RE = re.compile(r"^\s*(\w+)\s*\(\s*(\*|[^)]+?)\s*\)\s*$")
+AGGREGATIONS = ("count", "sum", "mean", "median", "min", "max", "std", "nunique")
+
+
+@dataclass
+class ColumnProfile:
+    name: str
+    dtype: str = ""
+    non_null: int = 0
+    numeric: bool = True
+    count: int = 0
+    total: float = 0.0
+    total_sq: float = 0.0
+    low: float = float("inf")
+    high: float = float("-inf")
+    values: Counter = field(default_factory=Counter)
+    partial: bool = False
+
+    def update(self, series) -> None:
+        import pandas as pd
+
+        dtype = str(series.dtype)
+        if self.dtype and self.dtype != dtype:
+            # chunks are typed independently, e.g. a later chunk has text in a numeric column
+            both_numeric = self.numeric and pd.api.types.is_numeric_dtype(series)
+            dtype = "float64" if both_numeric else "object"
+        self.dtype = dtype
+        values = series.dropna()
+        self.non_null += len(values)
+        numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+        if self.numeric and numeric:
+            floats = values.astype("float64")
+            if len(floats):
+                self.count += len(floats)
+                self.total += float(floats.sum())
+                self.total_sq += float((floats * floats).sum())
+                self.low = min(self.low, float(floats.min()))
+                self.high = max(self.high, float(floats.max()))
+            return
+        self.numeric = False
+        for value, count in values.astype(str).value_counts().items():
+            if value in self.values or len(self.values) < MAX_DISTINCT:
+                self.values[value] += count
+            else:
+                self.partial = True
+
+    def describe(self) -> str:
+        head = f"- {self.name} ({self.dtype}, {self.non_null:,} non-null)"
+        if self.numeric and self.count:
+            mean = self.total / self.count
+            variance = max(0.0, (self.total_sq - self.total * mean) / (self.count - 1)) if self.count > 1 else 0.0
+            return f"{head}: mean {mean:,.4g}, std {variance ** 0.5:,.4g}, min {self.low:,.4g}, max {self.high:,.4g}"
+        if self.numeric:
+            return head
+        distinct = f"{len(self.values):,}{'+' if self.partial else ''} distinct"
+        top = "; ".join(f"{value[:40]} {count:,}" for value, count in self.values.most_common(TOP_VALUES))
+        return f"{head}, {distinct}: {top}"
+
+
+def _profile(table_id: str, chunks) -> str:
+    rows = 0
+    columns: dict[str, ColumnProfile] = {}
+    sample = None
+    for chunk in chunks:
+        if sample is None:
+            sample = chunk.head(SAMPLE_ROWS)
+        rows += len(chunk)
+        for name in chunk.columns:
+            column = columns.get(str(name))
+            if column is None:
+                column = columns[str(name)] = ColumnProfile(name=str(name))
+            column.update(chunk[name])
+
+    lines = [
+        f"[Table id={table_id}] {rows:,} rows x {len(columns)} columns",
+        f"Only this profile is shown. Use the query_table tool with table=\"{table_id}\" to filter or aggregate the full data.",
+        "",
+        "Columns:",
+    ]
+    lines += [column.describe() for column in list(columns.values())[:MAX_PROFILE_COLUMNS]]
+    if len(columns) > MAX_PROFILE_COLUMNS:
+        lines.append(f"- ... {len(columns) - MAX_PROFILE_COLUMNS} more columns")
+    if sample is not None and len(sample):
+        lines += ["", f"Sample (first {len(sample)} rows):", sample.to_csv(index=False).strip()]
+    return "\n".join(lines)
+
+
+def _table_id(path: str) -> str:
+    return file_digest(path)[:16]
+
+
+def _stored(table_id: str):
+    return CACHE_DIR / f"{table_id}.csv"
+
+
+def _profile_csv(path: str, sep: str) -> str:
+    import pandas as pd
+
+    table_id = _table_id(path)
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    target = _stored(table_id)
+    tmp = CACHE_DIR / f"{table_id}.{os.getpid()}.tmp"
+    with pd.read_csv(path, sep=sep, chunksize=CHUNK_ROWS, low_memory=False) as reader:
+        if sep == ",":
+            profile = _profile(table_id, reader)
+            shutil.copyfile(path, tmp)
+        else:
+            # stored as CSV so the tool reads every table the same way
+            def converted():
+                for number, chunk in enumerate(reader):
+                    chunk.to_csv(tmp, mode="w" if number == 0 else "a", header=number == 0, index=False)
+                    yield chunk
+
+            profile = _profile(table_id, converted())
+    os.replace(tmp, target)
+    return profile
+
+
+def _profile_excel(path: str) -> str:
+    import pandas as pd
+
+    try:
+        # Excel cannot be read in chunks; the first sheet is read at once
+        frame = pd.read_excel(path, sheet_name=0)
+    except ImportError as e:
+        raise RuntimeError("Excel files need the openpyxl package; save the sheet as CSV instead") from e
+    table_id = _table_id(path)
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = CACHE_DIR / f"{table_id}.{os.getpid()}.tmp"
+    frame.to_csv(tmp, index=False)
+    os.replace(tmp, _stored(table_id))
+    return _profile(table_id, [frame])
+
+
+async def extract_csv(path: str) -> str:
+    return await asyncio.to_thread(_profile_csv, path, ",")
+
+
+async def extract_tsv(path: str) -> str:
+    return await asyncio.to_thread(_profile_csv, path, "\t")
+
+
+async def extract_excel(path: str) -> str:
+    return await asyncio.to_thread(_profile_excel, path)
+
+
+class TableFilter(BaseModel):
+    column: str
+    op: Literal["==", "!=", ">", ">=", "<", "<=", "contains", "in", "is_null", "not_null"]
+    # compared as a number for numeric columns; comma separated for "in"
+    value: str
+
+
+_frames: OrderedDict[tuple[str, tuple[str, ...] | None], object] = OrderedDict()
+_frames_lock = threading.Lock()
+
+
+def _load(table_id: str, columns: list[str] | None):
+    "The stored table, only the needed columns, with the last few frames kept in memory"
+    import pandas as pd
+
+    key = (table_id, tuple(sorted(columns)) if columns else None)
+    with _frames_lock:
+        if key in _frames:
+            _frames.move_to_end(key)
+            return _frames[key]
+    frame = pd.read_csv(_stored(table_id), usecols=columns or None, low_memory=False)
+    with _frames_lock:
+        _frames[key] = frame
+        while len(_frames) > MAX_CACHED_FRAMES:
+            _frames.popitem(last=False)
+    return frame
+
+
+def _mask(frame, condition: TableFilter):
+    import pandas as pd
+
+    column = frame[condition.column]
+    if condition.op == "is_null":
+        return column.isna()
+    if condition.op == "not_null":
+        return column.notna()
+    if condition.op == "contains":
+        return column.astype(str).str.contains(condition.value, case=False, regex=False, na=False)
+
+    numeric = pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column)
+    parse = float if numeric else str
+    if condition.op == "in":
+        return column.isin([parse(v.strip()) for v in condition.value.split(",")])
+    value = parse(condition.value)
+    if not numeric:
+        column = column.astype(str)
+    return {
+        "==": column.__eq__, "!=": column.__ne__, ">": column.__gt__,
+        ">=": column.__ge__, "<": column.__lt__, "<=": column.__le__,
+    }[condition.op](value)
+
+
+def run_query(
+    table_id: str,
+    filters: list[TableFilter],
+    group_by: list[str],
+    aggregations: list[str],
+    sort_by: str | None,
+    descending: bool,
+    limit: int,
+) -> str:
+    import pandas as pd
+
+    parsed = []
+    for spec in aggregations:
+        match = AGGREGATION_RE.match(spec)
+        if not match or match.group(1).lower() not in AGGREGATIONS:
+            return f"Unknown aggregation {spec!r}; use one of {', '.join(a + '(column)' for a in AGGREGATIONS)} or count(*)."
+        parsed.append((spec.strip(), match.group(1).lower(), match.group(2)))
+
+    needed = None
+    if group_by or parsed:
+        needed = {f.column for f in filters} | set(group_by) | {column for _, _, column in parsed if column != "*"}
+        if sort_by and not any(sort_by == label for label, _, _ in parsed):
+            needed.add(sort_by)
+    try:
+        frame = _load(table_id, sorted(needed) if needed else None)
+    except ValueError as e:
+        return f"Unknown column: {e}"
+
+    total = len(frame)
+    for condition in filters:
+        if condition.column not in frame.columns:
+            return f"Unknown column {condition.column!r}. Columns: {', '.join(map(str, frame.columns))}"
+        try:
+            frame = frame[_mask(frame, condition)]
+        except ValueError:
+            return f"Cannot compare column {condition.column!r} with {condition.value!r}."
+
+    def aggregate(data, function: str, column: str):
+        if column == "*":
+            return data.size() if group_by else len(data)
+        return data[column].agg(function)
+
+    try:
+        if group_by:
+            grouped = frame.groupby(group_by, dropna=False)
+            result = pd.DataFrame({label: aggregate(grouped, fn, col) for label, fn, col in parsed or [("count(*)", "count", "*")]})
+            result = result.reset_index()
+        elif parsed:
+            result = pd.DataFrame([{label: aggregate(frame, fn, col) for label, fn, col in parsed}])
+        else:
+            result = frame
+        if sort_by:
+            result = result.sort_values(sort_by, ascending=not descending)
+    except KeyError as e:
+        return f"Unknown column {e}. Columns: {', '.join(map(str, frame.columns))}"
+    except TypeError as e:
+        return f"Cannot aggregate: {e}"
+
+    limit = max(1, min(limit, MAX_RESULT_ROWS))
+    shown = result.head(limit)
+    note = f"{len(frame):,} of {total:,} rows matched the filters"
+    if len(result) > limit:
+        note += f"; showing {limit} of {len(result):,} result rows"
+    return f"{note}\n{shown.to_csv(index=False, float_format='%.6g').strip()}"
+
+
+def find_table(store, table: str) -> str | None:
+    "Table id for a document name or id among the session's uploads; the latest table if none is given"
+    for document in reversed(list(store.documents.values())):
+        match = TABLE_HEADER_RE.match(document.text)
+        if match and (not table or table in (match.group(1), document.name)):
+            return match.group(1)
+    return None
+
+
+@function_tool("query_table")
+async def query_table(
+    ctx: RunContextWrapper,
+    table: str,
+    filters: list[TableFilter] | None = None,
+    group_by: list[str] | None = None,
+    aggregations: list[str] | None = None,
+    sort_by: str | None = None,
+    descending: bool = False,
+    limit: int = 20,
+) -> str:
+    """Filters and aggregates the full rows of a CSV or Excel file the user uploaded.
+
+    Args:
+        table: The table id from the table profile, or the file name.
+        filters: Row filters that all have to match.
+        group_by: Columns to group by before aggregating.
+        aggregations: e.g. "mean(score)", "count(*)", "max(age)"; functions: count, sum, mean, median, min, max, std, nunique.
+        sort_by: A column or aggregation label to sort the result by.
+        descending: Sort from largest to smallest.
+        limit: How many result rows to return, at most 50.
+    """
+    store = getattr(ctx.context, "documents", None)
+    table_id = find_table(store, table) if store is not None else None
+    if table_id is None or not _stored(table_id).exists():
+        return "No uploaded table matches. Ask the user to upload the CSV or Excel file again."
+    return await asyncio.to_thread(
+        run_query, table_id, filters or [], group_by or [], aggregations or [], sort_by, descending, limit
+    )
@@ -0,0 +1,253 @@
+import bisect
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+# Per-turn timings of the stages of a message (file extraction, guardrails,
+# triage, time to first token) and token counts per LLM call. Everything is
+# aggregated into histograms, served as Prometheus text or JSON.
+
+# show the timing breakdown under every answer, for debugging
+SHOW_TIMINGS = os.getenv("STUDYBUDDY_SHOW_TIMINGS", "0") == "1"
+# /metrics answers only loopback clients unless this is set
+METRICS_PUBLIC = os.getenv("STUDYBUDDY_METRICS_PUBLIC", "0") == "1"
+
+MS_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+
+
+class Histogram:
+    "Cumulative-bucket histogram in the Prometheus layout"
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float | None:
+        "Upper bound of the bucket holding the q-th observation; None if it is past the last bucket"
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Metrics:
+    "Histograms and counters keyed by name and labels, shared by every session in the process"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: dict[tuple[str, Labels], Histogram] = {}
+        self.counters: dict[tuple[str, Labels], float] = {}
+        self.gauges: dict[tuple[str, Labels], float] = {}
+        self.help: dict[str, str] = {
+            "studybuddy_stage_ms": "Duration of one stage of a turn in milliseconds",
+            "studybuddy_turn_ms": "Duration of a whole turn in milliseconds",
+            "studybuddy_call_tokens": "Tokens used by one LLM call",
+            "studybuddy_tokens_total": "Tokens used, by call and kind",
+            "studybuddy_llm_wait_ms": "Time an LLM request waited for the scheduler in milliseconds",
+            "studybuddy_llm_queue_depth": "LLM requests waiting for the scheduler, by lane",
+            "studybuddy_llm_in_flight": "LLM requests being sent or streamed",
+            "studybuddy_llm_requests_total": "LLM requests sent, by lane and status",
+            "studybuddy_llm_retries_total": "LLM requests retried, by reason",
+        }
+
+    def observe(self, name: str, value: float, buckets: tuple[float, ...] = MS_BUCKETS, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.gauges[key] = value
+
+    def to_prometheus(self) -> str:
+        lines = []
+        typed = set()
+        with self._lock:
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines += [f"# HELP {name} {self.help.get(name, name)}", f"# TYPE {name} histogram"]
+                cumulative = 0
+                for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {histogram.sum:.3f}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines += [f"# HELP {name} {self.help.get(name, name)}", f"# TYPE {name} counter"]
+                lines.append(f"{name}{_labels(labels)} {value:g}")
+            for (name, labels), value in sorted(self.gauges.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines += [f"# HELP {name} {self.help.get(name, name)}", f"# TYPE {name} gauge"]
+                lines.append(f"{name}{_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "histograms": [
+                    {
+                        "name": name,
+                        "labels": dict(labels),
+                        "count": h.count,
+                        "mean": round(h.sum / h.count, 3) if h.count else 0.0,
+                        "p50": h.quantile(0.5),
+                        "p95": h.quantile(0.95),
+                        "p99": h.quantile(0.99),
+                    }
+                    for (name, labels), h in sorted(self.histograms.items())
+                ],
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                "gauges": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.gauges.items())
+                ],
+            }
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+metrics = Metrics()
+
+
+@dataclass
+class TurnTrace:
+    "Stages and token counts of the turn being answered"
+    started: float = field(default_factory=time.perf_counter)
+    spans: list[tuple[str, float]] = field(default_factory=list)
+    tokens: dict[str, list[int]] = field(default_factory=dict)
+
+    def breakdown(self) -> str:
+        total = (time.perf_counter() - self.started) * 1000
+        lines = ["| stage | ms |", "|---|---:|"]
+        lines += [f"| {name} | {ms:,.0f} |" for name, ms in self.spans]
+        lines.append(f"| **turn** | **{total:,.0f}** |")
+        if self.tokens:
+            lines += ["", "| call | input tokens | output tokens |", "|---|---:|---:|"]
+            lines += [f"| {call} | {i:,} | {o:,} |" for call, (i, o) in self.tokens.items()]
+        return "\n".join(lines)
+
+
+# the turn this task is working on; tasks started during the turn inherit it
+_turn: ContextVar[TurnTrace | None] = ContextVar("studybuddy_turn", default=None)
+
+
+def start_turn() -> TurnTrace:
+    trace = TurnTrace()
+    _turn.set(trace)
+    return trace
+
+
+def finish_turn(trace: TurnTrace, outcome: str) -> None:
+    metrics.observe("studybuddy_turn_ms", (time.perf_counter() - trace.started) * 1000, outcome=outcome)
+
+
+def record_span(stage: str, ms: float, **labels: str) -> None:
+    metrics.observe("studybuddy_stage_ms", ms, stage=stage, **labels)
+    trace = _turn.get()
+    if trace is not None:
+        name = " / ".join((stage, *labels.values()))
+        trace.spans.append((name, ms))
+
+
+@contextmanager
+def span(stage: str, **labels: str):
+    "Times the block as one stage of the current turn"
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, (time.perf_counter() - started) * 1000, **labels)
+
+
+def timed(stage: str, **labels: str):
+    "Decorator that times every call of an async function as a stage"
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(stage, **labels):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_usage(call: str, usage) -> None:
+    "Token counts of one agent run, from result.context_wrapper.usage"
+    if usage is None or not usage.requests:
+        return
+    metrics.inc("studybuddy_tokens_total", usage.input_tokens, call=call, kind="input")
+    metrics.inc("studybuddy_tokens_total", usage.output_tokens, call=call, kind="output")
+    metrics.observe("studybuddy_call_tokens", usage.total_tokens, TOKEN_BUCKETS, call=call)
+    trace = _turn.get()
+    if trace is not None:
+        counts = trace.tokens.setdefault(call, [0, 0])
+        counts[0] += usage.input_tokens
+        counts[1] += usage.output_tokens
+
+
+def mount_metrics(app) -> None:
+    "Adds GET /metrics (Prometheus text) and /metrics.json to the Chainlit FastAPI app"
+    from fastapi import Request
+    from fastapi.responses import JSONResponse, PlainTextResponse
+
+    def allowed(request: Request) -> bool:
+        return METRICS_PUBLIC or (request.client is not None and request.client.host in ("127.0.0.1", "::1", "localhost"))
+
+    async def prometheus(request: Request):
+        if not allowed(request):
+            return PlainTextResponse("forbidden", status_code=403)
+        return PlainTextResponse(metrics.to_prometheus(), media_type="text/plain; version=0.0.4")
+
+    async def snapshot(request: Request):
+        if not allowed(request):
+            return JSONResponse({"detail": "forbidden"}, status_code=403)
+        return JSONResponse(metrics.snapshot())
+
+    if any(getattr(route, "path", None) == "/metrics" for route in app.router.routes):
+        return
+    app.add_api_route("/metrics", prometheus, methods=["GET"])
+    app.add_api_route("/metrics.json", snapshot, methods=["GET"])
+    # Chainlit serves its frontend from a catch-all route; ours have to come before it
+    routes = app.router.routes
+    routes[:] = routes[-2:] + routes[:-2]
@@ -0,0 +1,103 @@
+import asyncio
+
+from session_state import DocumentRef, SessionState, SQLiteStateBackend, save_turn
+
+
+def turn(name: str) -> list[dict]:
+    return [{"role": "user", "content": f"question {name}"}, {"role": "assistant", "content": f"answer {name}"}]
+
+
+async def play_turn(backend, session_id: str, name: str, document: DocumentRef | None = None) -> SessionState | None:
+    "One worker's turn: load, append a question and an answer, save"
+    state = await backend.load(session_id)
+    items = turn(name)
+    state.history = {**state.history, "items": [*state.history["items"], *items]}
+    documents = [document] if document else []
+    state.documents += documents
+    # both workers have loaded before either saves
+    await asyncio.sleep(0.05)
+    return await save_turn(backend, session_id, state, items, documents)
+
+
+def test_concurrent_saves_keep_both_turns(tmp_path):
+    backend = SQLiteStateBackend(str(tmp_path / "state.db"))
+
+    async def run():
+        await backend.save("s", SessionState(history={"items": turn("first"), "summary": "earlier", "summarized_upto": 0}))
+        return await asyncio.gather(
+            play_turn(backend, "s", "a", DocumentRef(digest="d1", name="notes.pdf")),
+            play_turn(backend, "s", "b"),
+        )
+
+    results = asyncio.run(run())
+    assert all(result is not None for result in results)
+    stored = asyncio.run(backend.load("s"))
+    items = [item["content"] for item in stored.history["items"]]
+    assert items[:2] == ["question first", "answer first"]
+    assert sorted(items[2:]) == sorted(["question a", "answer a", "question b", "answer b"])
+    # each turn's question and answer stay next to each other
+    for name in ("a", "b"):
+        assert items.index(f"answer {name}") == items.index(f"question {name}") + 1
+    assert stored.history["summary"] == "earlier"
+    assert [ref.digest for ref in stored.documents] == ["d1"]
+    assert stored.version == 3
+
+
+def test_save_gives_up_after_the_attempts(tmp_path):
+    backend = SQLiteStateBackend(str(tmp_path / "state.db"))
+
+    class AlwaysConflicting(SQLiteStateBackend):
+        async def save(self, session_id, state):
+            return False
+
+    async def run():
+        await backend.save("s", SessionState(history={"items": turn("first")}))
+        conflicting = AlwaysConflicting(backend.path)
+        state = await conflicting.load("s")
+        return await save_turn(conflicting, "s", state, turn("lost"), [], attempts=3)
+
+    assert asyncio.run(run()) is None
+    assert len(asyncio.run(backend.load("s")).history["items"]) == 2
+
+
+class FakeUserSession(dict):
+    "Stands in for one worker's chainlit user_session"
+
+    def set(self, key, value):
+        self[key] = value
+
+
+async def answer(main, text: str) -> None:
+    "One turn through the app's own load and save path, without the model"
+    history, context = await main.load_session_state()
+    history.append({"role": "user", "content": f"question {text}"})
+    history.append({"role": "assistant", "content": f"answer {text}"})
+    await main.save_session_state(history, context)
+
+
+def test_conflicting_worker_does_not_lose_a_later_turn(tmp_path, monkeypatch):
+    import chainlit as cl
+    import main
+
+    backend = SQLiteStateBackend(str(tmp_path / "state.db"))
+    monkeypatch.setattr(main, "get_state_backend", lambda: backend)
+    monkeypatch.setattr(main, "conversation_id", lambda: "s")
+    first, second = FakeUserSession(), FakeUserSession()
+
+    async def run():
+        monkeypatch.setattr(cl, "user_session", first)
+        await answer(main, "1")
+        # the second turn on this worker is answered while another worker saves its own
+        history, context = await main.load_session_state()
+        history.append({"role": "user", "content": "question 2"})
+        history.append({"role": "assistant", "content": "answer 2"})
+        monkeypatch.setattr(cl, "user_session", second)
+        await answer(main, "other")
+        monkeypatch.setattr(cl, "user_session", first)
+        await main.save_session_state(history, context)
+        return await backend.load("s")
+
+    stored = asyncio.run(run())
+    items = [item["content"] for item in stored.history["items"]]
+    assert items == ["question 1", "answer 1", "question other", "answer other", "question 2", "answer 2"]
+    assert stored.version == 3
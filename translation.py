@@ -0,0 +1,127 @@
+import asyncio
+import os
+import re
+from collections.abc import AsyncIterator
+
+from agents import Agent, Runner
+from my_secrets import Secrets
+from disk_cache import TextCache, text_key
+from document_store import split_chunks
+from telemetry import record_usage
+
+# Translation of long documents: the text is cut into segments on paragraph
+# and page boundaries, segments are translated concurrently, and results are
+# streamed back in the original order. Failed requests are retried by the
+# LLM scheduler in front of the client.
+
+secrets = Secrets()
+
+SEGMENT_CHARS = int(os.getenv("STUDYBUDDY_TRANSLATION_SEGMENT_CHARS", "4000"))
+CONCURRENCY = int(os.getenv("STUDYBUDDY_TRANSLATION_CONCURRENCY", "4"))
+# documents above this size are translated segment by segment
+PIPELINE_MIN_CHARS = int(os.getenv("STUDYBUDDY_TRANSLATION_PIPELINE_MIN_CHARS", "6000"))
+
+TRANSLATE_RE = re.compile(r"\btranslat\w*\b", re.IGNORECASE)
+TARGET_LANGUAGE_RE = re.compile(r"\b(?:into|to|in)\s+([A-Za-z][A-Za-z-]+)", re.IGNORECASE)
+LANGUAGES = frozenset(
+    """afrikaans albanian amharic arabic armenian azerbaijani basque belarusian bengali bosnian bulgarian burmese
+    catalan chinese croatian czech danish dutch english esperanto estonian filipino finnish french galician
+    georgian german greek gujarati hausa hebrew hindi hungarian icelandic igbo indonesian irish italian japanese
+    kannada kazakh khmer korean kurdish kyrgyz lao latin latvian lithuanian macedonian malay malayalam maltese
+    mandarin marathi mongolian nepali norwegian pashto persian farsi polish portuguese punjabi romanian russian
+    serbian sindhi sinhala slovak slovenian somali spanish swahili swedish tagalog tajik tamil telugu thai
+    turkish ukrainian urdu uzbek vietnamese welsh yoruba zulu cantonese""".split()
+)
+# "page 3", "the first paragraph": the request is about a passage, not the whole document
+PART_REFERENCE_RE = re.compile(
+    r"\b(?:(?:pages?|sections?|paragraphs?|chapters?|slides?|lines?|sentences?)\s+\d+"
+    r"|(?:first|last|second|third|next|previous|opening|final)\s+(?:\w+\s+)?"
+    r"(?:pages?|sections?|paragraphs?|chapters?|slides?|lines?|sentences?))\b",
+    re.IGNORECASE,
+)
+_PARAGRAPH_RE = re.compile(r"\n\s*\n|\f")
+
+segment_translator_agent = Agent(
+    name="Segment_Translator",
+    instructions="""
+                Translate one segment of a longer document into the requested language.
+                - return only the translated text in plain text, no notes or explanations
+                - keep the paragraph breaks, lists and numbering of the segment
+                - keep code, formulas, numbers and proper names unchanged
+                - the segment may start or end mid-topic, do not add introductions or conclusions
+                """,
+    model=secrets.gemini_api_model,
+)
+
+_cache = TextCache("translations")
+
+
+def target_language(request: str) -> str | None:
+    "The language named in a request like 'translate this into urdu'; only known language names count"
+    translate = TRANSLATE_RE.search(request)
+    if not translate:
+        return None
+    for match in TARGET_LANGUAGE_RE.finditer(request, translate.end()):
+        if match.group(1).lower() in LANGUAGES:
+            return match.group(1).capitalize()
+    return None
+
+
+def translates_part(request: str) -> bool:
+    "Whether the request asks for a passage of a document, which the agents translate instead of the pipeline"
+    return bool(PART_REFERENCE_RE.search(request))
+
+
+def segment_text(text: str, max_chars: int = SEGMENT_CHARS) -> list[str]:
+    "Packs whole paragraphs into segments of at most max_chars; oversized paragraphs are split on lines"
+    segments: list[str] = []
+    current: list[str] = []
+    size = 0
+    for paragraph in _PARAGRAPH_RE.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        pieces = split_chunks(paragraph, max_chars, 0) if len(paragraph) > max_chars else [paragraph]
+        for piece in pieces:
+            if current and size + len(piece) > max_chars:
+                segments.append("\n\n".join(current))
+                current, size = [], 0
+            current.append(piece)
+            size += len(piece) + 2
+    if current:
+        segments.append("\n\n".join(current))
+    return segments
+
+
+async def _translate_segment(segment: str, language: str, semaphore: asyncio.Semaphore) -> str:
+    key = text_key(segment_translator_agent.name, str(segment_translator_agent.instructions), language, segment)
+    cached = await asyncio.to_thread(_cache.get, key)
+    if cached is not None:
+        return cached
+
+    async with semaphore:
+        result = await Runner.run(segment_translator_agent, f"Target language: {language}\n\n{segment}")
+    record_usage(segment_translator_agent.name, result.context_wrapper.usage)
+    translated = str(result.final_output)
+    await asyncio.to_thread(_cache.set, key, translated)
+    return translated
+
+
+async def translate_document(text: str, language: str, concurrency: int = CONCURRENCY) -> AsyncIterator[str]:
+    "Streams the translation in document order, each segment as soon as all before it are done"
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = [asyncio.ensure_future(_translate_segment(s, language, semaphore)) for s in segment_text(text)]
+    try:
+        for number, task in enumerate(tasks):
+            try:
+                translated = await task
+            except Exception as e:
+                translated = f"[Part {number + 1} could not be translated: {e}]"
+            yield translated if number == 0 else f"\n\n{translated}"
+    finally:
+        # closed early (the turn was cut off or abandoned): stop the segments still being translated
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        # so closing returns once their LLM requests have let go of the scheduler
+        await asyncio.gather(*pending, return_exceptions=True)